@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pytest
+import trading.binary_ledger as binary_ledger
+import trading.process as proc
+
+
+def _records(n, seed, n_stocks=20, days=300):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(n, dtype=proc.TRADE_DTYPE)
+    records['type'] = np.where(rng.random(n) < 0.5, b'buy', b'sell')
+    records['date'] = np.sort(rng.integers(0, days, n))
+    records['stock'] = rng.integers(0, n_stocks, n)
+    records['shares'] = rng.integers(1, 100, n)
+    records['price'] = rng.uniform(10, 100, n)
+    records['amount'] = records['price'] * records['shares']
+    return records
+
+
+def _check_queries(ledger_file, records):
+    for stock in (0, 7, 19, 25):
+        expected = records[records['stock'] == stock]
+        assert binary_ledger.query_stock(ledger_file, stock).tobytes() == expected.tobytes()
+    for first_day, last_day in ((0, 0), (50, 120), (299, 400)):
+        expected = records[(records['date'] >= first_day) & (records['date'] <= last_day)]
+        assert binary_ledger.query_dates(ledger_file, first_day, last_day).tobytes() == expected.tobytes()
+
+
+def test_queries_after_appends(tmp_path):
+    ledger_file = str(tmp_path / 'ledger.bin')
+    written = []
+    for seed in range(12):
+        records = _records(50 + 30 * seed, seed)
+        binary_ledger.append(ledger_file, records)
+        written.append(records)
+        _check_queries(ledger_file, np.concatenate(written))
+    # the appended runs are merged, so there are only a few of them
+    assert all(len(runs) <= 4 for runs in binary_ledger.update_index(ledger_file))
+
+
+def test_index_rebuilt_for_a_new_ledger(tmp_path):
+    ledger_file = str(tmp_path / 'ledger.bin')
+    binary_ledger.append(ledger_file, _records(500, 1))
+    _check_queries(ledger_file, _records(500, 1))
+    # a shorter ledger with the same name, then one with the same number of records
+    os.remove(ledger_file)
+    binary_ledger.append(ledger_file, _records(200, 2))
+    _check_queries(ledger_file, _records(200, 2))
+    os.remove(ledger_file)
+    binary_ledger.append(ledger_file, _records(200, 3))
+    _check_queries(ledger_file, _records(200, 3))
+    # a longer one
+    os.remove(ledger_file)
+    binary_ledger.append(ledger_file, _records(900, 4))
+    _check_queries(ledger_file, _records(900, 4))
+
+
+def test_damaged_index_is_rebuilt(tmp_path):
+    ledger_file = str(tmp_path / 'ledger.bin')
+    records = _records(300, 5)
+    binary_ledger.append(ledger_file, records)
+    _check_queries(ledger_file, records)
+    for index_file in binary_ledger.index_files(ledger_file):
+        with open(index_file, 'r+b') as file:
+            file.truncate(os.path.getsize(index_file) - 100)
+    _check_queries(ledger_file, records)
+
+
+def test_record_size_is_checked(tmp_path):
+    ledger_file = str(tmp_path / 'ledger.bin')
+    with open(ledger_file, 'wb') as file:
+        file.write(binary_ledger.MAGIC + np.int64(40).tobytes() + bytes(400))
+    with pytest.raises(ValueError):
+        binary_ledger.read(ledger_file)
+    with pytest.raises(ValueError):
+        binary_ledger.append(ledger_file, _records(10, 6))
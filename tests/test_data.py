@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import trading.data as data
+
+
+def _nearest_brute_force(index, initial_price, volatility):
+    return np.array([np.argmin(((index.volatilities - v) / index._scales[0]) ** 2
+                               + ((index.initial_prices - p) / index._scales[1]) ** 2)
+                     for p, v in zip(initial_price, volatility)])
+
+
+def test_nearest_joint_matches_every_stock():
+    rng = np.random.default_rng(4)
+    # rounded like the price file header, so that there are many ties
+    for step in (0.2, 1.0, 1e-9):
+        volatilities = np.round(rng.uniform(0.2, 5, 300) / step) * step
+        initial_prices = np.round(rng.uniform(10, 600, 300) / (50 * step)) * 50 * step
+        index = data.HeaderIndex(np.array([volatilities, initial_prices]))
+        volatility = np.concatenate((np.round(rng.uniform(-1, 7, 200) / step) * step, volatilities[:50]))
+        initial_price = np.concatenate((np.round(rng.uniform(-100, 700, 200) / (25 * step)) * 25 * step, initial_prices[:50]))
+        np.testing.assert_array_equal(index.nearest(initial_price=initial_price, volatility=volatility),
+                                      _nearest_brute_force(index, initial_price, volatility))
+
+
+def _generate_loop(days, initial_price, volatility, n_paths, seed, chance=0.01):
+    # the original daily loop of generate_stock_price(), for every stock and path,
+    # fed with the same random draws as generate_stock_paths()
+    shape = (days, len(initial_price), n_paths)
+    rng = np.random.default_rng(seed)
+    increments = rng.normal(size=shape)
+    news_today = rng.random(shape) < chance
+    news_today[0] = False
+    news_days, news_stocks, news_paths = np.nonzero(news_today)
+    drifts = rng.normal(0, 2, len(news_days)) * np.asarray(volatility)[news_stocks]
+    durations = rng.integers(3, 14, len(news_days))
+    news = {(day, stock, path): (drift, duration)
+            for day, stock, path, drift, duration in zip(news_days, news_stocks, news_paths, drifts, durations)}
+    stock_prices = np.zeros(shape)
+    for stock in range(shape[1]):
+        for path in range(n_paths):
+            stock_prices[0, stock, path] = initial_price[stock]
+            total_drift = np.zeros(days + 14)
+            for day in range(1, days):
+                new_price_today = stock_prices[day - 1, stock, path] + increments[day, stock, path]
+                if (day, stock, path) in news:
+                    drift, duration = news[day, stock, path]
+                    total_drift[day:day + duration] = drift
+                new_price_today += total_drift[day]
+                stock_prices[day, stock, path] = np.nan if new_price_today <= 0 else new_price_today
+    return stock_prices
+
+
+def test_generate_stock_paths_matches_the_daily_loop():
+    initial_price = [20, 80, 150, 40]
+    volatility = [1, 2.5, 4, 3]
+    paths = data.generate_stock_paths(1000, initial_price, volatility, n_paths=3, seed=11)
+    expected = _generate_loop(1000, initial_price, volatility, 3, 11)
+    # some companies fail, and then stay failed
+    assert np.isnan(expected).any() and not np.isnan(expected).all()
+    np.testing.assert_array_equal(np.isnan(paths), np.isnan(expected))
+    # the vectorized version adds the same terms up with a cumulative sum, in a different order
+    np.testing.assert_allclose(paths, expected, rtol=1e-9, atol=1e-9)
+
+
+def _get_data_loop(data_file, initial_price=None, volatility=None):
+    # the original get_data('read'): a scan of every column for each value, then loadtxt of the columns found
+    temp_array = np.loadtxt(data_file)
+    row, values = (1, initial_price) if initial_price else (0, volatility)
+    if not values:
+        return np.loadtxt(data_file, skiprows=1)
+    indices = []
+    for value in values:
+        abs_diff = 500
+        index = 0
+        for j in range(temp_array.shape[1]):
+            if abs(temp_array[row, j] - value) < abs_diff:
+                abs_diff = abs(temp_array[row, j] - value)
+                index = j
+        indices.append(index)
+    return np.loadtxt(data_file, usecols=indices, skiprows=1)
+
+
+def test_get_data_matches_the_original_reads(tmp_path):
+    text_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+    npy_file = data.convert_to_npy(text_file, str(tmp_path / 'prices.npy'))
+    header = np.loadtxt(text_file)[:2]
+    requests = [{}, {'initial_price': [210, 58]}, {'initial_price': [1000]}, {'initial_price': list(header[1, ::-3])},
+                {'volatility': [5.1]}, {'volatility': [0, 2.2, 3.3, 9]}, {'volatility': list(header[0])}]
+    for request in requests:
+        expected = _get_data_loop(text_file, **request)
+        for data_file in (text_file, npy_file):
+            prices = data.get_data(data_file=data_file, **request)
+            assert prices.shape == expected.shape
+            np.testing.assert_array_equal(prices, expected)
@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import pytest
+import trading.indicators as indicators
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    # 200 days of the sample data, with 2 companies failing in the middle (NaN prices)
+    return np.loadtxt(DATA_FILE)[1:][350:550]
+
+
+def _rsi_loop(stock_price, n):
+    # the original daily loop, one window at a time
+    rsi = np.zeros(len(stock_price) - n)
+    for i in range(len(rsi)):
+        diffs = np.diff(stock_price[i:n + i])
+        positives = [d for d in diffs if d > 0]
+        negatives = [d for d in diffs if d < 0]
+        if not len(positives):
+            positives = np.nan
+        if not len(negatives):
+            negatives = np.nan
+        rs = float(np.average(positives)) / float(abs(np.average(negatives)))
+        if np.isnan(rs):
+            rs = 0
+        rsi[i] = 1 - 1 / (1 + rs)
+    return rsi
+
+
+@pytest.mark.parametrize('n', range(2, 51))
+def test_rsi_matches_the_daily_loop(stock_prices, n):
+    # bit for bit: many RSI values are right on the thresholds with prices of 2 decimals
+    rsi = indicators.oscillator(stock_prices, n, osc_type='RSI')
+    for stock in range(stock_prices.shape[1]):
+        np.testing.assert_array_equal(rsi[:, stock], _rsi_loop(stock_prices[:, stock], n))
+        np.testing.assert_array_equal(indicators.oscillator(stock_prices[:, stock], n, osc_type='RSI'), rsi[:, stock])
+
+
+def test_float32_moving_average_is_summed_in_float64(stock_prices):
+    prices = np.tile(stock_prices[:, :4], (20, 1))
+    expected = indicators.moving_average(prices.astype(np.float32).astype(float), 200)
+    ma = indicators.moving_average(prices, 200, dtype=np.float32)
+    assert ma.dtype == np.float32
+    np.testing.assert_array_equal(ma, expected.astype(np.float32))
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pytest
+import trading.performance as performance
+import trading.process as proc
+import trading.strategy as strategy
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+def _ledger(tmp_path, lines):
+    path = tmp_path / 'ledger.txt'
+    path.write_text(''.join('\n' + line for line in lines))
+    return str(path)
+
+
+def test_read_ledger_prints_totals_like_before(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(performance, 'headless', True)
+    # stock 0 is never sold, stock 1 is sold without a buy after its initial one
+    ledger = _ledger(tmp_path, ['buy,0,0,10,100.00,-1020.00', 'buy,0,1,5,200.00,-1020.00',
+                                'buy,3,0,2,110.00,-240.00', 'sell,4,1,5,210.00,1030.00', 'sell,6,1,0,220.00,20.00'])
+    performance.read_ledger(ledger)
+    output = capsys.readouterr().out
+    assert "Amount earned from trading the stock number  0  is  0 by spending  1260.0" in output
+    assert "Amount earned from trading the stock number  1  is  1050.0 by spending  1020.0" in output
+    assert "The portfolio before the last day for stock 0 had 10 stocks" in output
+    assert "The portfolio before the last day for stock 1 had 0 stocks" in output
+    metrics = performance.read_ledger(ledger, quiet=True)
+    assert metrics['total_earned'] == 1050.0
+    np.testing.assert_array_equal(metrics['holdings'], [10, 5, 12, 0, 0])
+    assert performance.load_ledger(proc.Ledger()).dtype == proc.Ledger.dtype
+
+
+def _mark_to_market_loop(stock_prices, records, initial_cash):
+    # day by day: apply the transactions of the day to the portfolio and the cash, then value the shares held
+    days, n_stocks = stock_prices.shape
+    portfolio = [0] * n_stocks
+    cash = initial_cash
+    curve = {key: [] for key in ('cash', 'market_value', 'equity', 'traded')}
+    positions = []
+    k = 0
+    for day in range(days):
+        traded = 0.0
+        while k < len(records) and records['date'][k] == day:
+            transaction_type, stock, shares, price, amount = (records[field][k] for field in ('type', 'stock', 'shares', 'price', 'amount'))
+            portfolio[stock] += -shares if transaction_type == b'sell' else shares
+            if not np.isnan(amount):
+                cash += amount
+                traded += price * shares
+            k += 1
+        market_value = 0.0
+        for stock in range(n_stocks):
+            if not np.isnan(stock_prices[day, stock]):
+                market_value += portfolio[stock] * stock_prices[day, stock]
+        positions.append(list(portfolio))
+        for key, value in (('cash', cash), ('market_value', market_value), ('equity', cash + market_value), ('traded', traded)):
+            curve[key].append(value)
+    return np.array(positions), {key: np.array(values) for key, values in curve.items()}
+
+
+def _risk_metrics_loop(curve, trading_days=252):
+    equity = curve['equity']
+    running_max = -np.inf
+    drawdown = []
+    max_drawdown_fraction = 0.0
+    for value in equity:
+        running_max = max(running_max, value)
+        drawdown.append(value - running_max)
+        if running_max > 0:
+            max_drawdown_fraction = min(max_drawdown_fraction, (value - running_max) / running_max)
+    returns = [(equity[day] - equity[day - 1]) / equity[day - 1] for day in range(1, len(equity))]
+    mean = sum(returns) / len(returns)
+    volatility = np.sqrt(sum((r - mean) ** 2 for r in returns) / len(returns))
+    exposure = [curve['market_value'][day] / equity[day] for day in range(len(equity))]
+    return {
+        'drawdown': np.array(drawdown),
+        'max_drawdown': min(drawdown),
+        'max_drawdown_fraction': max_drawdown_fraction,
+        'sharpe': mean / volatility * np.sqrt(trading_days),
+        'turnover': sum(curve['traded'][day] / equity[day] for day in range(len(equity))) / len(equity),
+        'exposure': np.array(exposure),
+        'average_exposure': sum(exposure) / len(exposure),
+    }
+
+
+@pytest.mark.parametrize('strategy_name, kwargs, initial_cash', [
+    ('momentum', {'osc_type': 'RSI', 'period': 14}, None),
+    ('random', {'period': 5, 'seed': 3}, 200000.0),
+    ('crossing_averages', {'sma_period': 50, 'fma_period': 20}, None),
+])
+def test_equity_curve_matches_a_daily_mark_to_market(strategy_name, kwargs, initial_cash):
+    # the sample data, with 3 companies failing (NaN prices)
+    stock_prices = np.loadtxt(DATA_FILE)[1:]
+    ledger = proc.Ledger()
+    getattr(strategy, strategy_name)(stock_prices, ledger=ledger, **kwargs)
+    curve = performance.equity_curve(stock_prices, ledger, initial_cash)
+    records = np.sort(ledger.records, order='date', kind='stable')
+    if initial_cash is None:
+        initial_cash = -sum(amount for transaction_type, date, amount in zip(records['type'], records['date'], records['amount'])
+                            if transaction_type == b'buy' and date == 0)
+    positions, expected = _mark_to_market_loop(stock_prices, records, initial_cash)
+    np.testing.assert_array_equal(curve['positions'], positions)
+    for key, value in expected.items():
+        np.testing.assert_allclose(curve[key], value, rtol=1e-9, atol=1e-6)
+    metrics = performance.risk_metrics(curve)
+    for key, value in _risk_metrics_loop(curve).items():
+        np.testing.assert_allclose(metrics[key], value, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,33 @@
+import numpy as np
+import trading.process as proc
+
+
+def test_cash_follows_the_ledger_amounts():
+    stock_prices = np.array([[10.0, 5.0, 8.0], [12.0, 4.0, np.nan]])
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([100, 4, 100], stock_prices, 4, ledger, cash=1000)
+    # stock 1 has nothing left after fees: no shares, then a sell of 0 shares
+    proc.sell(1, 0, stock_prices, 4, portfolio, ledger)
+    proc.sell(1, 1, stock_prices, 4, portfolio, ledger)
+    proc.sell(1, 2, stock_prices, 4, portfolio, ledger)
+    records = ledger.records
+    assert list(records['shares']) == [9, 0, 12, 9, 0, 12]
+    assert records['amount'][4] == 4
+    # the NaN amount of the failed company leaves the cash unchanged
+    assert portfolio.cash == 1000 + np.nansum(records['amount'])
+    assert np.isnan(records['amount'][5])
+    assert list(portfolio) == [0, 0, 0]
+
+
+def test_buy_at_a_nan_price_does_nothing():
+    stock_prices = np.array([[10.0, np.nan], [np.nan, 4.0]])
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([100, 100], stock_prices, 4, ledger, cash=1000)
+    proc.buy(1, 0, 100, stock_prices, 4, portfolio, ledger)
+    proc.buy(1, 1, 100, stock_prices, 4, portfolio, ledger)
+    # only the buys with a price are in the ledger, and paid from the cash
+    records = ledger.records
+    assert list(records['date']) == [0, 1]
+    assert list(records['stock']) == [0, 1]
+    assert list(portfolio) == [9, 24]
+    assert portfolio.cash == 1000 + np.sum(records['amount'])
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import trading.shared as shared
+
+
+def _column_sums(prices):
+    return prices.sum(axis=0)
+
+
+def test_share_memmap_view_maps_its_own_bytes(tmp_path):
+    prices = np.asfortranarray(np.arange(40 * 10, dtype=float).reshape(40, 10))
+    np.save(tmp_path / 'prices.npy', prices)
+    mapped = np.load(tmp_path / 'prices.npy', mmap_mode='r')
+    with shared.share(mapped[:, 5:8]) as columns:
+        assert columns.descriptor[0] == 'memmap'
+        np.testing.assert_array_equal(shared.attach(columns.descriptor), prices[:, 5:8])
+    rows = np.load(tmp_path / 'prices.npy', mmap_mode='r').T
+    with shared.share(rows[3:6]) as view:
+        np.testing.assert_array_equal(shared.attach(view.descriptor), prices.T[3:6])
+
+
+def test_share_non_contiguous_view_is_copied():
+    prices = np.arange(60, dtype=float).reshape(6, 10)
+    with shared.share(prices[:, ::2]) as view:
+        assert view.descriptor[0] == 'shm'
+        np.testing.assert_array_equal(shared.attach(view.descriptor), prices[:, ::2])
+
+
+def test_workers_attach_to_shared_memory():
+    prices = np.random.default_rng(0).random((30, 4))
+    with shared.share(prices) as view:
+        with multiprocessing.Pool(2) as pool:
+            sums = pool.map(_column_sums, [view, view])
+    for total in sums:
+        np.testing.assert_allclose(total, prices.sum(axis=0))
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='needs POSIX shared memory in /dev/shm')
+def test_shared_memory_is_removed_without_tracker_warnings(tmp_path):
+    # in a fresh interpreter, so that the resource tracker exits (and reports) with it
+    script = tmp_path / 'share.py'
+    script.write_text(
+        "import multiprocessing, os, numpy as np\n"
+        "import trading.shared as shared\n"
+        "def column_sums(prices):\n"
+        "    return prices.sum(axis=0)\n"
+        "if __name__ == '__main__':\n"
+        "    view = shared.share(np.ones((30, 4)))\n"
+        "    name = view.descriptor[1]\n"
+        "    with multiprocessing.Pool(2) as pool:\n"
+        "        assert pool.map(column_sums, [view] * 4)[0].tolist() == [30] * 4\n"
+        "    shared.as_array(view)\n"
+        "    view.close()\n"
+        "    print(os.path.exists('/dev/shm/' + name))\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120,
+                            env=dict(os.environ, PYTHONPATH=root))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'False'
+    assert result.stderr == ''
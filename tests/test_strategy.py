@@ -0,0 +1,214 @@
+import os
+import numpy as np
+import pytest
+import trading.backtest as backtest
+import trading.chunked as chunked
+import trading.data as data
+import trading.indicators as stock_indicators
+import trading.live as live
+import trading.process as proc
+import trading.strategy as strategy
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture
+def stock_prices():
+    return data.generate_stock_paths(600, [120, 80, 200, 50], [1.5, 2, 1, 3], seed=7)[:, :, 0]
+
+
+def _run_ledger(function, stock_prices, **kwargs):
+    ledger = proc.Ledger()
+    function(stock_prices, ledger=ledger, **kwargs)
+    return ledger.records.copy()
+
+
+def _assert_same_ledger(actual, expected):
+    assert actual.dtype == expected.dtype
+    for field in expected.dtype.names:
+        np.testing.assert_array_equal(actual[field], expected[field])
+
+
+def test_crossing_averages_with_weights(stock_prices):
+    weights = {'sma_period': 30, 'fma_period': 10,
+               'sma_weights': np.linspace(1, 2, 30), 'fma_weights': np.arange(1, 11)}
+    records = _run_ledger(strategy.crossing_averages, stock_prices, **weights)
+    unweighted = _run_ledger(strategy.crossing_averages, stock_prices, sma_period=30, fma_period=10)
+    assert len(records) > 2 * stock_prices.shape[1]
+    assert len(records) != len(unweighted) or not np.array_equal(records['date'], unweighted['date'])
+    _assert_same_ledger(_run_ledger(backtest.crossing_averages, stock_prices, **weights), records)
+    _assert_same_ledger(_run_ledger(chunked.crossing_averages, stock_prices, block_columns=3, **weights), records)
+
+
+@pytest.mark.parametrize('function', [strategy.crossing_averages, backtest.crossing_averages, chunked.crossing_averages])
+def test_crossing_averages_wrong_number_of_weights(function, stock_prices, capsys):
+    records = _run_ledger(function, stock_prices, sma_period=30, fma_period=10, sma_weights=[1] * 10)
+    assert "Please specify 30 weights" in capsys.readouterr().out
+    assert len(records) == 0
+
+
+@pytest.mark.parametrize('function', [strategy.crossing_averages, backtest.crossing_averages, chunked.crossing_averages])
+def test_crossing_averages_deprecated_weights(function, stock_prices, capsys):
+    # weights is still the 4th parameter, followed by amount, fees and ledger
+    sma_weights = np.linspace(1, 2, 30)
+    fma_weights = np.arange(1, 11)
+    expected = _run_ledger(function, stock_prices, sma_period=30, fma_period=10, amount=3000, fees=10,
+                           sma_weights=sma_weights, fma_weights=fma_weights)
+    ledger = proc.Ledger()
+    with pytest.warns(DeprecationWarning):
+        function(stock_prices, 30, 10, fma_weights, 3000, 10, ledger, sma_weights=sma_weights)
+    _assert_same_ledger(ledger.records, expected)
+    # without sma_weights, the same weights are used for the SMA too, and 10 weights don't fit its period
+    with pytest.warns(DeprecationWarning):
+        records = _run_ledger(function, stock_prices, sma_period=30, fma_period=10, weights=fma_weights)
+    assert "Please specify 30 weights" in capsys.readouterr().out
+    assert len(records) == 0
+
+
+def test_live_crossing_averages_wrong_number_of_weights():
+    with pytest.raises(ValueError):
+        live.CrossingAveragesTrader(4, sma_period=30, fma_period=10, fma_weights=[1] * 30)
+
+
+def test_chunked_ledger_file(stock_prices, tmp_path):
+    # blocks written one by one to the file, final sells copied at the end, as if run at once
+    strategy.crossing_averages(stock_prices, sma_period=30, fma_period=10, ledger=str(tmp_path / 'whole.txt'))
+    chunked.crossing_averages(stock_prices, sma_period=30, fma_period=10, ledger=str(tmp_path / 'blocks.txt'), block_columns=3)
+    assert (tmp_path / 'blocks.txt').read_text() == (tmp_path / 'whole.txt').read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['blocks.txt', 'whole.txt']
+
+
+@pytest.mark.parametrize('periods', [(30, 10), (10, 30), (7, 7)])
+def test_crossing_averages_with_failed_stocks(stock_prices, periods):
+    # NaN averages neither buy nor sell, after the company has failed or around a missing price
+    stock_prices = stock_prices.copy()
+    stock_prices[300:, 1] = np.nan
+    stock_prices[::45, 2] = np.nan
+    records = _run_ledger(strategy.crossing_averages, stock_prices, sma_period=periods[0], fma_period=periods[1])
+    _assert_same_ledger(_run_ledger(backtest.crossing_averages, stock_prices, sma_period=periods[0], fma_period=periods[1]), records)
+
+
+@pytest.mark.parametrize('function', [strategy.crossing_averages, backtest.crossing_averages])
+def test_indicator_cache_is_opt_in(function, stock_prices):
+    records = _run_ledger(function, stock_prices, sma_period=30, fma_period=10)
+    cache = stock_indicators.IndicatorCache()
+    for _ in range(2):
+        _assert_same_ledger(_run_ledger(function, stock_prices, sma_period=30, fma_period=10, cache=cache), records)
+    assert cache.stats()['misses'] == 2 and cache.stats()['hits'] == 2
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    assert not hasattr(stock_indicators, 'cache')
+
+
+def _rsi_loop(stock_price, n):
+    # the original daily loop of oscillator(), one window at a time
+    rsi = np.zeros(len(stock_price) - n)
+    for i in range(len(rsi)):
+        diffs = np.diff(stock_price[i:n + i])
+        positives = [d for d in diffs if d > 0] or np.nan
+        negatives = [d for d in diffs if d < 0] or np.nan
+        rs = float(np.average(positives)) / float(abs(np.average(negatives)))
+        rsi[i] = 1 - 1 / (1 + (0 if np.isnan(rs) else rs))
+    return rsi
+
+
+def _momentum_loop_ledger(stock_prices, period, cool_down_period, low_threshold=0.25, high_threshold=0.75, amount=5000, fees=20):
+    # the original momentum(), day by day for every stock, with the RSI of the daily loop
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([amount] * stock_prices.shape[1], stock_prices, fees, ledger)
+    for j in range(stock_prices.shape[1]):
+        oscilator = _rsi_loop(stock_prices[:, j], period)
+        revisit_buy = 0
+        revisit_sell = 0
+        for i in range(len(stock_prices) - period):
+            if low_threshold >= oscilator[i] and i > revisit_buy:
+                proc.buy(i + period, j, amount, stock_prices, fees, portfolio, ledger)
+                revisit_buy = i + cool_down_period
+            if high_threshold <= oscilator[i] and i > revisit_sell:
+                proc.sell(i + period, j, stock_prices, fees, portfolio, ledger)
+                revisit_sell = i + cool_down_period
+    for j in range(stock_prices.shape[1]):
+        if portfolio[j] != 0:
+            proc.sell(len(stock_prices) - 1, j, stock_prices, fees, portfolio, ledger)
+    return ledger.records.copy()
+
+
+@pytest.fixture(scope='module')
+def sample_prices():
+    # the sample data: prices with 2 decimals put many RSI values exactly on the thresholds,
+    # and 2 companies fail in the middle (NaN prices)
+    return np.loadtxt(DATA_FILE)[1:]
+
+
+@pytest.fixture(scope='module')
+def momentum_loop_ledgers(sample_prices):
+    # the ledgers of the daily loop, computed once for both functions
+    ledgers = {}
+    def ledger(period, cool_down_period):
+        if (period, cool_down_period) not in ledgers:
+            ledgers[period, cool_down_period] = _momentum_loop_ledger(sample_prices, period, cool_down_period)
+        return ledgers[period, cool_down_period]
+    return ledger
+
+
+@pytest.mark.parametrize('function', [strategy.momentum, backtest.momentum])
+@pytest.mark.parametrize('period, cool_down_period', [(3, 14), (5, 14), (6, 14), (8, 0), (14, 0), (14, 5), (20, 3)])
+def test_momentum_rsi_matches_the_daily_loop(sample_prices, momentum_loop_ledgers, function, period, cool_down_period):
+    records = _run_ledger(function, sample_prices, osc_type='RSI', period=period, cool_down_period=cool_down_period)
+    _assert_same_ledger(records, momentum_loop_ledgers(period, cool_down_period))
+
+
+def _crossing_loop_ledger(stock_prices, sma_period, fma_period, amount=5000, fees=20):
+    # the original crossing_averages(), day by day for every stock, with the moving average of each column on its own
+    def moving_average(stock_price, n):
+        ret = np.cumsum(stock_price, dtype=float)
+        ret[n:] = ret[n:] - ret[:-n]
+        return ret[n - 1:] / n
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([amount] * stock_prices.shape[1], stock_prices, fees, ledger)
+    for j in range(stock_prices.shape[1]):
+        sma = moving_average(stock_prices[:, j], sma_period)
+        fma = moving_average(stock_prices[:, j], fma_period)[:len(sma)]
+        crossing_indicator = True
+        for i in range(len(fma)):
+            if fma[i] > sma[i] and not crossing_indicator:
+                proc.buy(i, j, amount, stock_prices, fees, portfolio, ledger)
+                crossing_indicator = True
+            elif fma[i] < sma[i] and crossing_indicator:
+                proc.sell(i, j, stock_prices, fees, portfolio, ledger)
+                crossing_indicator = False
+    for j in range(stock_prices.shape[1]):
+        if portfolio[j] != 0:
+            proc.sell(len(stock_prices) - 1, j, stock_prices, fees, portfolio, ledger)
+    return ledger.records.copy()
+
+
+def _random_loop_ledger(stock_prices, period, seed, amount=5000, fees=20):
+    # the original random(), one rng.choice per period and stock
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([amount] * stock_prices.shape[1], stock_prices, fees, ledger)
+    rng = np.random.default_rng(seed)
+    for i in range(1, len(stock_prices), period):
+        for j in range(stock_prices.shape[1]):
+            choice = rng.choice(['buy', 'sell', 'nothing'])
+            if choice == 'buy':
+                proc.buy(i, j, amount, stock_prices, fees, portfolio, ledger)
+            elif choice == 'sell':
+                proc.sell(i, j, stock_prices, fees, portfolio, ledger)
+    for j in range(stock_prices.shape[1]):
+        if portfolio[j] != 0:
+            proc.sell(len(stock_prices) - 1, j, stock_prices, fees, portfolio, ledger)
+    return ledger.records.copy()
+
+
+@pytest.mark.parametrize('function', [strategy.crossing_averages, backtest.crossing_averages, chunked.crossing_averages])
+@pytest.mark.parametrize('periods', [(200, 50), (50, 20), (20, 50), (10, 10)])
+def test_crossing_averages_matches_the_daily_loop(sample_prices, function, periods):
+    records = _run_ledger(function, sample_prices, sma_period=periods[0], fma_period=periods[1])
+    _assert_same_ledger(records, _crossing_loop_ledger(sample_prices, *periods))
+
+
+@pytest.mark.parametrize('period, seed', [(7, 0), (1, 1), (30, 2)])
+def test_random_matches_the_daily_loop(sample_prices, period, seed):
+    records = _run_ledger(strategy.random, sample_prices, period=period, seed=seed)
+    _assert_same_ledger(records, _random_loop_ledger(sample_prices, period, seed))
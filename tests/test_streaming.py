@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+import trading.data as data
+import trading.indicators as indicators
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    # a few of the companies fail, so the NaN handling is compared too
+    prices = data.generate_stock_paths(400, [30, 60, 100, 15, 250], [2, 3, 1, 4, 2], seed=3)[:, :, 0]
+    assert np.isnan(prices).any()
+    return prices
+
+
+@pytest.fixture(scope='module')
+def sample_prices():
+    # the sample data, with prices rounded to 2 decimals (many equal prices and flat windows),
+    # and 3 companies failing (NaN prices until the end)
+    prices = np.loadtxt(DATA_FILE)[1:]
+    assert np.isnan(prices).any()
+    return prices
+
+
+def _stream(streaming, stock_prices):
+    # the value returned on every day, None before the first full window
+    return [streaming.update(stock_prices[day]) for day in range(len(stock_prices))]
+
+
+@pytest.mark.parametrize('n', [1, 7, 50])
+@pytest.mark.parametrize('ma_type, weighted', [('simple', False), ('simple', True), ('exponential', False)])
+@pytest.mark.parametrize('prices', ['stock_prices', 'sample_prices'])
+def test_streaming_moving_average(request, prices, n, ma_type, weighted):
+    stock_prices = request.getfixturevalue(prices)
+    weights = np.arange(1, n + 1) if weighted else []
+    batch = indicators.moving_average(stock_prices, n, weights, ma_type=ma_type)
+    streamed = _stream(indicators.StreamingMovingAverage(stock_prices.shape[1], n, weights, ma_type), stock_prices)
+    assert all(value is None for value in streamed[:n - 1])
+    np.testing.assert_array_equal(np.array(streamed[n - 1:]), batch)
+
+
+@pytest.mark.parametrize('n', [2, 7, 30])
+@pytest.mark.parametrize('osc_type', ['stochastic', 'RSI'])
+@pytest.mark.parametrize('prices', ['stock_prices', 'sample_prices'])
+def test_streaming_oscillator(request, prices, n, osc_type):
+    stock_prices = request.getfixturevalue(prices)
+    batch = indicators.oscillator(stock_prices, n, osc_type)
+    streamed = _stream(indicators.StreamingOscillator(stock_prices.shape[1], n, osc_type), stock_prices)
+    assert all(value is None for value in streamed[:n - 1])
+    # oscillator() has no value for the window ending on the last day
+    np.testing.assert_array_equal(np.array(streamed[n - 1:-1]), batch)
+
+
+def test_streaming_flat_window():
+    # a flat window gives 0/0, NaN in both
+    stock_prices = np.array([[5.0], [5.0], [5.0], [6.0], [4.0], [4.0]])
+    streamed = _stream(indicators.StreamingOscillator(1, 3), stock_prices)
+    np.testing.assert_array_equal(np.array(streamed[2:-1]), indicators.oscillator(stock_prices, 3))
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pytest
+import trading.backtest as backtest
+import trading.process as proc
+import trading.sweep as sweep
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    # the whole sample data, 3 of its companies fail (NaN prices)
+    return np.loadtxt(DATA_FILE)[1:]
+
+
+def _backtest_pnl(function, stock_prices, **kwargs):
+    # total P&L of the ledger of a fresh backtest on these prices only
+    ledger = proc.Ledger()
+    function(stock_prices, ledger=ledger, **kwargs)
+    return np.nansum(ledger.records['amount'])
+
+
+def _assert_folds_match_backtests(folds, function, stock_prices, **kwargs):
+    for fold in folds:
+        train_prices = stock_prices[fold['train'][0]:fold['train'][1]]
+        test_prices = stock_prices[fold['test'][0]:fold['test'][1]]
+        assert fold['train_pnl'] == pytest.approx(_backtest_pnl(function, train_prices, **fold['parameters'], **kwargs), abs=1e-6)
+        assert fold['test_pnl'] == pytest.approx(_backtest_pnl(function, test_prices, **fold['parameters'], **kwargs), abs=1e-6)
+
+
+@pytest.mark.parametrize('osc_type', ['stochastic', 'RSI'])
+def test_walk_forward_momentum_matches_backtests(stock_prices, osc_type):
+    grid = {'period': [5, 7, 14], 'cool_down_period': [0, 14]}
+    folds = sweep.walk_forward(stock_prices, 'momentum', 300, 250, grid, osc_type=osc_type, processes=1)
+    assert len(folds) == 6
+    _assert_folds_match_backtests(folds, backtest.momentum, stock_prices, osc_type=osc_type)
+
+
+def test_walk_forward_crossing_averages_matches_backtests(stock_prices):
+    grid = {'sma_period': [20, 50, 100], 'fma_period': [10, 30, 60]}
+    folds = sweep.walk_forward(stock_prices, 'crossing_averages', 300, 250, grid, processes=1)
+    _assert_folds_match_backtests(folds, backtest.crossing_averages, stock_prices)
+
+
+def test_sweep_crossing_averages_matches_backtests(stock_prices):
+    # sma_period below fma_period too: the strategy only compares the two averages
+    sma_periods = [10, 50, 200]
+    fma_periods = [5, 30, 100]
+    pnl = sweep.sweep_crossing_averages(stock_prices, sma_periods, fma_periods, processes=2)
+    for i, sma_period in enumerate(sma_periods):
+        for j, fma_period in enumerate(fma_periods):
+            expected = _backtest_pnl(backtest.crossing_averages, stock_prices, sma_period=sma_period, fma_period=fma_period)
+            assert pnl[i, j] == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.mark.parametrize('osc_type', ['stochastic', 'RSI'])
+def test_sweep_momentum_matches_backtests(stock_prices, osc_type):
+    pnl = sweep.sweep_momentum(stock_prices, [5, 14], [0.25], [0.75], [0, 14], osc_type=osc_type, processes=1)
+    for i, period in enumerate([5, 14]):
+        for l, cool_down_period in enumerate([0, 14]):
+            expected = _backtest_pnl(backtest.momentum, stock_prices, osc_type=osc_type, period=period, cool_down_period=cool_down_period)
+            assert pnl[i, 0, 0, l] == pytest.approx(expected, abs=1e-6)
@@ -0,0 +1,296 @@
+# Event-driven versions of the strategies, deciding and trading for all stocks at once on every bar.
+import warnings
+import numpy as np
+import trading.process as proc
+import trading.indicators as stock_indicators
+import trading.profiling as profiling
+
+class Backtest:
+    '''
+    Keeps the portfolio of all stocks as one vector and settles the trades of a whole bar
+    in one vectorized step, with the same arithmetic as process.buy() and process.sell().
+    The transactions are kept in memory and written in one go by write().
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        amount (float): how much we spend on each purchase (must cover fees)
+        fees (float): transaction fees
+
+    Example:
+        Buy every stock on day 0 and sell them all on the last day:
+            >>> backtest = Backtest(stock_prices, 5000, 20)
+            >>> backtest.buy(0, np.ones(N, dtype=bool))
+            >>> backtest.sell(len(stock_prices) - 1, backtest.portfolio != 0, section=2)
+            >>> backtest.write('ledger.txt')
+    '''
+    def __init__(self, stock_prices, amount, fees):
+        # give a single stock the same (days, 1) shape as a matrix
+        self.stock_prices = stock_prices.reshape(len(stock_prices), -1)
+        self.n_stocks = self.stock_prices.shape[1]
+        self.amount = amount
+        self.fees = fees
+        self.portfolio = np.zeros(self.n_stocks, dtype=np.int64)
+        # batches of transactions (one per bar and type), with the section of the ledger they belong to
+        # (0: initial portfolio, 1: trading, 2: selling everything at the end)
+        self._batches = []
+
+    def buy(self, date, mask, section=1):
+        '''
+        Buys the stocks in mask on day date, spending at most amount on each.
+        '''
+        stocks = np.nonzero(mask)[0]
+        stock_price = self.stock_prices[date, stocks]
+        # If the price is NaN the company has failed, so there is nothing to buy
+        stocks = stocks[~np.isnan(stock_price)]
+        stock_price = stock_price[~np.isnan(stock_price)]
+        # only whole shares can be bought
+        shares = ((self.amount - self.fees) // stock_price).astype(np.int64)
+        self.portfolio[stocks] += shares
+        self._record('buy', date, stocks, shares, stock_price, -np.abs(stock_price * shares + self.fees), section)
+
+    def sell(self, date, mask, section=1):
+        '''
+        Sells all the shares of the stocks in mask on day date.
+        '''
+        stocks = np.nonzero(mask)[0]
+        stock_price = self.stock_prices[date, stocks]
+        shares = self.portfolio[stocks]
+        self.portfolio[stocks] = 0
+        self._record('sell', date, stocks, shares, stock_price, np.abs(stock_price * shares - self.fees), section)
+
+    def _record(self, transaction_type, date, stocks, shares, stock_price, amounts, section):
+        if not len(stocks):
+            return
+        self._batches.append((transaction_type == 'sell', date, stocks, shares, stock_price, amounts, section))
+
+    def records(self, section=None, order='stock'):
+        '''
+        All the transactions, in the same order as the loop-based strategies write them:
+        the initial portfolio, then every stock in turn with its trades by date
+        (buy before sell on the same day), then the final sells.
+        With order='date', the trades are by date, then by stock, as random() writes them.
+        If section is given (0, 1 or 2), only the transactions of that section.
+        '''
+        batches = self._batches
+        if section is not None:
+            batches = [batch for batch in batches if batch[6] == section]
+        sizes = [len(batch[2]) for batch in batches]
+        # one value per batch, repeated for every transaction in it
+        sells = np.repeat([batch[0] for batch in batches], sizes).astype(bool)
+        # (a batch has one date, or one date per transaction)
+        dates = np.concatenate([np.broadcast_to(batch[1], size) for batch, size in zip(batches, sizes)]
+                               + [np.zeros(0, dtype=np.int64)]).astype(np.int64)
+        sections = np.repeat([batch[6] for batch in batches], sizes).astype(np.int64)
+        stocks = np.concatenate([batch[2] for batch in batches] + [np.zeros(0, dtype=np.int64)])
+        # lexsort uses the last key as the primary one
+        if order == 'date':
+            order = np.lexsort((sells, stocks, dates, sections))
+        else:
+            order = np.lexsort((sells, dates, stocks, sections))
+        records = np.zeros(len(order), dtype=proc.Ledger.dtype)
+        records['type'] = np.where(sells[order], b'sell', b'buy')
+        records['date'] = dates[order]
+        records['stock'] = stocks[order]
+        for field, position in (('shares', 3), ('price', 4), ('amount', 5)):
+            records[field] = np.concatenate([batch[position] for batch in batches] + [np.zeros(0)])[order]
+        return records
+
+    def pnl(self):
+        '''
+        Sum of all the amounts spent and earned so far, fees included.
+        The sell of a failed company (NaN price) counts as 0, its shares are worth nothing.
+        '''
+        return float(sum(np.nansum(batch[5]) for batch in self._batches))
+
+    def write(self, ledger, order='stock'):
+        '''
+        Writes all the transactions to ledger (a path to the ledger file, or a Ledger),
+        in the given order (see records()).
+        '''
+        if isinstance(ledger, proc.Ledger):
+            ledger.extend(self.records(order=order))
+        else:
+            proc.Ledger.from_records(self.records(order=order), ledger).flush()
+
+    def sell_everything(self):
+        '''
+        Sells everything we still hold on the last day.
+        '''
+        self.sell(len(self.stock_prices) - 1, self.portfolio != 0, section=2)
+
+def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', cache=None, *, sma_weights=[], fma_weights=[]):
+    '''
+        Same strategy and same ledger as strategy.crossing_averages(), but the buy and sell signals
+        are computed for every stock at once as boolean arrays, and each bar is traded in one step.
+
+        Input:
+            stock_prices (ndarray): the stock price data
+            sma_period (int, default 200): the SMA period (days)
+            fma_period (int, default 50): the FMA period (days)
+            weights (list, default []): deprecated, use sma_weights and fma_weights instead.
+                If specified, used as the weights of both the SMA and the FMA
+                (unless sma_weights or fma_weights is given).
+            amount (float, default 5000): how much we spend on each purchase
+                (must cover fees)
+            fees (float, default 20): transaction fees
+            ledger (str or Ledger): path to the ledger file, or an in-memory Ledger
+            cache (IndicatorCache, default None): computes the indicators through this cache
+                (see indicators.IndicatorCache), so that another run on the same prices reuses them.
+                By default nothing is cached.
+            sma_weights (list, default []): must be of length sma_period if specified. Indicates the weights
+                to use for the weighted SMA. If empty, the SMA is not weighted.
+            fma_weights (list, default []): must be of length fma_period if specified. Indicates the weights
+                to use for the weighted FMA. If empty, the FMA is not weighted.
+
+        Output: None
+    '''
+    sma_weights, fma_weights = crossing_weights(weights, sma_weights, fma_weights)
+    backtest = Backtest(stock_prices, amount, fees)
+    with profiling.stage('backtest.crossing_averages.signals'):
+        # the indicators module, or the same functions through a cache
+        indicators = stock_indicators if cache is None else cache
+        sma = indicators.moving_average(backtest.stock_prices, sma_period, sma_weights)
+        fma = indicators.moving_average(backtest.stock_prices, fma_period, fma_weights)
+        # moving_average() has printed a message if the number of weights is wrong
+        if sma is None or fma is None:
+            return
+    with profiling.stage('backtest.crossing_averages.execution'):
+        backtest.buy(0, np.ones(backtest.n_stocks, dtype=bool), section=0)
+        trade_crossing_averages(backtest, sma, fma)
+        backtest.sell_everything()
+        backtest.write(ledger)
+
+def crossing_weights(weights, sma_weights, fma_weights):
+    '''
+    The weights of the SMA and of the FMA for crossing_averages(): weights (deprecated)
+    is used for both averages, unless sma_weights or fma_weights is given.
+
+    Output:
+        sma_weights, fma_weights (list): the weights of each average ([] if it is not weighted)
+    '''
+    if len(weights):
+        # stacklevel 3 points the warning at the caller of crossing_averages()
+        warnings.warn("weights is deprecated, please use sma_weights and fma_weights instead.",
+                      DeprecationWarning, stacklevel=3)
+        if not len(sma_weights):
+            sma_weights = weights
+        if not len(fma_weights):
+            fma_weights = weights
+    return sma_weights, fma_weights
+
+def trade_crossing_averages(backtest, sma, fma):
+    '''
+    The trading part of crossing_averages(), given the SMA and the FMA for every stock
+    (so that they can be computed elsewhere, e.g. one block of stocks at a time).
+
+    Input:
+        backtest (Backtest): the backtest to trade in
+        sma (ndarray): the SMA, one column per stock, as returned by moving_average()
+        fma (ndarray): the FMA, one column per stock, as returned by moving_average()
+
+    Output: None
+    '''
+    # shrink the averages to the same length (the fma is the longer one, unless fma_period > sma_period)
+    length = min(len(sma), len(fma))
+    sma = sma[:length]
+    fma = fma[:length]
+    # +1 where the fma is above the sma, -1 where it is below, 0 when they are equal (or NaN),
+    # after a first row of +1 for the start, because we hold every stock after creating the portfolio
+    signal = np.ones((length + 1, backtest.n_stocks), dtype=np.int8)
+    np.subtract((fma > sma).view(np.int8), (fma < sma).view(np.int8), out=signal[1:])
+    # the signal only matters on the days it changes: find them stock by stock (transposed, so that they
+    # come out in the order of the ledger, by stock and then by date)
+    changes = np.flatnonzero(np.ascontiguousarray((signal[1:] != signal[:-1]).T))
+    stocks, dates = np.divmod(changes, length)
+    signal = signal[dates + 1, stocks]
+    dates = dates[signal != 0]
+    stocks = stocks[signal != 0]
+    signal = signal[signal != 0]
+    # we trade when the signal is not the same as the last one (the start counts as +1 for the first one of a stock):
+    # it is always a sell first, then a buy, a sell...
+    previous = np.ones(len(signal), dtype=np.int8)
+    previous[1:] = np.where(stocks[1:] == stocks[:-1], signal[:-1], 1)
+    trades = signal != previous
+    dates = dates[trades]
+    stocks = stocks[trades]
+    sells = signal[trades] < 0
+    with profiling.stage('backtest.crossing_averages.settle'):
+        _settle_crossings(backtest, dates, stocks, sells)
+
+def _settle_crossings(backtest, dates, stocks, sells):
+    '''
+    Settles alternating sells and buys of each stock, given in the order of the stocks then of the dates,
+    with the same arithmetic as Backtest.buy() and Backtest.sell().
+    '''
+    stock_price = backtest.stock_prices[dates, stocks]
+    # If the price is NaN the company has failed, so there is nothing to buy
+    bought = ~sells & ~np.isnan(stock_price)
+    shares = np.zeros(len(dates), dtype=np.int64)
+    shares[bought] = (backtest.amount - backtest.fees) // stock_price[bought]
+    # a sell sells what the buy before it bought, or what the portfolio held for the first trade of a stock
+    first = np.ones(len(dates), dtype=bool)
+    first[1:] = stocks[1:] != stocks[:-1]
+    shares[sells] = np.where(first, backtest.portfolio[stocks], np.roll(shares, 1))[sells]
+    # what is held after the last trade of each stock
+    last = np.ones(len(dates), dtype=bool)
+    last[:-1] = first[1:]
+    backtest.portfolio[stocks[last]] = np.where(sells, 0, shares)[last]
+    backtest._record('buy', dates[bought], stocks[bought], shares[bought], stock_price[bought],
+                     -np.abs(stock_price[bought] * shares[bought] + backtest.fees), 1)
+    backtest._record('sell', dates[sells], stocks[sells], shares[sells], stock_price[sells],
+                     np.abs(stock_price[sells] * shares[sells] - backtest.fees), 1)
+
+def momentum(stock_prices, osc_type='stochastic', period=7, low_threshold=0.25, high_threshold=0.75, cool_down_period=14, amount=5000, fees=20, ledger='ledger_momentum.txt', cache=None):
+    '''
+        Same strategy and same ledger as strategy.momentum(), but the buy and sell signals
+        are computed for every stock at once as boolean arrays, and each bar is traded in one step.
+
+        Input:
+            stock_prices (ndarray): the stock price data
+            osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+            period (int, default 7): period of the oscillator (in days).
+            low_threshold (float, default 0.25):  The low threshold used for the oscilator
+            high_threshold (float, default 0.75): The high threshold used for the oscilator
+            cool_down_period (int, default 14): The cooldown period before making a new buy or sell order
+            amount (float, default 5000): how much we spend on each purchase
+                (must cover fees)
+            fees (float, default 20): transaction fees
+            ledger (str or Ledger): path to the ledger file, or an in-memory Ledger
+            cache (IndicatorCache, default None): computes the indicators through this cache
+                (see indicators.IndicatorCache), so that another run on the same prices reuses them.
+                By default nothing is cached.
+
+        Output: None
+    '''
+    backtest = Backtest(stock_prices, amount, fees)
+    with profiling.stage('backtest.momentum.signals'):
+        indicators = stock_indicators if cache is None else cache
+        oscilator = indicators.oscillator(backtest.stock_prices, n=period, osc_type=osc_type)
+    with profiling.stage('backtest.momentum.execution'):
+        backtest.buy(0, np.ones(backtest.n_stocks, dtype=bool), section=0)
+        trade_momentum(backtest, oscilator, period, low_threshold, high_threshold, cool_down_period)
+        backtest.sell_everything()
+        backtest.write(ledger)
+
+def trade_momentum(backtest, oscilator, period, low_threshold, high_threshold, cool_down_period):
+    '''
+    The trading part of momentum(), given the oscillator for every stock
+    (so that it can be computed once and reused, e.g. in a parameter sweep).
+
+    Input:
+        backtest (Backtest): the backtest to trade in
+        oscilator (ndarray): the oscillator, one column per stock, as returned by oscillator()
+        period, low_threshold, high_threshold, cool_down_period: as in momentum()
+
+    Output: None
+    '''
+    # the days where a stock crosses a threshold outside of its cool down period
+    buys = stock_indicators.cool_down(low_threshold >= oscilator, cool_down_period)
+    sells = stock_indicators.cool_down(high_threshold <= oscilator, cool_down_period)
+    # only the days where some stock trades need a step
+    for i in np.nonzero(buys.any(axis=1) | sells.any(axis=1))[0]:
+        if buys[i].any():
+            # buy the stock for the current date + period (because the oscilator starts at day period)
+            backtest.buy(i + period, buys[i])
+        if sells[i].any():
+            backtest.sell(i + period, sells[i])
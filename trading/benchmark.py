@@ -0,0 +1,275 @@
+# Benchmarks for the trading package: data generation, indicators, strategies and ledger analytics.
+# Run with:
+#     python -m trading.benchmark --stocks 20 500 --years 5 --output results.json
+#     python -m trading.benchmark --stocks 20 500 --years 5 --baseline results.json
+#     python -m trading.benchmark --startup
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import trading.data as data
+import trading.indicators as stock_indicators
+import trading.performance as performance
+import trading.strategy as strategy
+
+def measure(function, repeats=3, memory=True):
+    '''
+    Times a function and measures its peak memory.
+
+    Input:
+        function (callable): the function to run, without arguments
+        repeats (int, default 3): number of timed runs, the fastest one is reported
+        memory (bool, default True): if True, run once more with tracemalloc to get the peak memory
+            (separately, so the tracing doesn't slow down the timed runs)
+
+    Output:
+        result (dict): 'time' (s, fastest run) and 'peak_memory' (bytes allocated at the peak, or None)
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_memory': peak_memory}
+
+def _write_price_file(path, stock_prices, volatility):
+    '''
+    Writes prices in the format of stock_data_5y.txt (volatilities on the first row).
+    '''
+    np.savetxt(path, np.vstack((volatility, stock_prices)), fmt='%.2f')
+
+def benchmarks(n_stocks, years, workdir):
+    '''
+    The benchmarks for one scale, as a list of (name, setup).
+    setup() prepares the data the benchmark needs, so it isn't part of the timings, and returns
+    the function to time. Data used by several benchmarks is prepared once, when the first one needs it,
+    so a benchmark left out (see run(only=...)) prepares nothing.
+
+    Input:
+        n_stocks (int): number of stocks
+        years (int): number of years of daily prices
+        workdir (str): directory for the price and ledger files
+
+    Output:
+        benchmarks (list): (name, setup) pairs
+    '''
+    days = 365 * years
+    rng = np.random.default_rng(0)
+    initial_price = list(rng.uniform(100, 600, n_stocks))
+    volatility = list(rng.uniform(0.5, 3, n_stocks))
+    prepared = {}
+
+    def prepare(name, function):
+        # computes the data the first time it is needed only
+        if name not in prepared:
+            prepared[name] = function()
+        return prepared[name]
+
+    def stock_prices():
+        return prepare('stock_prices', lambda: data.generate_stock_paths(days, initial_price, volatility, seed=0)[:, :, 0])
+
+    def text_file():
+        def write():
+            path = os.path.join(workdir, 'prices.txt')
+            _write_price_file(path, stock_prices(), volatility)
+            return path
+        return prepare('text_file', write)
+
+    def no_setup(function):
+        return lambda: function
+
+    def on_prices(function, *args, **kwargs):
+        def setup():
+            prices = stock_prices()
+            return lambda: function(prices, *args, **kwargs)
+        return setup
+
+    def correlated():
+        # every pair of stocks with correlation 0.3
+        correlation = np.full((n_stocks, n_stocks), 0.3)
+        np.fill_diagonal(correlation, 1)
+        return lambda: data.get_data('generate', initial_price, volatility, seed=1,
+                                     correlation=correlation, market_chance=10 / 365)
+
+    def read_text():
+        path = text_file()
+        return lambda: data.get_data(data_file=path)
+
+    def read_npy():
+        npy_file = data.convert_to_npy(text_file())
+        return lambda: np.asarray(data.get_data(data_file=npy_file)).sum()
+
+    def read_ledger():
+        ledger_file = os.path.join(workdir, 'ledger_momentum.txt')
+        strategy.momentum(stock_prices(), ledger=ledger_file)
+        return lambda: performance.read_ledger(ledger_file, quiet=True)
+
+    def run_strategy(function, **kwargs):
+        def setup():
+            prices = stock_prices()
+            # a fresh ledger file every time, so the ledger doesn't grow between runs
+            def run():
+                ledger = os.path.join(workdir, 'ledger_benchmark.txt')
+                if os.path.exists(ledger):
+                    os.remove(ledger)
+                function(prices, ledger=ledger, **kwargs)
+            return run
+        return setup
+
+    return [
+        # one stock at a time, the way the strategies used to generate their data
+        ('generate_stock_price', no_setup(lambda: [data.generate_stock_price(days, price, sigma, seed=1)
+                                                   for price, sigma in zip(initial_price, volatility)])),
+        ('generate_stock_paths', no_setup(lambda: data.generate_stock_paths(days, initial_price, volatility, seed=1))),
+        # get_data('generate') always simulates 5 years
+        ('get_data_generate', no_setup(lambda: data.get_data('generate', initial_price, volatility, seed=1))),
+        ('get_data_generate_correlated', correlated),
+        ('get_data_read_text', read_text),
+        ('get_data_read_npy', read_npy),
+        ('moving_average', on_prices(stock_indicators.moving_average, 50)),
+        ('oscillator_stochastic', on_prices(stock_indicators.oscillator, 14)),
+        ('oscillator_RSI', on_prices(stock_indicators.oscillator, 14, osc_type='RSI')),
+        ('strategy_random', run_strategy(strategy.random, seed=1)),
+        ('strategy_crossing_averages', run_strategy(strategy.crossing_averages)),
+        ('strategy_momentum', run_strategy(strategy.momentum)),
+        ('read_ledger', read_ledger),
+    ]
+
+# Top-level packages which must not be loaded by importing the trading modules (plotting and GUI toolkits)
+PLOTTING_MODULES = ('matplotlib', 'tkinter', '_tkinter', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'wx', 'gi', 'IPython')
+
+def startup(module='trading.strategy', repeats=5):
+    '''
+    Measures the time to import module in a fresh interpreter, like a worker process would,
+    and lists the plotting or GUI modules the import loads.
+
+    Input:
+        module (str, default 'trading.strategy'): the module to import
+        repeats (int, default 5): number of fresh interpreters, the fastest import is kept
+
+    Output:
+        result (dict): 'time' (seconds) and 'plotting_modules' (list of module names)
+    '''
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import " + module + "\n"
+            "print(time.perf_counter() - start)\n"
+            "print(' '.join(sorted(m for m in sys.modules if m.split('.')[0] in " + repr(PLOTTING_MODULES) + ")))\n")
+    # make the trading package importable from the fresh interpreter
+    environment = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment['PYTHONPATH'] = os.pathsep.join([root] + [path for path in [environment.get('PYTHONPATH')] if path])
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                env=environment, check=True).stdout.split('\n')
+        times.append(float(output[0]))
+        loaded = output[1].split()
+    return {'time': min(times), 'plotting_modules': loaded}
+
+def run(stocks=(20, 500, 5000), years=(5, 20), repeats=3, memory=True, only=None):
+    '''
+    Runs the benchmarks at every scale.
+
+    Input:
+        stocks (list, default (20, 500, 5000)): numbers of stocks
+        years (list, default (5, 20)): numbers of years
+        repeats (int, default 3): number of timed runs for each benchmark
+        memory (bool, default True): also measure the peak memory
+        only (list, default None): names of the benchmarks to run (default: all)
+
+    Output:
+        results (dict): for each 'name[stocks=N,years=Y]', the time and peak memory
+    '''
+    results = {}
+    for n_stocks in stocks:
+        for n_years in years:
+            with tempfile.TemporaryDirectory() as workdir:
+                for name, setup in benchmarks(n_stocks, n_years, workdir):
+                    if only and name not in only:
+                        continue
+                    key = f"{name}[stocks={n_stocks},years={n_years}]"
+                    results[key] = measure(setup(), repeats, memory)
+                    peak = results[key]['peak_memory']
+                    print(f"{key:<55} {results[key]['time']:10.4f} s"
+                          + (f" {peak / 2 ** 20:10.1f} MiB" if peak is not None else ""))
+    return results
+
+def compare(results, baseline, tolerance=0.5):
+    '''
+    Compares benchmark results with a baseline.
+
+    Input:
+        results (dict): results from run()
+        baseline (dict): results from an earlier run()
+        tolerance (float, default 0.5): allowed slowdown (or memory increase), 0.5 is 50% more
+
+    Output:
+        regressions (list): a message for every benchmark slower (or bigger) than the baseline allows
+    '''
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for measurement in ('time', 'peak_memory'):
+            before = baseline[key].get(measurement)
+            after = result.get(measurement)
+            if before is not None and after is not None and after > before * (1 + tolerance):
+                regressions.append(f"{key} {measurement}: {after:.4g} vs baseline {before:.4g} "
+                                   f"(+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the trading package.")
+    parser.add_argument('--stocks', type=int, nargs='+', default=[20, 500, 5000])
+    parser.add_argument('--years', type=int, nargs='+', default=[5, 20])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help="names of the benchmarks to run")
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="JSON file with results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed slowdown, 0.5 is 50%%")
+    parser.add_argument('--startup', action='store_true',
+                        help="only measure the import time of the trading modules, and check no plotting module is loaded")
+    args = parser.parse_args(argv)
+    if args.startup:
+        results = {}
+        plotting = False
+        for module in ('trading.data', 'trading.strategy', 'trading.performance'):
+            result = startup(module, args.repeats)
+            results[f"import[{module}]"] = {'time': result['time'], 'peak_memory': None}
+            print(f"import {module:<30} {result['time']:10.4f} s   plotting modules: "
+                  + (' '.join(result['plotting_modules']) or 'none'))
+            plotting = plotting or bool(result['plotting_modules'])
+        if plotting:
+            print("\nPlotting modules are imported at startup.")
+            return 1
+    else:
+        results = run(args.stocks, args.years, args.repeats, not args.no_memory, args.only)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS compared to the baseline:")
+            for message in regressions:
+                print("   ", message)
+            return 1
+        print("\nNo regression compared to the baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# Append-only binary ledger: fixed-width transaction records, with a sidecar index per stock and per date,
+# so that the transactions of one stock or of a range of days are read without scanning the whole ledger.
+import os
+import numpy as np
+import trading.process as proc
+
+# The file starts with this magic string and the size of a record, then the records one after the other
+MAGIC = b'TRADELG\x01'
+HEADER_SIZE = len(MAGIC) + 8
+# An index file starts with this magic string, then the state of the ledger when it was last updated:
+# the number of records indexed, the modification time of the ledger and the last record indexed
+# (to recognise a ledger deleted and written again), and the number of runs that follow.
+# A run is its length n, then n sorted keys, then the n record numbers of those keys.
+INDEX_MAGIC = b'TRADEIX\x01'
+_INDEX_HEADER = np.dtype({'names': ['magic', 'count', 'mtime', 'runs', 'last'],
+                          'formats': ['S8', '<i8', '<i8', '<i8', 'V%d' % proc.TRADE_DTYPE.itemsize],
+                          'offsets': [0, 8, 16, 24, 32],
+                          'itemsize': 32 + -(-proc.TRADE_DTYPE.itemsize // 8) * 8})
+
+def index_files(ledger_file):
+    '''
+    The paths of the two index files of a binary ledger: (stock index, date index).
+    Each holds a few sorted runs of (key, record number) pairs, the keys being the stock or the date,
+    so a query only reads a few pages of each run. The transactions appended since the last query
+    are indexed as a new run, and the last runs are merged when they get as large as the one before,
+    so there are only a few runs and the whole index is not written again on every update.
+    '''
+    return ledger_file + '.stock.idx', ledger_file + '.date.idx'
+
+def is_binary(ledger_file):
+    '''
+    Output:
+        binary (bool): True if ledger_file is a binary ledger (and not a text ledger)
+    '''
+    if not isinstance(ledger_file, str) or not os.path.isfile(ledger_file):
+        return False
+    file = open(ledger_file, "rb")
+    magic = file.read(len(MAGIC))
+    file.close()
+    return magic == MAGIC
+
+def _check_header(ledger_file):
+    # The records can only be read if they have the size of process.TRADE_DTYPE
+    file = open(ledger_file, "rb")
+    header = file.read(HEADER_SIZE)
+    file.close()
+    if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{ledger_file} is not a binary ledger")
+    itemsize = int(np.frombuffer(header[len(MAGIC):], dtype=np.int64)[0])
+    if itemsize != proc.TRADE_DTYPE.itemsize:
+        raise ValueError(f"{ledger_file} has records of {itemsize} bytes, "
+                         f"not {proc.TRADE_DTYPE.itemsize} bytes as process.TRADE_DTYPE")
+
+def _count(ledger_file, size=None):
+    # number of complete records in the file (of the given size)
+    if size is None:
+        if not os.path.exists(ledger_file):
+            return 0
+        size = os.path.getsize(ledger_file)
+    return max(0, (size - HEADER_SIZE) // proc.TRADE_DTYPE.itemsize)
+
+def append(ledger_file, records):
+    '''
+    Appends transactions at the end of a binary ledger, creating it if it doesn't exist.
+    The index is brought up to date the next time the ledger is queried.
+    Raises ValueError if the file is not a binary ledger with records of the same size.
+
+    Input:
+        ledger_file (str): path to the binary ledger
+        records (ndarray): structured array with the fields of process.Ledger.dtype
+    '''
+    records = np.ascontiguousarray(records, dtype=proc.TRADE_DTYPE)
+    new = not os.path.exists(ledger_file) or os.path.getsize(ledger_file) == 0
+    if not new:
+        _check_header(ledger_file)
+    file = open(ledger_file, "ab")
+    if new:
+        file.write(MAGIC + np.int64(proc.TRADE_DTYPE.itemsize).tobytes())
+    file.write(records.tobytes())
+    file.close()
+
+def read(ledger_file, count=None):
+    '''
+    All the transactions of a binary ledger, memory-mapped (only the pages used are read from disk).
+    Raises ValueError if the file is not a binary ledger with records of the size of process.TRADE_DTYPE.
+
+    Input:
+        ledger_file (str): path to the binary ledger
+        count (int, default None): only the first count transactions (default: all of them)
+
+    Output:
+        records (ndarray): structured array with the fields of process.Ledger.dtype, read-only
+    '''
+    if os.path.exists(ledger_file) and os.path.getsize(ledger_file) > 0:
+        _check_header(ledger_file)
+    if count is None:
+        count = _count(ledger_file)
+    if count == 0:
+        return np.zeros(0, dtype=proc.TRADE_DTYPE)
+    return np.memmap(ledger_file, dtype=proc.TRADE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+def _sorted_pairs(keys, first_record):
+    # sorted keys and their record numbers, the record numbers stay in order for the same key
+    order = np.argsort(keys, kind='stable')
+    return np.array([keys[order], order + first_record], dtype=np.int64)
+
+def _read_runs(index_file):
+    '''
+    The header of an index file and its runs, as (offset, keys, record numbers) with the arrays
+    memory-mapped, or (None, None) if the file is missing or damaged.
+    '''
+    if not os.path.exists(index_file):
+        return None, None
+    size = os.path.getsize(index_file)
+    if size < _INDEX_HEADER.itemsize:
+        return None, None
+    header = np.fromfile(index_file, dtype=_INDEX_HEADER, count=1)[0]
+    if header['magic'] != INDEX_MAGIC:
+        return None, None
+    runs = []
+    offset = _INDEX_HEADER.itemsize
+    for run in range(int(header['runs'])):
+        if offset + 8 > size:
+            return None, None
+        n = int(np.fromfile(index_file, dtype=np.int64, count=1, offset=offset)[0])
+        if n < 0 or offset + 8 * (1 + 2 * n) > size:
+            return None, None
+        pairs = np.memmap(index_file, dtype=np.int64, mode='r', offset=offset + 8, shape=(2, n)) if n else np.zeros((2, 0), dtype=np.int64)
+        runs.append((offset, pairs[0], pairs[1]))
+        offset += 8 * (1 + 2 * n)
+    # the runs must hold exactly the records indexed
+    if sum(len(keys) for offset, keys, record_numbers in runs) != header['count']:
+        return None, None
+    return header, runs
+
+def _up_to_date(header, records, mtime):
+    # The index is for this ledger if its last record indexed is still there,
+    # and if nothing was appended the ledger must not have been written since
+    indexed = int(header['count'])
+    if indexed > len(records):
+        return False
+    if indexed and records[indexed - 1:indexed].tobytes() != bytes(header['last']):
+        return False
+    return indexed < len(records) or int(header['mtime']) == mtime
+
+def _write_run(file, keys, record_numbers):
+    file.write(np.int64(len(keys)).tobytes())
+    file.write(np.ascontiguousarray(keys, dtype=np.int64).tobytes())
+    file.write(np.ascontiguousarray(record_numbers, dtype=np.int64).tobytes())
+
+def update_index(ledger_file):
+    '''
+    Adds the transactions appended since the last update to the index files
+    (or builds them, the first time, or again if they don't match the ledger).
+    Only the new records are read and sorted, and written as a new run at the end of each index file.
+    Then the last runs are merged while the last one is at least half as large as the one before,
+    so an index of n records has O(log n) runs and each record is merged O(log n) times.
+
+    Output:
+        indexes (tuple): for the stock index and the date index, the list of the runs
+            as (keys, record numbers) pairs of sorted arrays, memory-mapped
+    '''
+    if os.path.exists(ledger_file):
+        status = os.stat(ledger_file)
+        count, mtime = _count(ledger_file, status.st_size), status.st_mtime_ns
+    else:
+        count, mtime = 0, 0
+    records = read(ledger_file, count)
+    indexes = []
+    for index_file, field in zip(index_files(ledger_file), ('stock', 'date')):
+        header, runs = _read_runs(index_file)
+        if header is None or not _up_to_date(header, records, mtime):
+            # start again from an empty index
+            header = np.zeros(1, dtype=_INDEX_HEADER)[0]
+            header['magic'] = INDEX_MAGIC
+            file = open(index_file, "wb")
+            file.write(header.tobytes())
+            file.close()
+            runs = []
+        indexed = int(header['count'])
+        if indexed < count or int(header['mtime']) != mtime:
+            new_keys, new_record_numbers = _sorted_pairs(np.asarray(records[field][indexed:], dtype=np.int64), indexed)
+            file = open(index_file, "r+b")
+            # the new run goes after the last one
+            end = runs[-1][0] + 8 * (1 + 2 * len(runs[-1][1])) if runs else _INDEX_HEADER.itemsize
+            # merge the new run with the last runs while they are not much larger
+            while runs and len(runs[-1][1]) <= 2 * len(new_keys):
+                offset, keys, record_numbers = runs.pop()
+                # the older records come first, and keep their place for the same key
+                keys = np.concatenate((keys, new_keys))
+                record_numbers = np.concatenate((record_numbers, new_record_numbers))
+                order = np.argsort(keys, kind='stable')
+                new_keys, new_record_numbers = keys[order], record_numbers[order]
+                end = offset
+            file.seek(end)
+            _write_run(file, new_keys, new_record_numbers)
+            file.truncate()
+            # the header last, so the index only covers the new records once they are written
+            header['count'] = count
+            header['mtime'] = mtime
+            header['runs'] = len(runs) + 1
+            header['last'] = records[count - 1:count].tobytes() if count else bytes(len(header['last']))
+            file.seek(0)
+            file.write(header.tobytes())
+            file.close()
+            header, runs = _read_runs(index_file)
+        indexes.append([(keys, record_numbers) for offset, keys, record_numbers in runs])
+    return tuple(indexes)
+
+def _select(ledger_file, index_number, first_key, last_key):
+    record_numbers = []
+    for keys, numbers in update_index(ledger_file)[index_number]:
+        start = np.searchsorted(keys, first_key, side='left')
+        end = np.searchsorted(keys, last_key, side='right')
+        record_numbers.append(numbers[start:end])
+    # in the order they were written
+    record_numbers = np.sort(np.concatenate(record_numbers + [np.zeros(0, dtype=np.int64)]))
+    return np.array(read(ledger_file)[record_numbers]) if len(record_numbers) else np.zeros(0, dtype=proc.TRADE_DTYPE)
+
+def query_stock(ledger_file, stock):
+    '''
+    The transactions of one stock, reading only their records.
+
+    Input:
+        ledger_file (str): path to the binary ledger
+        stock (int): the stock (column index in the price data)
+
+    Output:
+        records (ndarray): the transactions of the stock, in the order they were written
+
+    Example:
+        All the trades of stock 17:
+            >>> query_stock('ledger.bin', 17)
+    '''
+    return _select(ledger_file, 0, stock, stock)
+
+def query_dates(ledger_file, first_day, last_day):
+    '''
+    The transactions between two days (both included), reading only their records.
+
+    Input:
+        ledger_file (str): path to the binary ledger
+        first_day, last_day (int): the range of days
+
+    Output:
+        records (ndarray): the transactions in the range of days, in the order they were written
+
+    Example:
+        The trades between day 400 and day 600:
+            >>> query_dates('ledger.bin', 400, 600)
+    '''
+    return _select(ledger_file, 1, first_day, last_day)
+
+class BinaryLedger(proc.Ledger):
+    '''
+    In-memory ledger written to a binary ledger file by flush(), instead of a text file.
+    It can be used anywhere a Ledger is (log_transaction(), buy(), sell(), create_portfolio(),
+    the strategies and backtests).
+
+    Input:
+        ledger_file (str, default None): path to the binary ledger used by flush()
+        chunk_size (int, default 1024): number of records added every time the array is full
+
+    Example:
+        >>> with BinaryLedger('ledger.bin') as ledger:
+        ...     strategy.momentum(sim_data, ledger=ledger)
+        >>> query_stock('ledger.bin', 3)
+    '''
+    def flush(self, ledger_file=None):
+        '''
+        Appends the transactions not written yet to the binary ledger, in a single write.
+        Does nothing if there is no ledger file.
+        '''
+        if ledger_file is None:
+            ledger_file = self.ledger_file
+        if ledger_file is None or self._flushed == self._size:
+            return
+        append(ledger_file, self._records[self._flushed:self._size])
+        self._flushed = self._size
+
+def from_csv(csv_file, ledger_file):
+    '''
+    Converts a text ledger (as written by log_transaction()) to a binary ledger, and indexes it.
+    If the binary ledger exists, the transactions are appended to it.
+    '''
+    append(ledger_file, np.loadtxt(csv_file, delimiter=",", dtype=proc.TRADE_DTYPE, ndmin=1))
+    update_index(ledger_file)
+
+def to_csv(ledger_file, csv_file):
+    '''
+    Converts a binary ledger to a text ledger, in the same format as log_transaction()
+    (a ledger converted from a text file gives back the same text).
+    If the text ledger exists, the transactions are appended to it.
+    '''
+    proc.Ledger.from_records(read(ledger_file), csv_file).flush()
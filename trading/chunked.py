@@ -0,0 +1,145 @@
+# Strategies run one block of stocks at a time, for price data larger than the memory.
+import os
+import shutil
+import tempfile
+import numpy as np
+import trading.backtest as backtest
+import trading.data as data
+import trading.indicators as stock_indicators
+import trading.process as proc
+
+def _open_prices(stock_prices):
+    '''
+    The price data as an array, memory-mapping it if it's a .npy file from data.convert_to_npy().
+    '''
+    if isinstance(stock_prices, str):
+        return data.read_price_file(stock_prices)[1]
+    return stock_prices.reshape(len(stock_prices), -1)
+
+def run_blocks(stock_prices, trade_block, block_columns=100, amount=5000, fees=20, ledger='ledger.txt'):
+    '''
+    Runs a strategy on blocks of block_columns stocks, one block at a time, and writes the ledger as it goes.
+    The strategies trade every stock independently, so this gives exactly the same ledger as running
+    on the whole data at once: the initial portfolio is written first, then the trades of each block
+    as soon as it is done, and the final sells (written aside to a temporary file, one per stock at most)
+    at the end.
+    Only one block of prices, its indicators and its transactions are in memory at a time,
+    when ledger is a path. An in-memory Ledger keeps all the transactions, as always.
+
+    Input:
+        stock_prices (ndarray or str): the stock price data, or the path to a price file
+            (a .npy file from data.convert_to_npy() is memory-mapped, so it is read a block at a time)
+        trade_block (callable): trade_block(backtest) computes the indicators on backtest.stock_prices
+            and trades them
+        block_columns (int, default 100): number of stocks in a block
+        amount (float, default 5000): how much we spend on each purchase (must cover fees)
+        fees (float, default 20): transaction fees
+        ledger (str or Ledger): path to the ledger file, or an in-memory Ledger
+
+    Output: None
+    '''
+    stock_prices = _open_prices(stock_prices)
+    n_stocks = stock_prices.shape[1]
+    if isinstance(ledger, proc.Ledger):
+        write = ledger.extend
+        final_sells = []
+        write_final_sells = final_sells.append
+    else:
+        # every block is written by a ledger of its own, so nothing stays in memory after it is written
+        def write(records):
+            proc.Ledger.from_records(records, ledger).flush()
+        final_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(ledger)), prefix='.final_sells_', delete=False)
+        final_file.close()
+        def write_final_sells(records):
+            proc.Ledger.from_records(records, final_file.name).flush()
+    try:
+        # The initial portfolio only needs the prices of day 0
+        initial = backtest.Backtest(np.asarray(stock_prices[:1]), amount, fees)
+        initial.buy(0, np.ones(n_stocks, dtype=bool), section=0)
+        write(initial.records())
+        for first in range(0, n_stocks, block_columns):
+            block = backtest.Backtest(np.asarray(stock_prices[:, first:first + block_columns]), amount, fees)
+            block.buy(0, np.ones(block.n_stocks, dtype=bool), section=0)
+            trade_block(block)
+            block.sell_everything()
+            # the stocks of a block are numbered from 0, put them back at their place in the data
+            trades = block.records(section=1)
+            trades['stock'] += first
+            write(trades)
+            sells = block.records(section=2)
+            sells['stock'] += first
+            write_final_sells(sells)
+        if isinstance(ledger, proc.Ledger):
+            ledger.extend(np.concatenate(final_sells))
+            ledger.flush()
+        else:
+            # copy the final sells at the end of the ledger, a piece of the file at a time
+            source = open(final_file.name, "r")
+            file = open(ledger, "a")
+            shutil.copyfileobj(source, file)
+            file.close()
+            source.close()
+    finally:
+        if not isinstance(ledger, proc.Ledger):
+            os.remove(final_file.name)
+
+def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', block_columns=100, *, sma_weights=[], fma_weights=[]):
+    '''
+        Same strategy and same ledger as strategy.crossing_averages(), run one block of stocks at a time
+        (see run_blocks()).
+
+        Input:
+            stock_prices (ndarray or str): the stock price data, or the path to a price file
+            sma_period (int, default 200): the SMA period (days)
+            fma_period (int, default 50): the FMA period (days)
+            weights (list, default []): deprecated, use sma_weights and fma_weights instead.
+                If specified, used as the weights of both the SMA and the FMA
+                (unless sma_weights or fma_weights is given).
+            amount (float, default 5000): how much we spend on each purchase
+                (must cover fees)
+            fees (float, default 20): transaction fees
+            ledger (str or Ledger): path to the ledger file, or an in-memory Ledger
+            block_columns (int, default 100): number of stocks in a block
+            sma_weights (list, default []): must be of length sma_period if specified. Indicates the weights
+                to use for the weighted SMA. If empty, the SMA is not weighted.
+            fma_weights (list, default []): must be of length fma_period if specified. Indicates the weights
+                to use for the weighted FMA. If empty, the FMA is not weighted.
+
+        Output: None
+    '''
+    sma_weights, fma_weights = backtest.crossing_weights(weights, sma_weights, fma_weights)
+    # check the weights before the first block, so that nothing is written if they are wrong
+    for n, period_weights in ((sma_period, sma_weights), (fma_period, fma_weights)):
+        if len(period_weights) and len(period_weights) != n:
+            print(f"Please specify {n} weights, one for each day of the period.")
+            return
+    def trade_block(block):
+        sma = stock_indicators.moving_average(block.stock_prices, sma_period, sma_weights)
+        fma = stock_indicators.moving_average(block.stock_prices, fma_period, fma_weights)
+        backtest.trade_crossing_averages(block, sma, fma)
+    run_blocks(stock_prices, trade_block, block_columns, amount, fees, ledger)
+
+def momentum(stock_prices, osc_type='stochastic', period=7, low_threshold=0.25, high_threshold=0.75, cool_down_period=14, amount=5000, fees=20, ledger='ledger_momentum.txt', block_columns=100):
+    '''
+        Same strategy and same ledger as strategy.momentum(), run one block of stocks at a time
+        (see run_blocks()).
+
+        Input:
+            stock_prices (ndarray or str): the stock price data, or the path to a price file
+            osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+            period (int, default 7): period of the oscillator (in days).
+            low_threshold (float, default 0.25):  The low threshold used for the oscilator
+            high_threshold (float, default 0.75): The high threshold used for the oscilator
+            cool_down_period (int, default 14): The cooldown period before making a new buy or sell order
+            amount (float, default 5000): how much we spend on each purchase
+                (must cover fees)
+            fees (float, default 20): transaction fees
+            ledger (str or Ledger): path to the ledger file, or an in-memory Ledger
+            block_columns (int, default 100): number of stocks in a block
+
+        Output: None
+    '''
+    def trade_block(block):
+        oscilator = stock_indicators.oscillator(block.stock_prices, n=period, osc_type=osc_type)
+        backtest.trade_momentum(block, oscilator, period, low_threshold, high_threshold, cool_down_period)
+    run_blocks(stock_prices, trade_block, block_columns, amount, fees, ledger)
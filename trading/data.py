@@ -1,69 +1,329 @@
 import numpy as np  # import numpy as np, because np was used directly.
-import matplotlib.pyplot as plt
-def generate_stock_price(days, initial_price, volatility):
+import trading.profiling as profiling
+def generate_stock_paths(days, initial_price, volatility, n_paths=1, chance=0.01, seed=None,
+                         correlation=None, loadings=None, market_chance=0.0, market_reach=1.0):
+    '''
+    Generates daily closing share prices for several companies and several
+    Monte Carlo paths at once, for a given number of days.
+
+    Input:
+        days (int): number of days to simulate (row 0 is the initial price)
+        initial_price (list): initial price for each stock
+        volatility (list): volatility for each stock
+        n_paths (int, default 1): number of independent paths per stock
+        chance (float, default 0.01): daily chance of a news event
+        seed (int, default None): seed for numpy's default_rng, for reproducible runs
+        correlation (ndarray, default None): (n_stocks, n_stocks) correlation matrix of the daily
+            increments. The independent increments are multiplied by its Cholesky factor,
+            in a single matrix product for all the days and paths.
+        loadings (ndarray, default None): (n_stocks, n_factors) factor loadings, used instead of
+            a correlation matrix. Each increment is the sum of the common factors times the loadings
+            of the stock, plus its own noise, so that two stocks have correlation
+            loadings[i] @ loadings[j] (the sum of the squared loadings of a stock must be at most 1).
+        market_chance (float, default 0.0): daily chance of a market-wide news event,
+            which sets the drift of many stocks at once, on top of their own news
+        market_reach (float, default 1.0): share of the stocks hit by each market-wide news event
+            (chosen at random for every event)
+
+    Output:
+        stock_prices (ndarray): array of shape (days, n_stocks, n_paths),
+            NaN from the first day the price goes non-positive.
+
+    Example:
+        1000 paths of 5 years for 2 stocks:
+            >>> paths = generate_stock_paths(1825, [150, 250], [1.8, 3.2], n_paths=1000, seed=42)
+
+        3 stocks with correlated prices, and market news 5 days a year on average:
+            >>> correlation = [[1, 0.6, 0.3], [0.6, 1, 0.3], [0.3, 0.3, 1]]
+            >>> paths = generate_stock_paths(1825, [150, 250, 80], [1.8, 3.2, 2], correlation=correlation,
+            ...                              market_chance=5 / 365, seed=42)
+    '''
+    initial_price = np.asarray(initial_price, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    n_stocks = len(initial_price)
+    shape = (days, n_stocks, n_paths)
+    rng = np.random.default_rng(seed)
+    # Draw all the random normal increments at once, there is no increment on day 0
+    increments = rng.normal(size=shape)
+    increments[0] = 0
+    # Draw the news arrivals for every day at once (no news on day 0, like the daily loop which starts at 1)
+    news_today = rng.random(shape) < chance
+    news_today[0] = False
+    # Only draw the drift and the duration for the days where we actually have news
+    news_days, news_stocks, news_paths = np.nonzero(news_today)
+    drifts = rng.normal(0, 2, len(news_days)) * volatility[news_stocks]
+    durations = rng.integers(3, 14, len(news_days))  # between 3 days and 2 weeks, so 3,14.
+    # Build the drift overlay. A news event on day t sets the drift for days t to t+duration-1,
+    # overwriting whatever an earlier event had set. So the drift on a given day comes from the most
+    # recent event still covering it. We write the lags from the longest to the shortest,
+    # so that the most recent event (smallest lag) is written last and wins.
+    total_drift = np.zeros(shape)
+    for lag in range(13, -1, -1):
+        covered = (durations > lag) & (news_days + lag < days)
+        total_drift[news_days[covered] + lag, news_stocks[covered], news_paths[covered]] = drifts[covered]
+    # The correlated increments are drawn after the news, so that without correlation
+    # the same seed gives the same prices as before
+    if correlation is not None or loadings is not None:
+        increments = correlate_increments(increments, rng, correlation, loadings)
+    if market_chance > 0:
+        total_drift += market_drift(days, volatility, n_paths, rng, market_chance, market_reach)
+    # Add the increments and the drift up over time, on top of the initial price
+    stock_prices = initial_price[:, None] + np.cumsum(increments + total_drift, axis=0)
+    # Once the price goes non-positive the company has failed, so it stays NaN from that day on
+    failed = np.logical_or.accumulate(stock_prices <= 0, axis=0)
+    stock_prices[failed] = np.nan
+    return stock_prices
+
+def correlate_increments(increments, rng, correlation=None, loadings=None):
+    '''
+    Turns independent standard normal increments into correlated ones, for all the days and paths at once.
+    Raises numpy.linalg.LinAlgError if the correlation matrix is not positive definite.
+
+    Input:
+        increments (ndarray): independent increments, of shape (days, n_stocks, n_paths)
+        rng (Generator): the random generator, to draw the common factors
+        correlation (ndarray, default None): (n_stocks, n_stocks) correlation matrix
+        loadings (ndarray, default None): (n_stocks, n_factors) factor loadings, if there is no correlation matrix
+
+    Output:
+        increments (ndarray): the correlated increments, same shape (still 0 on day 0)
+    '''
+    days, n_stocks, n_paths = increments.shape
+    # one row per day and path, one column per stock, so a single matrix product does every day
+    rows = increments.transpose(0, 2, 1).reshape(-1, n_stocks)
+    if correlation is not None:
+        factor = np.linalg.cholesky(np.asarray(correlation, dtype=float))
+        rows = rows @ factor.T
+    else:
+        loadings = np.asarray(loadings, dtype=float).reshape(n_stocks, -1)
+        # what the common factors don't explain is the stock's own noise, so each increment keeps variance 1
+        own = np.sqrt(np.clip(1 - (loadings ** 2).sum(axis=1), 0, None))
+        factors = rng.normal(size=(len(rows), loadings.shape[1]))
+        rows = factors @ loadings.T + rows * own
+    increments = rows.reshape(days, n_paths, n_stocks).transpose(0, 2, 1)
+    increments[0] = 0
+    return increments
+
+def market_drift(days, volatility, n_paths, rng, chance, reach=1.0):
+    '''
+    Drift overlay of the market-wide news: on a news day every stock hit gets a drift
+    (the same draw for all of them, times the volatility of each stock) for 3 days to 2 weeks,
+    until the next market news replaces it.
+
+    Input:
+        days (int): number of days
+        volatility (ndarray): volatility of each stock
+        n_paths (int): number of independent paths
+        rng (Generator): the random generator
+        chance (float): daily chance of a market-wide news event
+        reach (float, default 1.0): share of the stocks hit by each event
+
+    Output:
+        drift (ndarray): the drift of every stock, of shape (days, n_stocks, n_paths)
+    '''
+    news_today = rng.random((days, n_paths)) < chance
+    news_today[0] = False
+    news_days, news_paths = np.nonzero(news_today)
+    drifts = rng.normal(0, 2, len(news_days))
+    durations = rng.integers(3, 14, len(news_days))
+    # the stocks hit by each event
+    hit = rng.random((len(news_days), len(volatility))) < reach
+    # the most recent event covering each day, as for the news of a single stock (-1: no event)
+    event = np.full((days, n_paths), -1)
+    for lag in range(13, -1, -1):
+        covered = (durations > lag) & (news_days + lag < days)
+        event[news_days[covered] + lag, news_paths[covered]] = np.nonzero(covered)[0]
+    # append a last event with no drift, hitting no stock, for the days without one
+    drifts = np.append(drifts, 0)
+    hit = np.vstack([hit, np.zeros(len(volatility), dtype=bool)])
+    # (days, n_paths, n_stocks), then stocks before paths
+    drift = (drifts[event][:, :, None] * hit[event]) * volatility
+    return drift.transpose(0, 2, 1)
+
+def generate_stock_price(days, initial_price, volatility, seed=None):
     '''
     Generates daily closing share prices for a company,
     for a given number of days.
     '''
-    # Set stock_prices to be a zero array with length days
-    stock_prices = np.zeros(days)
-    # Set stock_prices in row 0 to be initial_price
-    stock_prices[0] = initial_price
-    # Set total_drift to be a zero array with length days
-    totalDrift = np.zeros(days + 14) # This might go out of bounds at some point
-    # For example, if on the last day we have a new news event with a duration
-    # that exceeds the total number of days, when we add the drift to the totaldrift array, it will go out of bounds
-    # since we try to add the drift on the days+1 element of the total drift array. By adding +14 in the number of days
-    # when we initialize the totalDrift array, we are sure that in case that happens,
-    # it won't cause an out of bounds error.
-    # Set up the default_rng from Numpy
-    rng = np.random.default_rng()
-    # Loop over a range(1, days)
-    for day in range(1, days):
-        # Get the random normal increment
-        inc = rng.normal()
-        # Add stock_prices[day-1] to inc to get NewPriceToday
-        NewPriceToday = stock_prices[day - 1] + inc # fix typo, not stock_price
-        # Make a function for the news
-        def news(chance, volatility):
-            '''
-            Simulate the news with %chance
-            '''
-            # Choose whether there's news today
-            news_today = rng.choice([0, 1], p=[1 - chance,chance])
-            # from numpy docs, p is a 1-d array with the probabilities of each outcome occuring,
-            # so for 0 or false it is 1-0.01 and for 1 or true it is 0.01
-            # https://numpy.org/doc/stable/reference/random/generated/numpy.random.Generator.choice.html
-            if news_today:
-                # Calculate m and drift
-                m = rng.normal(0,2)# instead of 0.3, m should be 2,
-                # because of the standard deviation which we know is 2**2.
-                drift = m * volatility
-                # Randomly choose the duration
-                duration = rng.integers(3, 14)  # should be between 3 days and 2 weeks from project descr., so 3,14.
-                final = np.zeros(duration)
-                for i in range(duration):
-                    final[i] = drift
-                return final
-            else:
-                return []  # wrong - return just an empty array instead. Quicker and less complex.
-                # Also, duration is out of scope and we get an error.
-        # Get the drift from the news
-        d = news(0.01, volatility)  # the chance should be 0.01 (1%) instead of 1
-        # Get the duration
-        duration = len(d)
-        # Add the drift to the next days
-        totalDrift[day:day + duration] = d  # might go out of bounds, that is why we set it +14 days when we define it
-        # Add today's drift to today's price
-        NewPriceToday += totalDrift[day]
-        # Set stock_prices[day] to NewPriceToday or to NaN if it's negative
-        if NewPriceToday <= 0:
-            stock_prices[day] = np.nan
-        else:
-            stock_prices[day] = NewPriceToday
-    return stock_prices
+    # A single path for a single stock from the batched simulator
+    return generate_stock_paths(days, [initial_price], [volatility], seed=seed)[:, 0, 0]
+
+def convert_to_npy(text_file="stock_data_5y.txt", npy_file=None):
+    '''
+    Converts a price text file (volatilities on the first row, then the prices every day)
+    to a binary .npy file which get_data() can memory-map, plus a small header file.
+    Only needs to be done once, the text file is not needed afterwards.
+
+    Input:
+        text_file (str, default "stock_data_5y.txt"): path to the text file
+        npy_file (str, default None): path to the .npy file to write
+            (default: the text file path with a .npy extension)
+
+    Output:
+        npy_file (str): path to the .npy file. The volatilities and initial prices are
+            written next to it, in the file returned by header_file(npy_file).
+
+    Example:
+        Convert once, then read only the columns needed:
+            >>> convert_to_npy("stock_data_5y.txt")
+            'stock_data_5y.npy'
+            >>> get_data(initial_price=[210, 58], data_file="stock_data_5y.npy")
+    '''
+    if npy_file is None:
+        npy_file = text_file.rsplit('.', 1)[0] + '.npy'
+    temp_array = np.loadtxt(text_file)
+    # Header: the volatilities (row 0) and the initial prices (row 1) of every stock
+    np.save(header_file(npy_file), temp_array[:2])
+    # Column-major (Fortran) order, so the prices of one stock are contiguous on disk
+    # and reading a few columns only reads those from the file
+    np.save(npy_file, np.asfortranarray(temp_array[1:]))
+    return npy_file
+
+def header_file(npy_file):
+    '''
+    Path of the header file (volatilities and initial prices) written next to npy_file.
+    '''
+    return npy_file[:-len('.npy')] + '_header.npy'
+
+def read_price_file(data_file="stock_data_5y.txt"):
+    '''
+    Reads a price file, either the text file or a .npy file from convert_to_npy().
+
+    Input:
+        data_file (str, default "stock_data_5y.txt"): path to the price file
 
-def get_data(method='read', initial_price=None, volatility=None):
+    Output:
+        header (ndarray): 2 rows with the volatility and the initial price of every stock
+        stock_prices (ndarray): the price data, one column per stock. For a .npy file this is
+            a read-only memory map, so nothing is read from the file until it is used.
+    '''
+    if data_file.endswith('.npy'):
+        return np.load(header_file(data_file)), np.load(data_file, mmap_mode='r')
+    # Parse the text file once, and split it into the header and the prices
+    temp_array = np.loadtxt(data_file)
+    return temp_array[:2], temp_array[1:]
+
+class HeaderIndex:
+    '''
+    Index over the header of a price file (volatilities and initial prices of every stock),
+    to find the closest stock to a given initial price and/or volatility.
+    The header is sorted once, then each lookup on one of them is a binary search (O(log N)).
+    A lookup on both is a binary search on the initial price among the stocks of each volatility,
+    only for the volatilities close enough to the one looked for.
+    On ties, the stock with the smallest column index is chosen.
+
+    Input:
+        header (ndarray): 2 rows with the volatility and the initial price of every stock,
+            as returned by read_price_file()
+
+    Example:
+        >>> header, stock_prices = read_price_file()
+        >>> HeaderIndex(header).nearest(initial_price=[210, 58])
+        array([3, 2])
+    '''
+    def __init__(self, header):
+        self.volatilities = np.asarray(header[0], dtype=float)
+        self.initial_prices = np.asarray(header[1], dtype=float)
+        # stable sort, so equal values stay in column order
+        self._volatility_order = np.argsort(self.volatilities, kind='stable')
+        self._price_order = np.argsort(self.initial_prices, kind='stable')
+        # by volatility, then by initial price, for the lookups on both (lexsort is stable too)
+        self._joint_order = np.lexsort((self.initial_prices, self.volatilities))
+        # scale of each row, so that prices and volatilities can be compared together
+        self._scales = np.array([self.volatilities.std() or 1.0, self.initial_prices.std() or 1.0])
+
+    def nearest(self, initial_price=None, volatility=None):
+        '''
+        Finds the column of the closest stock for every value given.
+
+        Input:
+            initial_price (list, default None): initial prices to look for
+            volatility (list, default None): volatilities to look for. If both are given
+                (same length), the closest in both is chosen, each scaled by its standard deviation.
+
+        Output:
+            indices (ndarray): the column index of the closest stock for each value
+        '''
+        if initial_price is not None and volatility is not None:
+            return self._nearest_joint(np.asarray(initial_price, dtype=float), np.asarray(volatility, dtype=float))
+        if initial_price is not None:
+            return self._nearest_sorted(self.initial_prices, self._price_order, np.asarray(initial_price, dtype=float))
+        return self._nearest_sorted(self.volatilities, self._volatility_order, np.asarray(volatility, dtype=float))
+
+    def _nearest_sorted(self, values, order, queries):
+        sorted_values = values[order]
+        last = len(sorted_values) - 1
+        # the closest value is either the first one above the query, or the one just below it
+        right = np.clip(np.searchsorted(sorted_values, queries), 0, last)
+        left = np.clip(right - 1, 0, last)
+        # go back to the first of a run of equal values, which has the smallest column index
+        left = np.searchsorted(sorted_values, sorted_values[left])
+        left_diff = np.abs(sorted_values[left] - queries)
+        right_diff = np.abs(sorted_values[right] - queries)
+        left_index = order[left]
+        right_index = order[right]
+        return np.where(left_diff < right_diff, left_index,
+                        np.where(right_diff < left_diff, right_index, np.minimum(left_index, right_index)))
+
+    def _nearest_joint(self, initial_price, volatility):
+        order = self._joint_order
+        volatilities = self.volatilities[order]
+        initial_prices = self.initial_prices[order]
+        # complex numbers are compared by their real part, then their imaginary part, so a binary search
+        # finds a (volatility, initial price) pair in the order of the stocks
+        keys = volatilities + 1j * initial_prices
+        # the runs of stocks with the same volatility
+        starts = np.flatnonzero(np.concatenate(([True], volatilities[1:] != volatilities[:-1])))
+        ends = np.append(starts[1:], len(order))
+        run_volatilities = volatilities[starts]
+        # From the volatility of each query, look at blocks of runs further and further away on both sides
+        # (twice as many every time), for all the queries at once, until the volatility alone is further
+        # than the best distance found (then nothing further on that side can be closer)
+        right = np.searchsorted(run_volatilities, volatility)
+        left = right - 1
+        best = np.full(len(initial_price), np.inf)
+        indices = np.zeros(len(initial_price), dtype=np.int64)
+        searching = {1: right < len(starts), -1: left >= 0}
+        block = 4
+        while searching[1].any() or searching[-1].any():
+            for step, positions in ((1, right), (-1, left)):
+                queries = np.flatnonzero(searching[step])
+                runs = positions[queries, None] + step * np.arange(block)
+                outside = (runs < 0) | (runs >= len(starts))
+                runs = np.clip(runs, 0, len(starts) - 1)
+                # in each run, the closest initial prices are the first one above the query and the one just below it
+                # (going back to the first of equal prices, which has the smallest column index),
+                # a run of one stock needs no search
+                candidates = starts[runs]
+                long = ends[runs] - starts[runs] > 1
+                if long.any():
+                    above = np.searchsorted(keys, run_volatilities[runs[long]] + 1j * np.broadcast_to(initial_price[queries, None], runs.shape)[long])
+                    below = candidates.copy()
+                    below[long] = np.searchsorted(keys, keys[np.maximum(above - 1, starts[runs[long]])])
+                    candidates[long] = np.minimum(above, ends[runs[long]] - 1)
+                    candidates = np.concatenate((candidates, below), axis=1)
+                    outside = np.concatenate((outside, outside), axis=1)
+                # the same scaled squared distance as over every stock, so that ties are the same
+                volatility_distance = ((volatilities[candidates] - volatility[queries, None]) / self._scales[0]) ** 2
+                distance = volatility_distance + ((initial_prices[candidates] - initial_price[queries, None]) / self._scales[1]) ** 2
+                distance[outside] = np.inf
+                columns = order[candidates]
+                # the closest of the block, with the smallest column index on ties
+                closest = distance.min(axis=1)
+                column = np.where(distance == closest[:, None], columns, len(order)).min(axis=1)
+                closer = (closest < best[queries]) | ((closest == best[queries]) & (column < indices[queries]))
+                best[queries[closer]] = closest[closer]
+                indices[queries[closer]] = column[closer]
+                positions[queries] += step * block
+                # keep going while the volatility distance equals the best one: a tie may have a smaller column index
+                searching[step][queries] = (~outside[:, block - 1] & ~(volatility_distance[:, block - 1] > best[queries])
+                                            & (positions[queries] >= 0) & (positions[queries] < len(starts)))
+            block *= 2
+        return indices
+
+@profiling.instrument('data.get_data')
+def get_data(method='read', initial_price=None, volatility=None, seed=None, data_file="stock_data_5y.txt",
+             correlation=None, loadings=None, market_chance=0.0, market_reach=1.0):
     '''
         Generates or reads simulation data for one or more stocks over 5 years,
         given their initial share price and volatility.
@@ -73,7 +333,7 @@ def get_data(method='read', initial_price=None, volatility=None):
                 If method is 'generate', use generate_stock_price() to generate
                     the data from scratch.
                 If method is 'read', use Numpy's loadtxt() to read the data
-                    from the file stock_data_5y.txt.
+                    from the file stock_data_5y.txt (or data_file).
 
             initial_price (list): list of initial prices for each stock (default None)
                 If method is 'generate', use these initial prices to generate the data.
@@ -85,6 +345,23 @@ def get_data(method='read', initial_price=None, volatility=None):
                 If method is 'read', choose the column in stock_data_5y.txt with the closest
                     volatility to each value in the list, and display an appropriate message.
 
+            seed (int, default None): seed for the random generator when method is 'generate'.
+
+            data_file (str, default "stock_data_5y.txt"): the file to read when method is 'read'.
+                Either the text file, or a .npy file written by convert_to_npy(), which is
+                memory-mapped so that only the requested columns are read.
+
+            correlation (ndarray, default None): correlation matrix of the daily price changes
+                of the stocks, when method is 'generate' (one row and one column per stock).
+
+            loadings (ndarray, default None): factor loadings of the stocks (one row per stock,
+                one column per factor) when method is 'generate', instead of a correlation matrix.
+
+            market_chance (float, default 0.0): daily chance of a market-wide news event,
+                hitting many stocks at once, when method is 'generate'.
+
+            market_reach (float, default 1.0): share of the stocks hit by each market-wide news event.
+
             If no arguments are specified, read price data from the whole file.
 
         Output:
@@ -103,6 +380,11 @@ def get_data(method='read', initial_price=None, volatility=None):
                 >>> get_data(method='generate', volatility=[3])
                 Please specify the initial price for each stock.
 
+            Returns an array with 2000 correlated columns (one common market factor),
+            with market-wide news 10 days a year on average:
+                >>> get_data(method='generate', initial_price=[100] * 2000, volatility=[2] * 2000,
+                ...          loadings=np.full((2000, 1), 0.5), market_chance=10 / 365)
+
             Returns an array with 2 columns and displays a message:
                 >>> get_data(method='read', initial_price=[210, 58])
                 Found data with initial prices [210, 100] and volatilities [1.2, 3.4].
@@ -112,10 +394,8 @@ def get_data(method='read', initial_price=None, volatility=None):
                 Found data with initial prices [380] and volatilities [5.2].
 
             If method is 'read' and both initial_price and volatility are specified,
-            volatility will be ignored (a message is displayed to indicate this):
+            choose the columns closest in both (each scaled by its spread over the file):
                 >>> get_data(initial_price=[210, 58], volatility=[5, 7])
-                Found data with initial prices [210, 100] and volatilities [1.2, 3.4].
-                Input argument volatility ignored.
 
             No arguments specified, all default values, returns price data for all stocks in the file:
                 >>> get_data()
@@ -129,80 +409,56 @@ def get_data(method='read', initial_price=None, volatility=None):
             if len(volatility) == 0:
                 print("Please specify the volatility for each stock.")
                 return
-        N = len(initial_price)
-        stock_prices = np.zeros((1825, N))
-        # Generating the initial price of the stock data for every company, one at a time
-        for i in range(N):
-            stock_prices[:, i] = generate_stock_price(1825, initial_price[i], volatility[i])
-        return stock_prices
+        n_stocks = len(initial_price)
+        if correlation is not None and np.shape(correlation) != (n_stocks, n_stocks):
+            print("Please specify a correlation matrix with one row and one column for each stock.")
+            return
+        if loadings is not None:
+            if len(loadings) != n_stocks:
+                print("Please specify the factor loadings of each stock.")
+                return
+            if np.any((np.asarray(loadings, dtype=float).reshape(n_stocks, -1) ** 2).sum(axis=1) > 1):
+                print("The sum of the squared factor loadings of a stock must be at most 1.")
+                return
+        # Generating the stock data for every company at once, as a single path
+        try:
+            return generate_stock_paths(1825, initial_price, volatility, seed=seed, correlation=correlation,
+                                        loadings=loadings, market_chance=market_chance,
+                                        market_reach=market_reach)[:, :, 0]
+        except np.linalg.LinAlgError:
+            print("The correlation matrix must be positive definite.")
+            return
     else:
-        # Load the txt in a temp_array, to search for the closest values
-        # Use numpy's loadtxt function to load the data, skipping the first row which are strings.
-        # Default delimiter is whitespace
-        temp_array = np.loadtxt("stock_data_5y.txt")
+        # Load the header (volatilities and initial prices) in a temp_array, to search for the closest values.
+        # For a .npy file the prices are only memory-mapped, nothing is read until we select the columns.
+        temp_array, all_prices = read_price_file(data_file)
 
-        volatilities = []
-        initial_prices = []
+        # Index the header once, then every lookup is a binary search
+        index = HeaderIndex(temp_array)
         indices = []
-        # if we are given an initial price array
-        if initial_price:
+        if initial_price and volatility:
+            # both given: the closest stock in (price, volatility) together
+            if len(initial_price) != len(volatility):
+                print("Please specify the same number of initial prices and volatilities.")
+                return
+            indices = index.nearest(initial_price=initial_price, volatility=volatility)
+        elif initial_price:
             # search based on the initial price
-            # search for every company in the initial_price array
-            for i in range(len(initial_price)):
-                # search in all the companies from the txt file,
-                # search only the 1st row for all columns (initial prices)
-                abs_diff = 500 # we set a big number of difference at first
-                closest_price = 0
-                closest_volatility = 0
-                index = 0
-                for j in range(temp_array.shape[1]):
-                    # loop over all the p0 values and check if one is closest than the previous one
-                    if abs(temp_array[1,j]-initial_price[i]) < abs_diff:
-                        # if the current difference is bigger than the current element we examine,
-                        # update the absolute difference variable and set the closest price & volatility we found,
-                        # and the index of that position
-                        abs_diff = abs(temp_array[1,j]-initial_price[i])
-                        closest_price = temp_array[1,j]
-                        closest_volatility = temp_array[0,j]
-                        index = j
-                # At this point we have found the closest initial value for one company,
-                # so we add the closest_price we found and volatility to the corresponding arrays.
-                initial_prices.append(closest_price)
-                volatilities.append(closest_volatility)
-                indices.append(index)
-            print(f"Found data with initial prices {initial_prices}, and volatilities {volatilities}")
-            # If we have an initial_prices array and a volatility array.
-            if volatility:
-                print("Input argument volatility ignored.")
-
-        # if we are given a volatility array:
-        # Will only run if we haven't specified initial_price
-        elif volatility and not initial_price:
-            # we set "and not initial_price" because if we are given both arrays,
-            # the code would run again after the first if.
-            # search based on the volatility and for every company
-            for i in range(len(volatility)):
-                # search in all the companies from the txt file
-                abs_diff = 500 # we set a big number of difference at first
-                closest_price = 0
-                closest_volatility = 0
-                index = 0
-                for j in range(temp_array.shape[1]):
-                    # same logic as before, except this time we are checking the volatility array
-                    if abs(temp_array[0,j]-volatility[i]) < abs_diff:
-                        abs_diff = abs(temp_array[0, j] - volatility[i])
-                        closest_volatility = temp_array[0, j]
-                        closest_price = temp_array[1, j]
-                        index = j
-                initial_prices.append(closest_price)
-                volatilities.append(closest_volatility)
-                indices.append(index)
-            print(f"Found data with initial prices {initial_prices}, and volatilities {volatilities}")
-        if len(volatilities) == 0 and len(initial_prices) == 0:
+            indices = index.nearest(initial_price=initial_price)
+        elif volatility:
+            # search based on the volatility
+            indices = index.nearest(volatility=volatility)
+        if len(indices):
+            print(f"Found data with initial prices {temp_array[1, indices].tolist()}, "
+                  f"and volatilities {temp_array[0, indices].tolist()}")
+        if len(indices) == 0:
             # the user didn't provide any input params
-            # return the initial array we used to search for the closest value to the user,
-            # but without the volatilities for every stock (skiprows =1)
-            return np.loadtxt("stock_data_5y.txt", skiprows=1)
+            # return the prices for every stock, without the volatilities
+            selected = all_prices
         else:
             #get the data with the specific indices of the closest initial prices or volatilities provided.
-           return np.loadtxt("stock_data_5y.txt", usecols=indices, skiprows=1)
\ No newline at end of file
+            selected = all_prices[:, indices]
+        # A single column is returned as a 1d array, like loadtxt() does
+        if selected.shape[1] == 1:
+            return selected[:, 0]
+        return selected
\ No newline at end of file
@@ -1,76 +1,509 @@
+import hashlib
+import os
+from collections import OrderedDict
 import numpy as np
+import trading.profiling as profiling
 
-def moving_average(stock_price, n=7, weights=[]):
+@profiling.instrument('indicators.moving_average')
+def moving_average(stock_price, n=7, weights=[], ma_type='simple', dtype=float):
     '''
     Calculates the n-day (possibly weighted) moving average for a given stock over time.
 
     Input:
         stock_price (ndarray): single column with the share prices over time for one stock,
-            up to the current day.
+            up to the current day, or a (days, stocks) matrix to compute every column at once.
         n (int, default 7): period of the moving average (in days).
         weights (list, default []): must be of length n if specified. Indicates the weights
-            to use for the weighted average. If empty, return a non-weighted average.
+            to use for the weighted average, from the oldest day of the window to the current day.
+            If empty, return a non-weighted average.
+        ma_type (str, default 'simple'): 'simple' for the (possibly weighted) average over the window,
+            or 'exponential' for an exponential moving average with smoothing 2 / (n + 1),
+            started from the simple average of the first n days. weights is ignored for 'exponential'.
+        dtype (data-type, default float): use np.float32 to halve the memory of the prices and of the averages
+            on large universes. The simple average is still summed in float64 (so it is the float64 average
+            of the float32 prices, rounded to float32), the weighted and exponential ones are computed in dtype.
 
     Output:
-        ma (ndarray): the n-day (possibly weighted) moving average of the share price over time.
+        ma (ndarray): the n-day (possibly weighted) moving average of the share price over time,
+            starting on day n-1 (one column per stock if stock_price is a matrix).
     '''
-    # If we are given am array of weights, multiply it with the stock price
+    stock_price = np.asarray(stock_price, dtype=dtype)
+    if ma_type == 'exponential':
+        alpha = 2 / (n + 1)
+        ma = np.empty(stock_price[n - 1:].shape, dtype=dtype)
+        ma[0] = stock_price[:n].mean(axis=0)
+        # The recursion is sequential in time, but each step updates every column at once
+        for i in range(1, len(ma)):
+            ma[i] = alpha * stock_price[n - 1 + i] + (1 - alpha) * ma[i - 1]
+        return ma
+    # If we are given an array of weights, convolve them over every window of n days
     if len(weights):
-        stock_price = np.multiply(stock_price, weights)
+        weights = np.asarray(weights, dtype=dtype)
+        if len(weights) != n:
+            print(f"Please specify {n} weights, one for each day of the period.")
+            return
+        windows = np.lib.stride_tricks.sliding_window_view(stock_price, n, axis=0)
+        return windows @ weights / weights.sum()
     # Used cumsum implementation from
     # https://stackoverflow.com/questions/14313510/how-to-calculate-moving-average-using-numpy/54628145
-    ret = np.cumsum(stock_price, dtype=float)
+    # cumsum along axis 0 so that every column of a matrix is done at once
+    # The running sum is always accumulated in float64: over years of prices a float32 sum
+    # loses several digits, and the difference of two of them even more. Only the result is cast to dtype.
+    ret = np.cumsum(stock_price, axis=0, dtype=np.float64)
     ret[n:] = ret[n:] - ret[:-n]
-    return ret[n - 1:] / n
+    return (ret[n - 1:] / n).astype(dtype, copy=False)
 
+@profiling.instrument('indicators.oscillator')
 def oscillator(stock_price, n=7, osc_type='stochastic'):
     '''
     Calculates the level of the stochastic or RSI oscillator with a period of n days.
 
     Input:
         stock_price (ndarray): single column with the share prices over time for one stock,
-            up to the current day.
+            up to the current day, or a (days, stocks) matrix to compute every column at once.
         n (int, default 7): period of the moving average (in days).
         osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
 
     Output:
-        osc (ndarray): the oscillator level with period $n$ for the stock over time.
+        osc (ndarray): the oscillator level with period $n$ for the stock over time
+            (one column per stock if stock_price is a matrix).
     '''
+    stock_price = np.asarray(stock_price, dtype=float)
+    loop_times = len(stock_price) - n
     if osc_type == 'stochastic':
-        loop_times = len(stock_price) - n
-        stochastic = np.zeros(loop_times)
-        for i in range(loop_times):
-            # from -7 days to the current day we examine in the array.
-            # calculate the max and min of the stock price from i (current date we examine) to i+n (i+ 7 days)
-            maximum = max(stock_price[i:i + n])
-            minimum = min(stock_price[i:i + n])
-            delta = stock_price[i + n - 1] - minimum
-            delta_max = maximum - minimum
-            # Add the final value to the stochastic array
-            stochastic[i] = (delta / delta_max)
+        # All the windows from i (current date we examine) to i+n (i+ 7 days) as a view,
+        # the window is the last axis so this works for one column or for a matrix
+        windows = np.lib.stride_tricks.sliding_window_view(stock_price, n, axis=0)[:loop_times]
+        maximum = windows.max(axis=-1)
+        minimum = windows.min(axis=-1)
+        delta = stock_price[n - 1:n - 1 + loop_times] - minimum
+        delta_max = maximum - minimum
+        # A flat window gives 0/0 = nan, like the division of the daily loop did
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stochastic = delta / delta_max
         return stochastic
     else:
-        loop_times = len(stock_price) - n
-        rsi = np.zeros(loop_times)
-        for i in range(loop_times):
-            # get differences for consecutive days
-            diffs = np.diff(stock_price[i:n + i])
-            # split differences to positives and negatives
-            positives = [n for n in diffs if n > 0]
-            negatives = [n for n in diffs if n < 0]
-            # calculate averages from the positives and negatives
-            #If either the positives or the negatives array is empty,
-            # this yields an error when calculating tha averages, so set to nan.
-            if not len(positives):
-                positives = np.nan
-            if not len(negatives):
-                negatives = np.nan
-            avgs_positive = np.average(positives)
-            avgs_negatives = abs(np.average(negatives))
-            rs = float(avgs_positive) / float(avgs_negatives)
-            # after additional information from correction.md:
-            if np.isnan(rs):
-                rs = 0
-            # Add the final calculation to the rsi array
-            rsi[i] = (1 - 1 / (1 + rs))
-        return rsi
\ No newline at end of file
+        # get differences for consecutive days
+        diffs = np.diff(stock_price, axis=0)
+        if loop_times <= 0:
+            return np.zeros((0,) + diffs.shape[1:])
+        # the n-1 differences of the window starting at i, for every window, on the first axis
+        # (the k-th difference of every window is the contiguous slice diffs[k:k + loop_times])
+        windows = np.moveaxis(np.lib.stride_tricks.sliding_window_view(diffs, n - 1, axis=0)[:loop_times], -1, 0)
+        rsi = np.empty(windows.shape[1:])
+        # a few windows at a time, so the arrays stay in the cache
+        step = max(1, 2 ** 16 // max(1, diffs[0].size))
+        for first in range(0, loop_times, step):
+            rsi[first:first + step] = rsi_windows(windows[:, first:first + step])
+        return rsi
+
+def rsi_windows(diffs):
+    '''
+    Calculates the RSI of windows of daily price differences, with exactly the rounding of the daily loop
+    that averaged the gains and the losses of each window with np.average.
+    Sums over the whole series (cumulative sums) would round differently, and prices with 2 decimals
+    give many RSI values right on the thresholds, where the slightest rounding flips a decision.
+
+    Input:
+        diffs (ndarray): the differences of the consecutive prices in each window, on the first axis
+            (oldest first), with any number of windows on the other axes
+
+    Output:
+        rsi (ndarray): the RSI of every window (the shape of diffs without its first axis)
+    '''
+    averages = []
+    for kept in (diffs > 0, diffs < 0):
+        # split differences to positives and negatives
+        values = np.where(kept, diffs, 0)
+        counts = kept.sum(axis=0)
+        # np.average adds the values up in an order that depends on how many there are: one by one
+        # when there are fewer than 8, which adding the zeros left in between doesn't change
+        totals = np.zeros(diffs.shape[1:])
+        for value in values:
+            totals += value
+        # and in 8 partial sums otherwise (pairwise summation)
+        many = np.flatnonzero(counts.reshape(-1) >= 8)
+        if len(many):
+            totals.reshape(-1)[many] = _pairwise_sums(values.reshape(len(diffs), -1)[:, many],
+                                                      kept.reshape(len(diffs), -1)[:, many], counts.reshape(-1)[many])
+        # no positives (or negatives) gives 0/0 = nan, like the average of an empty window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages.append(totals / counts)
+    # after additional information from correction.md: if either average is nan, rs is set to 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = averages[0] / np.abs(averages[1])
+    rs[np.isnan(rs)] = 0
+    return 1 - 1 / (1 + rs)
+
+def _pairwise_sums(values, kept, counts):
+    '''
+    Sums of the kept values of every window (on the first axis of values), in the same order as
+    np.add.reduce on an array of just those values, when there are 8 of them or more:
+    8 partial sums over the whole blocks of 8 values (the k-th kept value goes to the partial sum k % 8),
+    added in pairs, then the values left over one by one.
+    Over 128 values, np.add.reduce first splits them in two halves, so those are left to it.
+    '''
+    if len(values) > 128:
+        sums = np.empty(counts.shape)
+        for index in np.ndindex(counts.shape):
+            sums[index] = np.add.reduce(values[(slice(None),) + index][kept[(slice(None),) + index]])
+        return sums
+    size = counts.size
+    whole = (counts - counts % 8).reshape(-1)
+    # 15 sums per window: the 8 partial sums and the 7 values left over
+    # (a value not kept is 0, adding it to any of them changes nothing)
+    sums = np.zeros(15 * size)
+    ranks = np.full(size, -1)
+    offsets = np.arange(size) * 15
+    for value, keep in zip(values, kept):
+        ranks += keep.reshape(-1)
+        slots = np.where(ranks < whole, ranks & 7, ranks - whole + 8)
+        sums[offsets + slots] += value.reshape(-1)
+    sums = sums.reshape(size, 15).T
+    total = ((sums[0] + sums[1]) + (sums[2] + sums[3])) + ((sums[4] + sums[5]) + (sums[6] + sums[7]))
+    for left_over in sums[8:15]:
+        total += left_over
+    return total.reshape(counts.shape)
+
+@profiling.instrument('indicators.cool_down')
+def cool_down(signal, cool_down_period=14):
+    '''
+    Applies the cool down rule of the momentum strategy to a signal: a day where the signal is on
+    leads to a trade only if it comes more than cool_down_period days after the last trade
+    (and, as in the daily loop of momentum(), never on day 0).
+    Only the days where the signal is on are visited, jumping straight from one trade to the first
+    signal after its cool down period, so the cost grows with the number of trades, not of days.
+
+    Input:
+        signal (ndarray): boolean array of the days where the threshold is crossed,
+            a single column for one stock or a (days, stocks) matrix to handle every column at once.
+        cool_down_period (int, default 14): the number of days to wait after a trade
+
+    Output:
+        trades (ndarray): boolean array with the same shape as signal, True on the days we trade.
+
+    Example:
+        The days where the stochastic oscillator of every stock leads to a buy:
+            >>> buys = cool_down(oscillator(sim_data) <= 0.25, 14)
+    '''
+    signal = np.asarray(signal, dtype=bool)
+    columns = signal if signal.ndim == 2 else signal[:, np.newaxis]
+    days = len(columns)
+    trades = np.zeros(columns.shape, dtype=bool)
+    # The candidate days of every stock, sorted by stock then day, as one key per candidate
+    # (stride is larger than any day, so the keys of different stocks never overlap)
+    stride = days + 1
+    stocks, candidates = np.nonzero(columns.T)
+    keys = stocks.astype(np.int64) * stride + candidates
+    # Walk the trades of all stocks together, one trade per stock at each step
+    active = np.arange(columns.shape[1])
+    revisit = np.zeros(columns.shape[1], dtype=np.int64)
+    position = np.full(columns.shape[1], -1, dtype=np.int64)
+    while active.size:
+        # the first candidate after the revisit day (clipped so it stays within the stock's keys)
+        target = active * stride + np.clip(revisit[active], -1, days)
+        found = np.searchsorted(keys, target, side='right')
+        # always move forward, even if the cool down period is negative
+        found = np.maximum(found, position[active] + 1)
+        # stop the stocks which have no candidate left
+        valid = found < len(keys)
+        valid[valid] = stocks[found[valid]] == active[valid]
+        active = active[valid]
+        found = found[valid]
+        trades[candidates[found], active] = True
+        revisit[active] = candidates[found] + cool_down_period
+        position[active] = found
+    return trades.reshape(signal.shape)
+
+class StreamingMovingAverage:
+    '''
+    Moving average updated one day at a time, for live data.
+    Gives the same values as moving_average() on the full history, but each update is O(1)
+    for the simple and exponential averages (O(n) for the weighted one).
+
+    Input:
+        n_stocks (int): number of stocks in each update
+        n (int, default 7): period of the moving average (in days).
+        weights (list, default []): weights for a weighted average, as in moving_average().
+        ma_type (str, default 'simple'): 'simple' or 'exponential', as in moving_average().
+
+    Example:
+        Update the 50-day moving average with every new close:
+            >>> sma = StreamingMovingAverage(N, n=50)
+            >>> for day in range(len(stock_prices)):
+            ...     ma_today = sma.update(stock_prices[day])
+    '''
+    def __init__(self, n_stocks, n=7, weights=[], ma_type='simple'):
+        # there is no average to return None for, so a wrong number of weights is an error here
+        if len(weights) and len(weights) != n:
+            raise ValueError(f"Please specify {n} weights, one for each day of the period.")
+        self.n = n
+        self.ma_type = ma_type
+        self.weights = np.asarray(weights, dtype=float)
+        # number of days seen so far
+        self.day = 0
+        self.value = None
+        # ring buffer with the last n prices (weighted, and the first n days of the exponential)
+        # or the last n cumulative sums (simple)
+        self._buffer = np.zeros((n, n_stocks))
+        self._cumsum = np.zeros(n_stocks)
+
+    def update(self, new_prices):
+        '''
+        Adds the prices of a new day for every stock.
+
+        Input:
+            new_prices (ndarray): the prices of the new day, one per stock
+
+        Output:
+            ma (ndarray): today's moving average for every stock,
+                or None for the first n-1 days when it isn't defined yet.
+        '''
+        new_prices = np.asarray(new_prices, dtype=float)
+        day = self.day
+        self.day += 1
+        if self.ma_type == 'exponential':
+            if day < self.n:
+                self._buffer[day] = new_prices
+                if day == self.n - 1:
+                    # start from the simple average of the first n days
+                    self.value = self._buffer.mean(axis=0)
+            else:
+                alpha = 2 / (self.n + 1)
+                self.value = alpha * new_prices + (1 - alpha) * self.value
+            return self.value
+        if len(self.weights):
+            self._buffer[day % self.n] = new_prices
+            if day < self.n - 1:
+                return None
+            # the window in order, from the oldest day to today
+            window = self._buffer[(day + 1 + np.arange(self.n)) % self.n]
+            self.value = window.T @ self.weights / self.weights.sum()
+            return self.value
+        # Same running cumulative sum as the cumsum in moving_average(),
+        # the sum of the window is today's cumulative sum minus the one from n days ago
+        self._cumsum = self._cumsum + new_prices
+        slot = day % self.n
+        if day >= self.n:
+            self.value = (self._cumsum - self._buffer[slot]) / self.n
+        elif day == self.n - 1:
+            self.value = self._cumsum / self.n
+        self._buffer[slot] = self._cumsum
+        return self.value
+
+class StreamingOscillator:
+    '''
+    Stochastic or RSI oscillator updated one day at a time, for live data.
+    Gives the same values as oscillator() on the full history: the value returned on day t
+    is the one for the window of the n days up to day t.
+    The stochastic oscillator keeps a monotonic deque per stock for the max and the min of the window,
+    so each of its updates is O(1) (amortized), and the RSI keeps the differences of the last n-1 days
+    and adds them up again every day (O(n)), in the same order as the daily loop did.
+    The deques of all the stocks are held in arrays and updated together, without any loop over the stocks.
+
+    Input:
+        n_stocks (int): number of stocks in each update
+        n (int, default 7): period of the oscillator (in days).
+        osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+
+    Example:
+        Update the 14-day RSI with every new close:
+            >>> rsi = StreamingOscillator(N, n=14, osc_type='RSI')
+            >>> for day in range(len(stock_prices)):
+            ...     rsi_today = rsi.update(stock_prices[day])
+    '''
+    def __init__(self, n_stocks, n=7, osc_type='stochastic'):
+        self.n = n
+        self.n_stocks = n_stocks
+        self.osc_type = osc_type
+        # number of days seen so far
+        self.day = 0
+        self.value = None
+        # stochastic: monotonic (day, price) deques, one per stock for the max of the prices
+        # and one per stock for the max of the negated prices (the min). Each deque is a ring of n slots
+        # in a column of these arrays, starting at its head, with its length
+        self._days = np.zeros((n, 2 * n_stocks), dtype=np.int64)
+        self._prices = np.zeros((n, 2 * n_stocks))
+        self._head = np.zeros(2 * n_stocks, dtype=np.int64)
+        self._length = np.zeros(2 * n_stocks, dtype=np.int64)
+        self._columns = np.arange(2 * n_stocks)
+        # last day with a NaN price, the window is NaN while it is in it
+        self._last_nan = np.full(n_stocks, -n)
+        # RSI: a ring buffer with the differences of the last n-1 days
+        self._last_prices = None
+        self._diffs = np.zeros((max(n - 1, 1), n_stocks))
+
+    def update(self, new_prices):
+        '''
+        Adds the prices of a new day for every stock.
+
+        Input:
+            new_prices (ndarray): the prices of the new day, one per stock
+
+        Output:
+            osc (ndarray): today's oscillator level for every stock,
+                or None for the first n-1 days when it isn't defined yet.
+        '''
+        new_prices = np.asarray(new_prices, dtype=float)
+        day = self.day
+        self.day += 1
+        if self.osc_type == 'stochastic':
+            return self._update_stochastic(day, new_prices)
+        return self._update_rsi(day, new_prices)
+
+    def _update_stochastic(self, day, new_prices):
+        n, columns, head, length = self.n, self._columns, self._head, self._length
+        # the deques of the max and of the min are updated together, the min as the max of -price
+        values = np.concatenate((new_prices, -new_prices))
+        priced = ~np.isnan(values)
+        self._last_nan[np.isnan(new_prices)] = day
+        # drop the day that has left the window (only the oldest one can)
+        expired = (length > 0) & (self._days[head, columns] <= day - n)
+        head[expired] = (head[expired] + 1) % n
+        length[expired] -= 1
+        # drop the prices that can never be the max again: the deques are decreasing, so they are
+        # the ones from the first price <= today's, found by a binary search in every deque at once
+        low = np.zeros(len(columns), dtype=np.int64)
+        high = length.copy()
+        searching = low < high
+        while searching.any():
+            middle = (low + high) // 2
+            goes = self._prices[(head + middle) % n, columns] <= values
+            high = np.where(searching & goes, middle, high)
+            low = np.where(searching & ~goes, middle + 1, low)
+            searching = low < high
+        length[priced] = low[priced]
+        # and add today's price at the back
+        back = (head[priced] + length[priced]) % n
+        self._days[back, columns[priced]] = day
+        self._prices[back, columns[priced]] = values[priced]
+        length[priced] += 1
+        if day < n - 1:
+            return None
+        # the max is at the head of each deque
+        front = self._prices[head, columns]
+        maximum = front[:self.n_stocks]
+        minimum = -front[self.n_stocks:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.value = (new_prices - minimum) / (maximum - minimum)
+        self.value[day - self._last_nan < n] = np.nan
+        return self.value
+
+    def _update_rsi(self, day, new_prices):
+        if self._last_prices is not None:
+            self._diffs[(day - 1) % len(self._diffs)] = new_prices - self._last_prices
+        self._last_prices = new_prices
+        if day < self.n - 1:
+            return None
+        # the n-1 differences of the window, oldest first (the ring starts after the newest one)
+        order = (day + np.arange(self.n - 1)) % (self.n - 1)
+        self.value = rsi_windows(self._diffs[order])
+        return self.value
+
+class IndicatorCache:
+    '''
+    Cache for indicators, so that rerunning strategies on the same prices with the same periods
+    doesn't compute them again. Entries are keyed by a hash of the price data and the parameters,
+    the least recently used ones are evicted once the cache is over its byte budget, and they can
+    also be saved as .npy files in a directory, which keeps them across restarts.
+    The arrays returned are read-only, since they are shared between callers.
+
+    Input:
+        max_bytes (int, default 128 MiB): memory budget for the cached arrays
+        directory (str, default None): directory for the on-disk tier (no disk tier if None)
+
+    Nothing is cached unless a cache is created and passed to the strategies (cache=...).
+    clear() frees the memory it holds, and the files of the disk tier can simply be deleted.
+
+    Example:
+        >>> cache = IndicatorCache(max_bytes=2 ** 30, directory='indicator_cache')
+        >>> sma = cache.moving_average(stock_prices, 200)
+        >>> sma = cache.moving_average(stock_prices, 200)  # from the cache
+        >>> cache.stats()
+        {'hits': 1, 'misses': 1, 'disk_hits': 0, 'entries': 1, 'bytes': 58200}
+
+        Share the indicators between strategy runs on the same prices, then free the memory:
+        >>> strategy.crossing_averages(stock_prices, 200, 50, cache=cache)
+        >>> strategy.crossing_averages(stock_prices, 200, 20, cache=cache)  # the SMA is reused
+        >>> cache.clear()
+    '''
+    def __init__(self, max_bytes=128 * 2 ** 20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def moving_average(self, stock_price, n=7, weights=[], ma_type='simple', dtype=float):
+        '''
+        moving_average() through the cache.
+        '''
+        key = self.key(stock_price, 'moving_average', n, tuple(np.asarray(weights, dtype=float).tolist()),
+                       ma_type, np.dtype(dtype).str)
+        return self._get(key, lambda: moving_average(stock_price, n, weights, ma_type, dtype))
+
+    def oscillator(self, stock_price, n=7, osc_type='stochastic'):
+        '''
+        oscillator() through the cache.
+        '''
+        key = self.key(stock_price, 'oscillator', n, osc_type)
+        return self._get(key, lambda: oscillator(stock_price, n, osc_type))
+
+    @staticmethod
+    def key(stock_price, *parameters):
+        '''
+        Key of an indicator: a hash of the price data (its bytes, shape and type) and of the parameters.
+        '''
+        stock_price = np.ascontiguousarray(stock_price)
+        digest = hashlib.blake2b(stock_price.view(np.uint8).reshape(-1), digest_size=16)
+        digest.update(repr((stock_price.shape, stock_price.dtype.str, parameters)).encode())
+        return digest.hexdigest()
+
+    def _get(self, key, compute):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        path = None if self.directory is None else os.path.join(self.directory, key + '.npy')
+        if path is not None and os.path.exists(path):
+            self.disk_hits += 1
+            value = np.load(path)
+        else:
+            self.misses += 1
+            value = compute()
+            if value is None:
+                return None
+            if path is not None:
+                np.save(path, value)
+        value.setflags(write=False)
+        self._put(key, value)
+        return value
+
+    def _put(self, key, value):
+        # an array bigger than the whole budget is not kept in memory
+        if value.nbytes > self.max_bytes:
+            return
+        self._entries[key] = value
+        self.bytes += value.nbytes
+        # evict the least recently used entries until we are back within the budget
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+
+    def stats(self):
+        '''
+        Hit and miss counters, and the number and size of the entries in memory.
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                'entries': len(self._entries), 'bytes': self.bytes}
+
+    def clear(self):
+        '''
+        Empties the memory tier (the files of the disk tier are kept).
+        '''
+        self._entries.clear()
+        self.bytes = 0
@@ -0,0 +1,347 @@
+# Paper trading: drives the strategies from a live stream of daily prices with asyncio,
+# updating the indicators one bar at a time and writing the ledger in the background.
+# Run with:
+#     python -m trading.live --strategy momentum --bars-per-second 50 --ledger ledger_live.txt
+import argparse
+import asyncio
+import sys
+import time
+from collections import deque
+import numpy as np
+import trading.data as data
+import trading.indicators as stock_indicators
+import trading.process as proc
+
+async def replay(stock_prices=None, data_file="stock_data_5y.txt", bars_per_second=None):
+    '''
+    Replays price data as a live feed, one bar (day) at a time.
+
+    Input:
+        stock_prices (ndarray, default None): the stock price data, read from data_file if None
+        data_file (str, default "stock_data_5y.txt"): the price file to replay (text or .npy)
+        bars_per_second (float, default None): speed of the replay, as fast as possible if None
+
+    Output:
+        an async iterator of (date, prices) pairs, with the prices of every stock on that date
+
+    Example:
+        >>> async for date, prices in replay(bars_per_second=10):
+        ...     print(date, prices[0])
+    '''
+    if stock_prices is None:
+        header, stock_prices = data.read_price_file(data_file)
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for date in range(len(stock_prices)):
+        if bars_per_second:
+            # keep to the schedule, even if a bar took longer to handle
+            await asyncio.sleep(max(0.0, start + date / bars_per_second - loop.time()))
+        else:
+            # still give the other tasks (e.g. the ledger writer) a chance to run
+            await asyncio.sleep(0)
+        yield date, np.array(stock_prices[date], dtype=float)
+
+async def serve(stock_prices, host='127.0.0.1', port=0, bars_per_second=None):
+    '''
+    Starts a local TCP server replaying the prices to every client that connects,
+    one line per bar: the date, then the price of every stock (repr, so floats are exact).
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        host (str, default '127.0.0.1'), port (int, default 0 for any free port): where to listen
+        bars_per_second (float, default None): speed of the replay, as fast as possible if None
+
+    Output:
+        server (asyncio.Server): the running server, its port is server.sockets[0].getsockname()[1]
+    '''
+    async def send_prices(reader, writer):
+        try:
+            async for date, prices in replay(stock_prices, bars_per_second=bars_per_second):
+                writer.write((str(date) + ' ' + ' '.join(map(repr, prices.tolist())) + '\n').encode())
+                # wait if the client is slower than the feed
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(send_prices, host, port)
+
+async def socket_feed(host='127.0.0.1', port=8765):
+    '''
+    Reads a live feed from a TCP server sending one line per bar, in the format of serve().
+
+    Output:
+        an async iterator of (date, prices) pairs
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            fields = line.split()
+            yield int(fields[0]), np.array(fields[1:], dtype=float)
+    finally:
+        writer.close()
+
+class _LatestPrices:
+    '''
+    The prices of the current bar, indexed like a full price matrix: proc.buy() and proc.sell()
+    only read stock_prices[date, stock] for the date they trade on, so the latest bar is enough.
+    '''
+    ndim = 2
+
+    def __init__(self):
+        self.date = None
+        self.prices = None
+
+    @property
+    def shape(self):
+        return (self.date + 1, len(self.prices))
+
+    def __getitem__(self, index):
+        date, stock = index
+        if date != self.date:
+            raise IndexError(f"Only the prices of day {self.date} are available, not day {date}")
+        return self.prices[stock]
+
+class LedgerWriter:
+    '''
+    Writes the transactions of an in-memory Ledger to a ledger file in the background,
+    every interval seconds, so that the trading loop never waits for the disk.
+    The lines are formatted and written in a worker thread, in the same format as log_transaction().
+
+    Input:
+        ledger (Ledger): the in-memory ledger the trades are logged in
+        ledger_file (str): path to the ledger file
+        interval (float, default 1.0): seconds between two writes
+    '''
+    def __init__(self, ledger, ledger_file, interval=1.0):
+        self.ledger = ledger
+        self.ledger_file = ledger_file
+        self.interval = interval
+        # number of transactions already handed to the writing thread
+        self._written = 0
+        self._closed = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._write_periodically())
+
+    async def _write_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._closed.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            # checked before writing, so that the last write starts after close() and has every transaction
+            closed = self._closed.is_set()
+            # a single task writes, so the writes are never reordered
+            await self._write()
+            if closed:
+                return
+
+    async def _write(self):
+        # copy the new records in the event loop, the ledger keeps growing while the thread writes
+        records = self.ledger.records[self._written:].copy()
+        self._written += len(records)
+        if len(records):
+            await asyncio.get_running_loop().run_in_executor(
+                None, proc.Ledger.from_records(records, self.ledger_file).flush)
+
+    async def close(self):
+        '''
+        Writes the last transactions and stops the writer.
+        '''
+        self._closed.set()
+        await self._task
+
+class _Trader:
+    '''
+    What the live strategies have in common: the portfolio, bought on the first day of the feed,
+    the prices of the current bar and the final sells.
+    '''
+    def __init__(self, n_stocks, amount, fees, ledger):
+        self.n_stocks = n_stocks
+        self.amount = amount
+        self.fees = fees
+        self.ledger = ledger
+        self.stock_prices = _LatestPrices()
+        self.portfolio = None
+
+    def _new_bar(self, date, prices):
+        self.stock_prices.date = date
+        self.stock_prices.prices = prices
+        if self.portfolio is None:
+            self.portfolio = proc.create_portfolio([self.amount] * self.n_stocks, self.stock_prices, self.fees, self.ledger)
+
+    def _trade(self, date, buys, sells):
+        # buy before sell, as the strategies do on the same day
+        for j in np.flatnonzero(buys).tolist():
+            proc.buy(date, j, self.amount, self.stock_prices, self.fees, self.portfolio, self.ledger)
+        for j in np.flatnonzero(sells).tolist():
+            proc.sell(date, j, self.stock_prices, self.fees, self.portfolio, self.ledger)
+
+    def close(self):
+        '''
+        Sells everything we still hold, on the last day of the feed.
+        '''
+        if self.portfolio is None:
+            return
+        for j in range(self.n_stocks):
+            if self.portfolio[j] != 0:
+                proc.sell(self.stock_prices.date, j, self.stock_prices, self.fees, self.portfolio, self.ledger)
+
+class CrossingAveragesTrader(_Trader):
+    '''
+    crossing_averages() on a live feed: the SMA and FMA are updated with every bar,
+    and the same buy and sell decisions are made as in crossing_averages().
+    crossing_averages() compares sma[i] and fma[i] and trades on day i, but the averages with index i
+    are only known on day i + max(sma_period, fma_period) - 1, so live, the trade is made on that day,
+    at that day's price.
+
+    Input:
+        n_stocks (int): number of stocks in the feed
+        sma_period, fma_period, sma_weights, fma_weights, amount, fees: as in crossing_averages()
+        ledger (Ledger): the ledger to log the transactions in
+    '''
+    def __init__(self, n_stocks, sma_period=200, fma_period=50, sma_weights=[], fma_weights=[], amount=5000, fees=20, ledger=None):
+        _Trader.__init__(self, n_stocks, amount, fees, ledger)
+        self._sma = stock_indicators.StreamingMovingAverage(n_stocks, sma_period, sma_weights)
+        self._fma = stock_indicators.StreamingMovingAverage(n_stocks, fma_period, fma_weights)
+        # The average with the shorter period is known first, keep it until the longer one is known too
+        longest = max(sma_period, fma_period)
+        self._sma_values = deque(maxlen=longest - sma_period + 1)
+        self._fma_values = deque(maxlen=longest - fma_period + 1)
+        # True while we hold the stock, as the crossing_indicator of crossing_averages()
+        self._crossing_indicator = np.ones(n_stocks, dtype=bool)
+
+    def on_bar(self, date, prices):
+        '''
+        Updates the averages with the prices of a new day, and trades.
+        '''
+        self._new_bar(date, prices)
+        sma = self._sma.update(prices)
+        fma = self._fma.update(prices)
+        if sma is not None:
+            self._sma_values.append(sma.copy())
+        if fma is not None:
+            self._fma_values.append(fma.copy())
+        if len(self._sma_values) < self._sma_values.maxlen or len(self._fma_values) < self._fma_values.maxlen:
+            return
+        sma = self._sma_values[0]
+        fma = self._fma_values[0]
+        buys = (fma > sma) & ~self._crossing_indicator
+        sells = (fma < sma) & self._crossing_indicator
+        self._trade(date, buys, sells)
+        self._crossing_indicator[buys] = True
+        self._crossing_indicator[sells] = False
+
+class MomentumTrader(_Trader):
+    '''
+    momentum() on a live feed: the oscillator is updated with every bar, and the trades are
+    the same as the ones of momentum() (same days, same prices), which trades on the day after
+    the last day of the oscillator's window.
+
+    Input:
+        n_stocks (int): number of stocks in the feed
+        osc_type, period, low_threshold, high_threshold, cool_down_period, amount, fees: as in momentum()
+        ledger (Ledger): the ledger to log the transactions in
+    '''
+    def __init__(self, n_stocks, osc_type='stochastic', period=7, low_threshold=0.25, high_threshold=0.75,
+                 cool_down_period=14, amount=5000, fees=20, ledger=None):
+        _Trader.__init__(self, n_stocks, amount, fees, ledger)
+        self.period = period
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self.cool_down_period = cool_down_period
+        self._oscillator = stock_indicators.StreamingOscillator(n_stocks, period, osc_type)
+        # the oscillator of the previous day, which decides today's trades
+        self._previous = None
+        # the index to revisit and buy or sell, after the cool down period has passed
+        self._revisit_buy = np.zeros(n_stocks, dtype=np.int64)
+        self._revisit_sell = np.zeros(n_stocks, dtype=np.int64)
+
+    def on_bar(self, date, prices):
+        '''
+        Trades on the oscillator of the previous day, then updates it with the prices of a new day.
+        '''
+        self._new_bar(date, prices)
+        if self._previous is not None:
+            # the index of the previous oscillator, as in the loop of momentum()
+            i = date - self.period
+            buys = (self.low_threshold >= self._previous) & (i > self._revisit_buy)
+            sells = (self.high_threshold <= self._previous) & (i > self._revisit_sell)
+            self._revisit_buy[buys] = i + self.cool_down_period
+            self._revisit_sell[sells] = i + self.cool_down_period
+            self._trade(date, buys, sells)
+        oscillator = self._oscillator.update(prices)
+        if oscillator is not None:
+            self._previous = oscillator.copy()
+
+TRADERS = {'crossing_averages': CrossingAveragesTrader, 'momentum': MomentumTrader}
+
+async def trade(source, strategy='crossing_averages', ledger='ledger_live.txt', write_interval=1.0, **parameters):
+    '''
+    Paper trades a strategy on a live feed, and reports the decision latency.
+
+    Input:
+        source (async iterator): the feed of (date, prices) pairs, e.g. replay() or socket_feed()
+        strategy (str, default 'crossing_averages'): 'crossing_averages' or 'momentum'
+        ledger (str or Ledger, default 'ledger_live.txt'): path to the ledger file written in the background,
+            or an in-memory Ledger
+        write_interval (float, default 1.0): seconds between two writes of the ledger file
+        parameters: the parameters of the strategy (periods, thresholds, amount, fees...)
+
+    Output:
+        report (dict): the number of bars and transactions, and the 50th and 99th percentiles
+            and the maximum of the decision latency (seconds from receiving a bar to the end of its trades)
+
+    Example:
+        >>> report = asyncio.run(trade(replay(bars_per_second=100), 'momentum', period=14))
+    '''
+    if isinstance(ledger, proc.Ledger):
+        memory_ledger = ledger
+        writer = None
+    else:
+        memory_ledger = proc.Ledger()
+        writer = LedgerWriter(memory_ledger, ledger, write_interval)
+    trader = None
+    latencies = []
+    try:
+        async for date, prices in source:
+            received = time.perf_counter()
+            if trader is None:
+                trader = TRADERS[strategy](len(prices), ledger=memory_ledger, **parameters)
+            trader.on_bar(date, prices)
+            latencies.append(time.perf_counter() - received)
+        if trader is not None:
+            # sell everything at the end of the feed
+            trader.close()
+    finally:
+        if writer is not None:
+            await writer.close()
+    latencies = np.array(latencies)
+    return {
+        'bars': len(latencies),
+        'transactions': len(memory_ledger),
+        'latency_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'latency_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'latency_max': float(latencies.max()) if len(latencies) else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paper trade a strategy on a replayed price feed.")
+    parser.add_argument('--strategy', choices=sorted(TRADERS), default='crossing_averages')
+    parser.add_argument('--data-file', default="stock_data_5y.txt")
+    parser.add_argument('--bars-per-second', type=float, help="speed of the replay (default: as fast as possible)")
+    parser.add_argument('--ledger', default='ledger_live.txt')
+    args = parser.parse_args(argv)
+    report = asyncio.run(trade(replay(data_file=args.data_file, bars_per_second=args.bars_per_second),
+                               args.strategy, args.ledger))
+    print(f"{report['bars']} bars, {report['transactions']} transactions")
+    if report['bars']:
+        print(f"decision latency: p50 {report['latency_p50'] * 1000:.3f} ms, p99 {report['latency_p99'] * 1000:.3f} ms, "
+              f"max {report['latency_max'] * 1000:.3f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
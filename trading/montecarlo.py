@@ -0,0 +1,91 @@
+# Functions to run a strategy over many simulated universes in parallel.
+import multiprocessing
+import numpy as np
+import trading.data as data
+import trading.process as proc
+import trading.strategy as strategy
+
+def summarize_ledger(ledger, n_stocks, last_day):
+    '''
+    Summarizes an in-memory ledger.
+
+    Input:
+        ledger (Ledger): the in-memory ledger of one run
+        n_stocks (int): number of stocks in the universe
+        last_day (int): the last day of the data, when everything is sold
+
+    Output:
+        pnl (float): sum of all amounts spent and earned (fees included)
+        trades (int): number of transactions
+        holdings (ndarray): shares held per stock before the final sell on the last day
+    '''
+    records = ledger.records
+    # A sell of a failed company has a NaN amount, the shares are worth nothing
+    pnl = np.nansum(records['amount'])
+    # Shares bought count positive and shares sold negative, up to the day before the last one
+    signed_shares = np.where(records['type'] == b'buy', records['shares'], -records['shares'])
+    before_last_day = records['date'] < last_day
+    holdings = np.bincount(records['stock'][before_last_day], weights=signed_shares[before_last_day],
+                           minlength=n_stocks).astype(np.int64)
+    return pnl, len(records), holdings
+
+def _run_one(job):
+    '''
+    Runs one strategy over one simulated universe, in a worker process.
+    The ledger is kept in memory so the workers never share a file.
+    '''
+    run, seed_sequence, strategy_name, initial_price, volatility, kwargs = job
+    # Independent seeds for the data and for the strategy itself (only random uses it)
+    data_seed, strategy_seed = seed_sequence.spawn(2)
+    stock_prices = data.get_data('generate', initial_price, volatility, seed=data_seed)
+    ledger = proc.Ledger()
+    if strategy_name == 'random':
+        strategy.random(stock_prices, ledger=ledger, seed=strategy_seed, **kwargs)
+    elif strategy_name == 'crossing_averages':
+        strategy.crossing_averages(stock_prices, ledger=ledger, **kwargs)
+    else:
+        strategy.momentum(stock_prices, ledger=ledger, **kwargs)
+    pnl, trades, holdings = summarize_ledger(ledger, len(initial_price), stock_prices.shape[0] - 1)
+    return run, pnl, trades, holdings
+
+def run_monte_carlo(strategy_name, initial_price, volatility, n_runs=100, processes=None, seed=None, **kwargs):
+    '''
+    Runs one strategy over n_runs simulated universes from get_data('generate', ...),
+    spread over a pool of processes.
+
+    Input:
+        strategy_name (str): 'random', 'crossing_averages' or 'momentum'
+        initial_price (list): initial price for each stock
+        volatility (list): volatility for each stock
+        n_runs (int, default 100): number of simulated universes
+        processes (int, default None): number of worker processes (default: number of cores)
+        seed (int, default None): seed for the whole run, each universe gets its own
+            independent seed from it so results don't depend on the number of workers
+        Any other keyword argument is passed on to the strategy (e.g. period, amount, fees).
+
+    Output:
+        summary (ndarray): structured array with one row per run, with fields
+            'run', 'pnl', 'trades' and 'holdings' (shares held per stock before the last day)
+
+    Example:
+        200 runs of the momentum strategy on 2 stocks, using all the cores:
+            >>> summary = run_monte_carlo('momentum', [150, 250], [1.8, 3.2], n_runs=200, seed=1)
+            >>> summary['pnl'].mean()
+    '''
+    if strategy_name not in ('random', 'crossing_averages', 'momentum'):
+        print("Please choose one of the strategies 'random', 'crossing_averages' or 'momentum'.")
+        return
+    n_stocks = len(initial_price)
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_runs)
+    jobs = [(run, seed_sequences[run], strategy_name, initial_price, volatility, kwargs) for run in range(n_runs)]
+    summary = np.zeros(n_runs, dtype=[('run', np.int64), ('pnl', np.float64), ('trades', np.int64),
+                                      ('holdings', np.int64, (n_stocks,))])
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # Each job only sends a seed and gets back a few numbers, so the workers hardly ever wait on each other.
+    # A few jobs per chunk keeps the overhead low while still balancing the load between the workers.
+    chunksize = max(1, n_runs // (4 * processes))
+    with multiprocessing.Pool(processes) as pool:
+        for run, pnl, trades, holdings in pool.imap_unordered(_run_one, jobs, chunksize):
+            summary[run] = (run, pnl, trades, holdings)
+    return summary
@@ -1,79 +1,232 @@
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+import trading.binary_ledger as binary_ledger
+import trading.process as proc
 
-def read_ledger(ledger_file="ledger_crossing_averages_eval.txt"):
+# In headless mode (TRADING_HEADLESS=1, or setting headless = True), read_ledger() only prints its report
+# and matplotlib is never imported, e.g. in batch workers or on a server without a display
+headless = os.environ.get('TRADING_HEADLESS', '') not in ('', '0')
+
+def _pyplot():
+    '''
+    Imports matplotlib.pyplot the first time a plot is needed, as it is slow to import
+    and starts a GUI backend. Returns None in headless mode.
+    '''
+    if headless:
+        return None
+    import matplotlib.pyplot as plt
+    return plt
+
+def load_ledger(ledger_file="ledger_crossing_averages_eval.txt"):
+    '''
+    Reads a ledger file into a typed structured array, in a single parse.
+
+    Input:
+        ledger_file (str or Ledger): path to the ledger file (text or binary), or an in-memory Ledger
+
+    Output:
+        records (ndarray): structured array with the fields of process.Ledger.dtype
+            (type, date, stock, shares, price, amount), one row per transaction
+    '''
+    if isinstance(ledger_file, proc.Ledger):
+        return ledger_file.records
+    if binary_ledger.is_binary(ledger_file):
+        return binary_ledger.read(ledger_file)
+    return np.loadtxt(ledger_file, delimiter=",", dtype=proc.Ledger.dtype, ndmin=1)
+
+def ledger_metrics(records):
+    '''
+    Computes the metrics reported by read_ledger() from the ledger records, with grouped reductions.
+
+    Input:
+        records (ndarray): the ledger records, as returned by load_ledger()
+
+    Output:
+        metrics (dict): with keys
+            'transactions' (int): total number of transactions
+            'overall_profit', 'total_spent', 'total_earned' (float): for all stocks
+            'stocks' (int): number of stocks in the initial portfolio
+            'spent', 'earned' (ndarray): total amount spent and earned for each stock
+            'holdings_before_last_day' (ndarray): shares held for each stock before its last transaction
+            'holdings' (ndarray): shares held for each stock after every transaction (one per record)
+            'profit_dates', 'profit' (list): for each stock, the dates (starting at -1) and the
+                profit at each transaction, as plotted by read_ledger()
+    '''
+    is_sell = records['type'] == b'sell'
+    amounts = records['amount']
+    stock_ids = records['stock']
+    # bincount adds up in the order of the ledger, like a running total would
+    total_buy_value, total_sell_value = np.bincount(is_sell, weights=amounts, minlength=2)
+    # The initial portfolio is the first buys on day 0, one per stock
+    initial = (~is_sell) & (records['date'] == 0)
+    stocks = len(records) if initial.all() else int(np.argmin(initial))
+    n_ids = max(stocks, int(stock_ids.max()) + 1 if len(records) else 0)
+    spent = np.bincount(stock_ids, weights=np.where(is_sell, 0, np.abs(amounts)), minlength=n_ids)
+    earned = np.bincount(stock_ids, weights=np.where(is_sell, amounts, 0), minlength=n_ids)
+    # Group the records by stock, keeping the ledger order within each stock
+    order = np.argsort(stock_ids, kind='stable')
+    grouped = records[order]
+    group_starts = np.searchsorted(grouped['stock'], np.arange(n_ids))
+    group_ends = np.searchsorted(grouped['stock'], np.arange(n_ids), side='right')
+    group_sizes = group_ends - group_starts
+    grouped_sell = grouped['type'] == b'sell'
+    # Holdings after every transaction: a cumulative sum of the shares bought (+) and sold (-),
+    # restarted for each stock
+    signed_shares = np.where(grouped_sell, -grouped['shares'], grouped['shares'])
+    cumulative = np.cumsum(signed_shares)
+    holdings = cumulative - np.repeat(np.where(group_starts > 0, cumulative[group_starts - 1], 0), group_sizes)
+    # The holdings before the last transaction of each stock (the sell on the last day):
+    # the shares bought since the sell before it
+    bought_so_far = np.cumsum(np.where(grouped_sell, 0, grouped['shares']))
+    last_sell = np.maximum.accumulate(np.where(grouped_sell, np.arange(len(grouped)), -1))
+    last_sell = np.maximum(last_sell, np.repeat(group_starts - 1, group_sizes))
+    before_last = np.maximum(group_ends - 2, 0)
+    holdings_before_last_day = np.where(group_sizes > 1, bought_so_far[before_last]
+                                        - np.where(last_sell[before_last] >= 0, bought_so_far[np.maximum(last_sell[before_last], 0)], 0), 0)
+    # Profit at each transaction: the amount of a buy, or for a sell its amount minus all
+    # the buys since the previous sell of the same stock
+    spent_so_far = np.cumsum(np.where(grouped_sell, 0, np.abs(grouped['amount'])))
+    # position of the previous sell of the same stock (or just before the stock's first record),
+    # found with a running maximum over the positions of the sells
+    sell_positions = np.where(grouped_sell, np.arange(len(grouped)), -1)
+    previous_sell = np.maximum.accumulate(np.concatenate(([-1], sell_positions[:-1])))
+    previous_sell = np.maximum(previous_sell, np.repeat(group_starts - 1, group_sizes))
+    spent_before = np.where(previous_sell >= 0, spent_so_far[np.maximum(previous_sell, 0)], 0)
+    profit = np.where(grouped_sell, grouped['amount'] - (spent_so_far - spent_before), grouped['amount'])
+    holdings_by_record = np.empty_like(holdings)
+    holdings_by_record[order] = holdings
+    return {
+        'transactions': len(records),
+        'overall_profit': round(float(total_sell_value + total_buy_value), 2),
+        'total_spent': round(abs(float(total_buy_value)), 2),
+        'total_earned': round(float(total_sell_value), 2),
+        'stocks': stocks,
+        'spent': spent[:stocks],
+        'earned': earned[:stocks],
+        'holdings_before_last_day': holdings_before_last_day[:stocks].astype(np.int64),
+        'holdings': holdings_by_record,
+        'profit_dates': [np.concatenate(([-1], grouped['date'][group_starts[i]:group_ends[i]])) for i in range(stocks)],
+        'profit': [np.concatenate(([0.0], profit[group_starts[i]:group_ends[i]])) for i in range(stocks)],
+    }
+
+def read_ledger(ledger_file="ledger_crossing_averages_eval.txt", quiet=False):
     '''
     Reads and reports useful information from ledger_file.
 
     Input:
-        ledger (str): path to the ledger file to read
+        ledger (str or Ledger): path to the ledger file to read, or an in-memory Ledger
+        quiet (bool, default False): if True, don't print or plot anything,
+            and return the metrics instead
+
+    Output: None, or the metrics (dict, see ledger_metrics()) if quiet is True
+        In headless mode the profit of each stock is not plotted.
+    '''
+    records = load_ledger(ledger_file)
+    metrics = ledger_metrics(records)
+    if quiet:
+        return metrics
+    plt = _pyplot()
+    # A total over no transaction at all is printed as 0, not 0.0, like a running total started at 0
+    is_sell = records['type'] == b'sell'
+    sells = np.bincount(records['stock'][is_sell], minlength=metrics['stocks'])
+    buys = np.bincount(records['stock'][~is_sell], minlength=metrics['stocks'])
+    def total(value, count):
+        return round(float(value), 2) if count else 0
+    print("The total number of transactions performed are:", metrics['transactions'])
+    print("Overall profit from all stocks:", total(metrics['overall_profit'], len(records)))
+    print("Total amount spent for all stocks:", total(metrics['total_spent'], buys.sum()))
+    print("total amount earned for all stocks:", total(metrics['total_earned'], sells.sum()))
+    print("The different number of stocks in the portfolio are: ", metrics['stocks'])
+    for i in range(metrics['stocks']):
+        print("Amount earned from trading the stock number ", i, " is ", total(metrics['earned'][i], sells[i]),
+              "by spending ", total(metrics['spent'][i], buys[i]))
+        if plt is not None:
+            print("Profit overall from trading the stock number ", i, " is shown in the graph below:")
+            plt.plot(metrics['profit_dates'][i], metrics['profit'][i])
+            plt.show()
+    for i in range(metrics['stocks']):
+        print(f"The portfolio before the last day for stock {i} had {metrics['holdings_before_last_day'][i]} stocks")
+
+def equity_curve(stock_prices, ledger_file, initial_cash=None):
+    '''
+    Marks the portfolio to market every day, from the price data and the transactions in a ledger.
+    Everything is computed in one vectorized pass, and the memory is proportional to days x stocks.
+
+    Input:
+        stock_prices (ndarray): the stock price data the ledger was traded on
+        ledger_file (str or Ledger): path to the ledger file, or an in-memory Ledger
+        initial_cash (float, default None): cash we start with on day 0. By default,
+            the amount spent on the initial portfolio, so that we start with no cash left.
+
+    Output:
+        curve (dict): with keys
+            'positions' (ndarray): shares held for each stock at the end of each day (days, stocks)
+            'cash' (ndarray): cash balance at the end of each day
+            'market_value' (ndarray): value of the shares held at the end of each day
+                (a failed company, with a NaN price, is worth 0)
+            'equity' (ndarray): cash + market value at the end of each day
+            'traded' (ndarray): total value of the shares bought and sold each day
+    '''
+    stock_prices = np.asarray(stock_prices, dtype=float)
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    days, n_stocks = stock_prices.shape
+    records = load_ledger(ledger_file)
+    is_sell = records['type'] == b'sell'
+    # Shares bought and sold each day, then held over time with a cumulative sum
+    positions = np.zeros((days, n_stocks), dtype=np.int64)
+    np.add.at(positions, (records['date'], records['stock']), np.where(is_sell, -records['shares'], records['shares']))
+    np.cumsum(positions, axis=0, out=positions)
+    # The cash only changes with the amounts of the transactions
+    amounts = np.nan_to_num(records['amount'])
+    if initial_cash is None:
+        initial_cash = -amounts[(~is_sell) & (records['date'] == 0)].sum()
+    cash = initial_cash + np.cumsum(np.bincount(records['date'], weights=amounts, minlength=days))
+    traded = np.bincount(records['date'], weights=np.nan_to_num(records['price'] * records['shares']), minlength=days)
+    # Value of the positions every day (a row-wise dot product), with 0 for NaN prices
+    market_value = np.einsum('ij,ij->i', positions, np.nan_to_num(stock_prices))
+    return {
+        'positions': positions,
+        'cash': cash,
+        'market_value': market_value,
+        'equity': cash + market_value,
+        'traded': traded,
+    }
+
+def risk_metrics(curve, trading_days=252):
+    '''
+    Computes risk metrics from a daily equity curve, as returned by equity_curve().
+
+    Input:
+        curve (dict): the equity curve
+        trading_days (int, default 252): number of days in a year, to annualize the Sharpe ratio
 
-    Output: None
+    Output:
+        metrics (dict): with keys
+            'drawdown' (ndarray): drop of the equity from its highest value so far, every day (<= 0)
+            'max_drawdown' (float): the largest drop (<= 0)
+            'max_drawdown_fraction' (float): the largest drop, as a fraction of the highest value before it
+            'returns' (ndarray): daily returns of the equity
+            'sharpe' (float): annualized Sharpe ratio of the daily returns (risk-free rate of 0)
+            'turnover' (float): average value traded per day, as a fraction of the equity
+            'exposure' (ndarray): market value as a fraction of the equity, every day
+            'average_exposure' (float): the average of exposure
     '''
-    data = np.loadtxt(ledger_file, delimiter=",", dtype='str')
-    print("The total number of transactions performed are:", data.shape[0])
-    #calculate total amount spent and earned:
-    total_buy_value = 0
-    total_sell_value = 0
-    for i in range(data.shape[0]):
-        if data[i,0] == 'buy':
-            total_buy_value += float(data[i,-1])
-        else:
-            total_sell_value += float(data[i, -1])
-    print("Overall profit from all stocks:", round(total_sell_value+total_buy_value,2))
-    print("Total amount spent for all stocks:",round(abs(total_buy_value),2))
-    print("total amount earned for all stocks:", round(total_sell_value,2))
-    #get all the differences in an array and plot it
-    indices = []
-    stocks = 0
-    #understand how many different stocks are in the portfolio from the initial buys
-    for i in range(len(data)):
-        if data[i,0] == 'buy' and data[i,1] == '0':
-            stocks += 1
-        else: #if there aren't any more, then stop the loop
-            break
-    print("The different number of stocks in the portfolio are: ", stocks)
-    #From the way that we have implemented the indicators and the strategies, we know that at first we look one stock every time
-    #so we will check the first one, then the second one.
-    #loop over all the stocks
-    portfolio_status = []
-    for i in range(stocks):
-        indices = np.where(data[:,2] == str(i))
-        #calculate portfolio status before the last day for every stock at a time and display it at the end.
-        before_last_day_stocks_held = 0
-        for k in reversed(indices[0][0:-1]): #reverse array to get access to the indices from the end, to get the last buy orders
-            # skip first loop (in the reversed array, this is when we sell in the last day)
-            if data[k,0] == 'sell': #break if we see a sell order (not the sell order before the last day)
-                #that means that we will stop the loop if we get to a sell order
-                # (that means that we sold any remaining stocks at that day).
-                break
-            else: # add up all the buy orders
-                before_last_day_stocks_held += (int(data[k,3]))
-        portfolio_status.append(before_last_day_stocks_held)
-        #loop over the indices and calculate value
-        total_buys = 0
-        total_sells = 0
-        overall = [0.0] # initialize with 0 at day -1
-        dates_of_transactions = [-1] # we set it to -1 to get the day before we buy the first stocks
-        buys = 0
-        # the way we calculate the amount of money we had over time is the following:
-        # we assume that we get money when we sell the stock, so we add up all the buy orders we make until
-        # the moment we sell, and that's when we record the money we have at that point. We also mark the dates
-        # that we sell so we can display the dates on the graph
-        for j in indices[0]:
-            if data[j,0] == 'buy':
-                buys += abs(float(data[j,-1]))
-                total_buys += abs(float(data[j, -1]))
-                overall.append(float(data[j, -1]))
-            elif data[j,0] == 'sell':
-                total_sells += float(data[j, -1])
-                overall.append(float(data[j, -1]) - buys)
-                #reset the counter so the next time we sell we know what amount we have bought in the meantime
-                buys = 0
-            dates_of_transactions.append(int(data[j,1]))
-        print("Amount earned from trading the stock number ", i, " is ", round(total_sells,2), "by spending ", round(total_buys,2))
-        print("Profit overall from trading the stock number ",i, " is shown in the graph below:")
-        plt.plot(dates_of_transactions,overall)
-        plt.show()
-    for i in range(stocks):
-        print(f'The portfolio before the last day for stock {i} had {portfolio_status[i]} stocks')
\ No newline at end of file
+    equity = curve['equity']
+    running_max = np.maximum.accumulate(equity)
+    drawdown = equity - running_max
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_fraction = np.where(running_max > 0, drawdown / running_max, 0)
+        returns = np.diff(equity) / equity[:-1]
+        exposure = curve['market_value'] / equity
+        turnover = np.mean(curve['traded'] / equity)
+    volatility = returns.std()
+    return {
+        'drawdown': drawdown,
+        'max_drawdown': float(drawdown.min()),
+        'max_drawdown_fraction': float(drawdown_fraction.min()),
+        'returns': returns,
+        'sharpe': float(returns.mean() / volatility * np.sqrt(trading_days)) if volatility > 0 else 0.0,
+        'turnover': float(turnover),
+        'exposure': exposure,
+        'average_exposure': float(np.mean(exposure)),
+    }
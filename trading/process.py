@@ -1,6 +1,182 @@
 # Functions to process transactions.
 import numpy as np
+import trading.profiling as profiling
 
+# Compact record for one trade, 36 bytes per transaction:
+# the type is stored as ASCII bytes (b'buy' or b'sell'), day and stock indices fit in int32,
+# share counts are whole numbers (int64) and prices and amounts are float64.
+TRADE_DTYPE = np.dtype([('type', 'S4'), ('date', np.int32), ('stock', np.int32),
+                        ('shares', np.int64), ('price', np.float64), ('amount', np.float64)])
+
+class Portfolio:
+    '''
+    Portfolio holding an integer number of shares of each stock, and optionally a cash account.
+    It can be used anywhere a portfolio array is used: indexing, len() and np.asarray()
+    all act on the share counts. buy() and sell() also update the cash account by the amount
+    of every transaction, as written in the ledger (see transaction_amount()).
+
+    Input:
+        n_stocks (int): number of stocks in the portfolio
+        cash (float, default 0): the cash available at the start
+
+    Example:
+        A portfolio of 20 stocks, starting with 20000 in cash:
+            >>> portfolio = Portfolio(20, cash=20000)
+            >>> buy(0, 3, 1000, sim_data, 40, portfolio, 'ledger.txt')
+            >>> portfolio.cash
+            19010.0
+    '''
+    __slots__ = ('shares', 'cash')
+
+    def __init__(self, n_stocks, cash=0.0):
+        self.shares = np.zeros(n_stocks, dtype=np.int64)
+        self.cash = float(cash)
+
+    def __getitem__(self, stock):
+        return self.shares[stock]
+
+    def __setitem__(self, stock, shares):
+        self.shares[stock] = shares
+
+    def __len__(self):
+        return len(self.shares)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.shares
+        return self.shares.astype(dtype)
+
+    def __repr__(self):
+        return 'Portfolio(shares={}, cash={:.2f})'.format(self.shares.tolist(), self.cash)
+
+class Ledger:
+    '''
+    In-memory ledger, which can be used in place of a ledger file path in
+    log_transaction(), buy(), sell() and create_portfolio().
+    Transactions are kept in a preallocated NumPy structured array, which grows in chunks,
+    and are only written to disk (in the same format as log_transaction) when flush() is called.
+
+    Input:
+        ledger_file (str, default None): path to the ledger file used by flush()
+        chunk_size (int, default 1024): number of records added every time the array is full
+
+    Example:
+        Run a strategy in memory and write the ledger once at the end:
+            >>> ledger = Ledger('ledger.txt')
+            >>> portfolio = create_portfolio([1000] * N, sim_data, 40, ledger)
+            >>> ledger.flush()
+    '''
+    dtype = TRADE_DTYPE
+
+    def __init__(self, ledger_file=None, chunk_size=1024):
+        self.ledger_file = ledger_file
+        self.chunk_size = chunk_size
+        self._records = np.zeros(chunk_size, dtype=self.dtype)
+        self._size = 0
+        # number of records already written to the file
+        self._flushed = 0
+
+    @classmethod
+    def from_records(cls, records, ledger_file=None):
+        '''
+        Creates a ledger holding the given structured array of transactions.
+        The array is used as it is, without a copy, if it already has the ledger dtype.
+        '''
+        ledger = cls(ledger_file, chunk_size=1)
+        ledger._records = np.asarray(records, dtype=cls.dtype)
+        ledger._size = len(ledger._records)
+        ledger.chunk_size = 1024
+        return ledger
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    @property
+    def records(self):
+        '''
+        The transactions recorded so far, as a structured array (a view, not a copy).
+        '''
+        return self._records[:self._size]
+
+    def append(self, transaction_type, date, stock, number_of_shares, price, amount):
+        '''
+        Adds one transaction, growing the array by one chunk if it is full.
+        '''
+        if self._size == len(self._records):
+            self._records = np.concatenate((self._records, np.zeros(self.chunk_size, dtype=self.dtype)))
+        self._records[self._size] = (transaction_type, date, stock, number_of_shares, price, amount)
+        self._size += 1
+
+    def extend(self, records):
+        '''
+        Adds many transactions at once, from a structured array with the same fields.
+        '''
+        needed = self._size + len(records)
+        if needed > len(self._records):
+            # grow by whole chunks
+            chunks = -(-(needed - len(self._records)) // self.chunk_size)
+            self._records = np.concatenate((self._records, np.zeros(chunks * self.chunk_size, dtype=self.dtype)))
+        self._records[self._size:needed] = records
+        self._size = needed
+
+    def flush(self, ledger_file=None):
+        '''
+        Appends the transactions not written yet to the ledger file, in a single write.
+        Does nothing if there is no ledger file.
+        '''
+        if ledger_file is None:
+            ledger_file = self.ledger_file
+        if ledger_file is None or self._flushed == self._size:
+            return
+        new_records = self._records[self._flushed:self._size]
+        # Convert whole columns to Python objects at once, formatting is then one % per line
+        # (%.2f gives the same text as "{:.2f}".format in log_transaction)
+        # (the type is stored as bytes, so it is decoded to text first)
+        columns = zip(new_records['type'].astype('U4').tolist(), new_records['date'].tolist(), new_records['stock'].tolist(),
+                      new_records['shares'].tolist(), new_records['price'].tolist(), new_records['amount'].tolist())
+        lines = ''.join(['\n%s,%d,%d,%d,%.2f,%.2f' % record for record in columns])
+        with profiling.stage('process.Ledger.flush'):
+            file = open(ledger_file, "a")
+            file.write(lines)
+            file.close()
+        if profiling.enabled:
+            profiling.add_bytes('process.Ledger.flush', len(lines))
+        self._flushed = self._size
+
+def transaction_amount(transaction_type, number_of_shares, price, fees):
+    '''
+    The amount of money spent (negative) or earned (positive) in a transaction, fees included,
+    as it is written in the ledger. Portfolio cash accounts change by this same amount.
+
+    Input:
+        transaction_type (str): 'buy' or 'sell'
+        number_of_shares (int): the number of shares bought or sold
+        price (float): the price of a share at the time of the transaction
+        fees (float): transaction fees
+
+    Output:
+        amount (float): the amount of the transaction (NaN if the price is NaN)
+
+    Example:
+        A sell with no shares still reports the fees, as a positive amount:
+            >>> transaction_amount('sell', 0, 100, 20)
+            20.0
+    '''
+    amount = float(price) * number_of_shares
+    # Convert the amount to negative or positive if it is a sell or buy order accordingly
+    if transaction_type == 'buy':
+        amount = -abs(amount + fees)
+    elif transaction_type == 'sell':
+        amount = abs(amount - fees)
+    return amount
+
+@profiling.instrument('process.log_transaction')
 def log_transaction(transaction_type, date, stock, number_of_shares, price, fees, ledger_file):
     '''
     Record a transaction in the file ledger_file. If the file doesn't exist, create it.
@@ -12,7 +188,7 @@ def log_transaction(transaction_type, date, stock, number_of_shares, price, fees
         number_of_shares (int): the number of shares bought or sold
         price (float): the price of a share at the time of the transaction
         fees (float): transaction fees (fixed amount per transaction, independent of the number of shares)
-        ledger_file (str): path to the ledger file
+        ledger_file (str or Ledger): path to the ledger file, or an in-memory Ledger
     
     Output: returns None.
         Writes one line in the ledger file to record a transaction with the input information.
@@ -26,25 +202,29 @@ def log_transaction(transaction_type, date, stock, number_of_shares, price, fees
         buy,5,2,10,100.00,-1050.00
             >>> log_transaction('buy', 5, 2, 10, 100, 50, 'ledger.txt')
     '''
-    # Create file if it doesn't exists or open the file with append
-    file = open(ledger_file, "a")
-    new_price = float(price) * number_of_shares
+    new_price = transaction_amount(transaction_type, number_of_shares, price, fees)
     number_of_shares = int(number_of_shares)
-    # Convert the amount to negative or positive if it is a sell or buy order accordingly
-    if transaction_type == 'buy':
-        new_price = -abs(new_price + fees)
-    elif transaction_type == 'sell':
-        new_price = abs(new_price - fees)
+    # An in-memory ledger just keeps the record, it is written to disk later by Ledger.flush()
+    if isinstance(ledger_file, Ledger):
+        ledger_file.append(transaction_type, date, stock, number_of_shares, price, new_price)
+        return
     # Use str.format() to report amount with 2 decimal digits
     # \n is used to go to the next line
-    file.writelines('\n' + transaction_type + "," + str(date) + "," + str(stock) + "," + str(
-        number_of_shares) + "," + "{:.2f}".format(price) + "," + "{:.2f}".format(new_price))
+    line = '\n' + transaction_type + "," + str(date) + "," + str(stock) + "," + str(
+        number_of_shares) + "," + "{:.2f}".format(price) + "," + "{:.2f}".format(new_price)
+    # Create file if it doesn't exists or open the file with append
+    file = open(ledger_file, "a")
+    file.writelines(line)
     file.close()
+    if profiling.enabled:
+        profiling.add_bytes('process.log_transaction', len(line))
 
 def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_file):
     '''
     Buy shares of a given stock, with a certain amount of money available.
     Updates portfolio in-place, logs transaction in ledger.
+    If the price of the stock is NaN on that date (the company has failed), nothing is bought
+    and nothing is logged (int() of a NaN number of shares used to raise a ValueError).
     
     Input:
         date (int): the date of the transaction (nb of days since day 0)
@@ -53,8 +233,8 @@ def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_fi
             this must also cover fees
         stock_prices (ndarray): the stock price data
         fees (float): total transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (ndarray or Portfolio): our current portfolio
+        ledger_file (str or Ledger): path to the ledger file, or an in-memory Ledger
     
     Output: None
 
@@ -64,17 +244,22 @@ def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_fi
     '''
     # check if array is not 2d (and thus contains only one stock). Because 1d arrays require different handling
     # https://stackoverflow.com/questions/21299798/check-if-numpy-array-is-multidimensional-or-not
-    stock_price = []
     if stock_prices.ndim == 2:
         stock_price = stock_prices[date, stock]
     else:
         stock_price = stock_prices[date]
+    # If the price is NaN the company has failed, so there is nothing to buy
+    if np.isnan(stock_price):
+        return
     #calculate the available amount after deducting fees
     capital_after_fees = available_capital - fees
-    shares = capital_after_fees // stock_price
-    #remaining_capital = capital_after_fees - shares * capital_after_fees
+    # only whole shares can be bought
+    shares = int(capital_after_fees // stock_price)
     # Add the number of stocks we can buy with the amount we are given to the portfolio
     portfolio[stock] += shares
+    # Pay for the shares and the fees from the cash account, if the portfolio has one
+    if isinstance(portfolio, Portfolio):
+        portfolio.cash += transaction_amount("buy", shares, stock_price, fees)
     log_transaction("buy", date, stock, shares, stock_price, fees, ledger_file)
 
 def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
@@ -87,8 +272,8 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
         stock (int): the stock we want to sell
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (ndarray or Portfolio): our current portfolio
+        ledger_file (str or Ledger): path to the ledger file, or an in-memory Ledger
     
     Output: None
 
@@ -98,7 +283,6 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
     '''
     # check if array is not 2d (and thus contains only one stock). Because 1d arrays require different handling
     # https://stackoverflow.com/questions/21299798/check-if-numpy-array-is-multidimensional-or-not
-    stock_price = []
     if stock_prices.ndim == 2:
         stock_price = stock_prices[date, stock]
     else:
@@ -107,9 +291,13 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
     shares = portfolio[stock]
     # Update portfolio (because we sell all stocks)
     portfolio[stock] = 0
+    # Add the earnings to the cash account, if the portfolio has one, with the amount written in the ledger
+    # (shares of a failed company, with a NaN price, are worth nothing)
+    if isinstance(portfolio, Portfolio) and not np.isnan(stock_price):
+        portfolio.cash += transaction_amount("sell", shares, stock_price, fees)
     log_transaction("sell", date, stock, shares, stock_price, fees, ledger_file)
 
-def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
+def create_portfolio(available_amounts, stock_prices, fees, ledger_file, cash=None):
     '''
     Create a portfolio by buying a given number of shares of each stock.
     
@@ -118,9 +306,13 @@ def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
             purchase for each stock (this should cover fees)
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
+        ledger_file (str or Ledger): path to the ledger file, or an in-memory Ledger
+        cash (float, default None): if given, the portfolio also tracks a cash account
+            starting with this amount, and the initial purchases are paid from it
     
     Output:
-        portfolio (list): our initial portfolio
+        portfolio (ndarray or Portfolio): our initial portfolio, as integer share counts
+            (a Portfolio with a cash account if cash is given)
 
     Example:
         Spend 1000 for each stock (including 40 fees for each purchase):
@@ -134,7 +326,10 @@ def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
         shape_of_1 = stock_prices.shape[1]
     N = shape_of_1
     # create an initial portfolio to pass it over to the buy() function
-    portfolio = np.zeros(N)
+    if cash is None:
+        portfolio = np.zeros(N, dtype=np.int64)
+    else:
+        portfolio = Portfolio(N, cash)
     # loop over the number of stocks we want to buy.
     for i in range(N):
         buy(0, i, available_amounts[i], stock_prices, fees, portfolio, ledger_file)
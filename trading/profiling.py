@@ -0,0 +1,212 @@
+# Opt-in timers and counters for the stages of a run: data loading, indicators,
+# the signal and execution phases of the strategies, and the ledger I/O.
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Instrumentation is off unless the TRADING_PROFILE environment variable is set,
+# or a profile() block is running. When it is off, instrumented functions are the original ones
+# and stage() blocks cost a single flag check.
+enabled = False
+# stage name -> [number of calls, total seconds, bytes written]
+_stats = {}
+# completed spans, in the Chrome trace event format
+_events = []
+# at most this many spans are kept for the trace (the totals in _stats are always complete)
+max_events = 1000000
+# time origin of the trace
+_origin = time.perf_counter()
+# (module name, function name, function, stage) of every instrumented function
+_hooks = []
+
+def _record(stage, begin, end):
+    entry = _stats.get(stage)
+    if entry is None:
+        entry = _stats[stage] = [0, 0.0, 0]
+    entry[0] += 1
+    entry[1] += end - begin
+    if len(_events) < max_events:
+        _events.append({'name': stage, 'ph': 'X', 'ts': (begin - _origin) * 1e6, 'dur': (end - begin) * 1e6,
+                        'pid': os.getpid(), 'tid': threading.get_ident()})
+
+def _wrap(function, stage):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        begin = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(stage, begin, time.perf_counter())
+    return wrapper
+
+def instrument(stage):
+    '''
+    Decorator timing every call of a module-level function as the given stage,
+    when instrumentation is enabled.
+    The function is returned unchanged, and only replaced in its module by a timed version
+    while instrumentation is enabled, so it costs nothing when it is disabled.
+
+    Input:
+        stage (str): name of the stage in the report and in the trace
+
+    Example:
+        >>> @instrument('data.get_data')
+        ... def get_data(...):
+    '''
+    def decorator(function):
+        _hooks.append((function.__module__, function.__name__, function, stage))
+        if enabled:
+            return _wrap(function, stage)
+        return function
+    return decorator
+
+def _set_enabled(value):
+    # Switch every instrumented function of the modules already imported
+    # to its timed version (or back to the original one)
+    global enabled
+    enabled = value
+    for module_name, name, function, stage in _hooks:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        setattr(module, name, _wrap(function, stage) if value else function)
+
+class _Stage:
+    '''
+    Context manager timing a block of code as one stage.
+    '''
+    __slots__ = ('stage', 'begin')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        _record(self.stage, self.begin, time.perf_counter())
+
+class _NoStage:
+    '''
+    Does nothing, used for stage() when instrumentation is disabled.
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_no_stage = _NoStage()
+
+def stage(name):
+    '''
+    Times a block of code as the stage name, when instrumentation is enabled.
+
+    Example:
+        >>> with stage('strategy.momentum.signals'):
+        ...     oscilator = oscillator(stock_prices)
+    '''
+    if not enabled:
+        return _no_stage
+    return _Stage(name)
+
+def add_bytes(stage, number_of_bytes):
+    '''
+    Adds number_of_bytes to the bytes written by stage. Callers check enabled first,
+    so that nothing is counted (or computed) when instrumentation is disabled.
+    '''
+    entry = _stats.get(stage)
+    if entry is None:
+        entry = _stats[stage] = [0, 0.0, 0]
+    entry[2] += number_of_bytes
+
+def reset():
+    '''
+    Forgets all the timings, counters and trace events recorded so far.
+    '''
+    global _origin
+    _stats.clear()
+    del _events[:]
+    _origin = time.perf_counter()
+
+def stats():
+    '''
+    Output:
+        stats (dict): for every stage, a dict with the number of calls, the total time in seconds
+            and the number of bytes written.
+    '''
+    return {name: {'calls': entry[0], 'seconds': entry[1], 'bytes': entry[2]} for name, entry in _stats.items()}
+
+def report(file=None):
+    '''
+    Prints the per-stage report, slowest stage first.
+    Stages are nested (a strategy phase includes the indicators and ledger writes it calls),
+    so the times do not add up to the total run time.
+
+    Input:
+        file (file object, default sys.stderr): where to print the report
+    '''
+    if file is None:
+        file = sys.stderr
+    print("{:<40} {:>10} {:>12} {:>12} {:>14}".format('stage', 'calls', 'total (s)', 'mean (ms)', 'bytes'), file=file)
+    for name, entry in sorted(_stats.items(), key=lambda item: -item[1][1]):
+        calls, seconds, written = entry
+        mean = seconds / calls * 1000 if calls else 0.0
+        print("{:<40} {:>10} {:>12.4f} {:>12.4f} {:>14}".format(name, calls, seconds, mean, written), file=file)
+
+def write_trace(trace_file):
+    '''
+    Writes the recorded spans as a Chrome trace (JSON), which can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+    '''
+    file = open(trace_file, "w")
+    json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, file)
+    file.close()
+
+@contextlib.contextmanager
+def profile(trace_file=None, quiet=False):
+    '''
+    Context manager enabling the instrumentation for a block of code.
+    At the end of the block it prints the per-stage report and writes the Chrome trace,
+    if trace_file is given.
+
+    Input:
+        trace_file (str, default None): path of the Chrome trace JSON file to write
+        quiet (bool, default False): if True, do not print the report
+
+    Example:
+        >>> with profile('trace.json'):
+        ...     strategy.momentum(sim_data)
+    '''
+    was_enabled = enabled
+    reset()
+    _set_enabled(True)
+    try:
+        yield
+    finally:
+        _set_enabled(was_enabled)
+        if not quiet:
+            report()
+        if trace_file is not None:
+            write_trace(trace_file)
+
+def _finish():
+    # Report of a run profiled with the TRADING_PROFILE environment variable
+    report()
+    value = os.environ.get('TRADING_PROFILE', '')
+    if value.endswith('.json'):
+        write_trace(value)
+
+# TRADING_PROFILE=1 prints the report at the end of the run,
+# TRADING_PROFILE=trace.json also writes the Chrome trace to trace.json
+if os.environ.get('TRADING_PROFILE', '') not in ('', '0'):
+    enabled = True
+    atexit.register(_finish)
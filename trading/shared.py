@@ -0,0 +1,192 @@
+# Price data shared with worker processes without copying it: the array is published once,
+# in shared memory (or as the file it is already mapped from), and every worker attaches to it.
+import mmap
+import multiprocessing
+import os
+import sys
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import trading.strategy as strategy
+
+# Shared memory segments this process has attached to, kept open while the views on them are in use
+_attached = {}
+
+def _open_segment(name):
+    # Only the publisher removes the segment, so the segments attached to are not tracked
+    # by the resource tracker (which would remove them, or warn, when a worker exits)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    segment = shared_memory.SharedMemory(name=name)
+    if os.name != 'nt':
+        # Before 3.13 SharedMemory always registers the segment (there is no resource tracker on Windows).
+        # The workers share the tracker of the publisher, which keeps one registration per name,
+        # so this also drops the registration of the publisher: _release() registers it again before unlinking
+        resource_tracker.unregister('/' + segment.name, 'shared_memory')
+    return segment
+
+def attach(descriptor):
+    '''
+    Attaches to an array published by share(), in any process.
+
+    Input:
+        descriptor (tuple): the description of the array, SharedArray.descriptor
+
+    Output:
+        view (ndarray): a read-only view of the shared array, nothing is copied
+    '''
+    kind, name, shape, dtype, order, offset = descriptor
+    if kind == 'memmap':
+        return np.memmap(name, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+    segment = _attached.get(name)
+    if segment is None:
+        segment = _open_segment(name)
+        _attached[name] = segment
+    view = np.ndarray(shape, dtype=dtype, buffer=segment.buf, order=order)
+    view.flags.writeable = False
+    return view
+
+def _file_offset(array):
+    '''
+    Position in its file of the first byte of a memmap (or of a view of one),
+    or None if it isn't mapped from a file.
+    A view keeps the offset of the memmap it was taken from, so it is computed
+    from the distance to the data of that memmap.
+    '''
+    root = array
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not isinstance(root, np.memmap) or not isinstance(root.base, mmap.mmap) or root.filename is None:
+        return None
+    return root.offset + array.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+
+def _release(segment):
+    # The views of this process may still use the memory, in which case it can't be closed yet,
+    # but unlinking is always possible: the memory is freed when the last process unmaps it
+    try:
+        segment.close()
+    except BufferError:
+        pass
+    if sys.version_info < (3, 13) and os.name != 'nt':
+        # a worker attaching before 3.13 has dropped our registration (see _open_segment()),
+        # and unlink() unregisters the segment: register it again (a name is only registered once)
+        resource_tracker.register('/' + segment.name, 'shared_memory')
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+class SharedArray:
+    '''
+    An array published once for worker processes. Pickling it (e.g. as an argument of a
+    multiprocessing.Pool task) only sends a small descriptor, and it is unpickled in the worker
+    as a read-only ndarray view of the same memory, which the strategy functions accept as it is.
+    A NumPy memmap (e.g. the prices of a .npy file returned by get_data()) is shared as its file,
+    any other array is copied once into a multiprocessing.shared_memory segment.
+    The segment is removed by close(), at the end of a with block, when the SharedArray is
+    garbage collected, or at the latest when the program exits.
+
+    Input:
+        array (ndarray): the array to share
+
+    Example:
+        Publish the prices once and run the strategies on them in a pool:
+            >>> with SharedArray(get_data()) as prices:
+            ...     pool.map(function, [(prices, parameters) for parameters in grid])
+    '''
+    def __init__(self, array):
+        array = np.asanyarray(array)
+        self._segment = None
+        self._finalizer = None
+        offset = None
+        if isinstance(array, np.memmap) and (array.flags.c_contiguous or array.flags.f_contiguous):
+            offset = _file_offset(array)
+        if offset is not None:
+            # Already in a file, the workers map the same bytes of the same file
+            order = 'C' if array.flags.c_contiguous else 'F'
+            self.descriptor = ('memmap', array.filename, array.shape, array.dtype.str, order, offset)
+            self.array = array
+            return
+        order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+        self._segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._segment.buf, order=order)
+        self.array[...] = array
+        self.array.flags.writeable = False
+        self.descriptor = ('shm', self._segment.name, array.shape, array.dtype.str, order, 0)
+        # remove the segment even if close() is never called
+        self._finalizer = weakref.finalize(self, _release, self._segment)
+
+    def __reduce__(self):
+        # the workers get a view of the shared array, not a copy
+        return attach, (self.descriptor,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Removes the shared memory segment (nothing to do for an array shared as its file).
+        The views already attached by other processes stay valid until they are garbage collected.
+        '''
+        if self._finalizer is not None:
+            self.array = None
+            self._finalizer()
+
+def as_array(value):
+    '''
+    The array of value if it is a SharedArray, or value itself.
+    Arguments sent to the workers are pickled, so they already arrive as arrays, but the
+    initializer arguments of a Pool are inherited as they are when the workers are forked.
+    '''
+    if isinstance(value, SharedArray):
+        return attach(value.descriptor)
+    return value
+
+def share(array):
+    '''
+    Publishes an array for worker processes (see SharedArray).
+
+    Input:
+        array (ndarray): the array to share, e.g. the prices returned by get_data()
+
+    Output:
+        shared (SharedArray): pass it to the workers in place of the array
+    '''
+    return SharedArray(array)
+
+def _run_strategy(job):
+    stock_prices, strategy_name, parameters = job
+    return getattr(strategy, strategy_name)(stock_prices, **parameters)
+
+def run_strategies(stock_prices, jobs, processes=None):
+    '''
+    Runs several strategies on the same price data in a pool of processes,
+    with the prices published once in shared memory instead of copied to every worker.
+
+    Input:
+        stock_prices (ndarray or SharedArray): the stock price data
+        jobs (list): (strategy name, parameters dict) pairs, each job writes its own ledger
+        processes (int, default None): number of worker processes, all the CPUs if None
+
+    Output:
+        results (list): what each strategy function returned, in the order of the jobs
+
+    Example:
+        >>> run_strategies(get_data(), [('random', {'seed': 1, 'ledger': 'ledger_random.txt'}),
+        ...                             ('crossing_averages', {'ledger': 'ledger_crossing_averages.txt'}),
+        ...                             ('momentum', {'ledger': 'ledger_momentum.txt'})])
+    '''
+    if not jobs:
+        return []
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    shared = stock_prices if isinstance(stock_prices, SharedArray) else SharedArray(stock_prices)
+    try:
+        with multiprocessing.Pool(min(processes, len(jobs))) as pool:
+            return pool.map(_run_strategy, [(shared, name, parameters) for name, parameters in jobs], chunksize=1)
+    finally:
+        if shared is not stock_prices:
+            shared.close()
@@ -3,13 +3,16 @@ import numpy as np
 import trading.process as proc
 import trading.data as data
 import trading.indicators as stock_indicators
-import matplotlib.pyplot as plt
+import trading.profiling as profiling
+import trading.backtest as backtest
 
-def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt'):
+def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt', seed=None):
     '''
     Randomly decide, every period, which stocks to purchase,
     do nothing, or sell (with equal probability).
     Spend a maximum of amount on every purchase.
+    All the decisions are drawn at once, as a (periods, stocks) matrix,
+    and the trades of every period are settled for all stocks in one step.
 
     Input:
         stock_prices (ndarray): the stock price data
@@ -18,6 +21,7 @@ def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.t
             (must cover fees)
         fees (float, default 20): transaction feesx
         ledger (str): path to the ledger file
+        seed (int, default None): seed for the random generator, for reproducible runs
 
     Output: None
     '''
@@ -26,27 +30,93 @@ def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.t
     shape_of_1 = 1
     if stock_prices.ndim == 2:
         shape_of_1 = stock_prices.shape[1]
-    # create portfolio
-    portfolio =  proc.create_portfolio([amount] * shape_of_1, stock_prices, fees, ledger)
-    # initialize generator
-    rng = np.random.default_rng()
-    # The period provided is the step in the for loop
-    for i in range(1, len(stock_prices), period):
-        for j in range(shape_of_1):
-            # generate a decision with equal probabilities for every outcome
-            choice = rng.choice(['buy', 'sell', 'nothing'])
-            if choice == 'buy':
-                proc.buy(i, j, amount, stock_prices, fees, portfolio, ledger)
-            elif choice == 'sell':
-                proc.sell(i, j, stock_prices, fees, portfolio, ledger)
-            #if the choice = 'nothing', then we don't have to specify an elif statement
-    #after all the periods, we sell
-    for j in range(shape_of_1):
-        if portfolio[j] != 0:
-            # -1 because arrays starts from zero
-            proc.sell(len(stock_prices)-1, j, stock_prices, fees, portfolio, ledger)
+    with profiling.stage('strategy.random.signals'):
+        # The period provided is the step between the trading days
+        dates = range(1, len(stock_prices), period)
+        # one decision per period and stock: 0 = buy, 1 = sell, 2 = nothing.
+        # Drawn in one call, it is the same sequence as one rng.choice(['buy', 'sell', 'nothing']) per stock and period
+        decisions = np.random.default_rng(seed).integers(0, 3, size=(len(dates), shape_of_1))
+    with profiling.stage('strategy.random.execution'):
+        # create portfolio
+        trades = backtest.Backtest(stock_prices, amount, fees)
+        trades.buy(0, np.ones(trades.n_stocks, dtype=bool), section=0)
+        for date, decision in zip(dates, decisions):
+            trades.buy(date, decision == 0)
+            trades.sell(date, decision == 1)
+        #after all the periods, we sell
+        trades.sell_everything()
+        # period by period, every stock in turn, as the decisions were taken
+        trades.write(ledger, order='date')
+
+def random_baselines(stock_prices, k=100, period=7, amount=5000, fees=20, seed=None, block_size=None):
+    '''
+    Runs k independent random() strategies at once, without writing any ledger,
+    to build the distribution of the P&L of random trading (the null hypothesis a strategy is compared to).
+    Baseline 0 takes the same decisions as random() with the same seed.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        k (int, default 100): number of random baselines
+        period (int, default 7): how often we buy/sell (days)
+        amount (float, default 5000): how much we spend on each purchase
+            (must cover fees)
+        fees (float, default 20): transaction fees
+        seed (int, default None): seed for the random generator, for reproducible runs
+        block_size (int, default None): number of baselines drawn and traded together,
+            to bound the memory used (by default about 64 MB of decisions per block)
 
-def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[] ,amount=5000, fees=20, ledger='ledger_crossing_averages.txt'):
+    Output:
+        pnl (ndarray): the P&L of every baseline (sum of all the amounts spent and earned, fees included),
+            as computed by backtest.Backtest.pnl()
+
+    Example:
+        Share of random baselines doing at least as well as momentum:
+            >>> null = random_baselines(sim_data, k=1000, seed=1)
+            >>> (null >= momentum_pnl).mean()
+    '''
+    # give a single stock the same (days, 1) shape as a matrix
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    n_stocks = stock_prices.shape[1]
+    dates = range(1, len(stock_prices), period)
+    if block_size is None:
+        block_size = max(1, (1 << 23) // max(1, len(dates) * n_stocks))
+    rng = np.random.default_rng(seed)
+    pnl = np.zeros(k)
+    for first in range(0, k, block_size):
+        size = min(block_size, k - first)
+        with profiling.stage('strategy.random_baselines.signals'):
+            # consecutive draws continue the same sequence, so the blocks are the rows of one (k, periods, stocks) draw
+            decisions = rng.integers(0, 3, size=(size, len(dates), n_stocks))
+        with profiling.stage('strategy.random_baselines.execution'):
+            # one portfolio per baseline, starting with the same initial purchase
+            portfolio = np.zeros((size, n_stocks), dtype=np.int64)
+            total = np.zeros(size)
+            _settle_buys(stock_prices[0], np.ones((size, n_stocks), dtype=bool), amount, fees, portfolio, total)
+            for date, decision in zip(dates, decisions.swapaxes(0, 1)):
+                _settle_buys(stock_prices[date], decision == 0, amount, fees, portfolio, total)
+                _settle_sells(stock_prices[date], decision == 1, fees, portfolio, total)
+            #after all the periods, we sell
+            _settle_sells(stock_prices[-1], portfolio != 0, fees, portfolio, total)
+        pnl[first:first + size] = total
+    return pnl
+
+def _settle_buys(stock_price, mask, amount, fees, portfolio, total):
+    # Buys the stocks in mask (one row per baseline) with the same arithmetic as process.buy().
+    # If the price is NaN the company has failed, so there is nothing to buy
+    mask = mask & ~np.isnan(stock_price)
+    # only whole shares can be bought
+    shares = np.where(np.isnan(stock_price), 0, (amount - fees) // stock_price).astype(np.int64)
+    portfolio += np.where(mask, shares, 0)
+    total -= np.where(mask, np.abs(stock_price * shares + fees), 0).sum(axis=1)
+
+def _settle_sells(stock_price, mask, fees, portfolio, total):
+    # Sells all the shares of the stocks in mask (one row per baseline), like process.sell().
+    # The sell of a failed company (NaN price) counts as 0, its shares are worth nothing
+    earned = np.abs(stock_price * portfolio - fees)
+    total += np.where(mask & ~np.isnan(stock_price), earned, 0).sum(axis=1)
+    portfolio[mask] = 0
+
+def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', cache=None, *, sma_weights=[], fma_weights=[]):
     '''
         Finds the crossing points between the SMA with period sma_period,
         and the FMA with period fma_period to make buying or selling decisions.
@@ -57,12 +127,20 @@ def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[] ,a
             stock_prices (ndarray): the stock price data
             sma_period (int, default 200): the SMA period (days)
             fma_period (int, default 50): the FMA period (days)
-            weights (list, default []): must be of length n if specified. Indicates the weights
-                to use for the weighted average. If empty, return a non-weighted average.
+            weights (list, default []): deprecated, use sma_weights and fma_weights instead.
+                If specified, used as the weights of both the SMA and the FMA
+                (unless sma_weights or fma_weights is given).
             amount (float, default 5000): how much we spend on each purchase
                 (must cover fees)
             fees (float, default 20): transaction fees
             ledger (str): path to the ledger file
+            cache (IndicatorCache, default None): computes the indicators through this cache
+                (see indicators.IndicatorCache), so that another run on the same prices reuses them.
+                By default nothing is cached.
+            sma_weights (list, default []): must be of length sma_period if specified. Indicates the weights
+                to use for the weighted SMA. If empty, the SMA is not weighted.
+            fma_weights (list, default []): must be of length fma_period if specified. Indicates the weights
+                to use for the weighted FMA. If empty, the FMA is not weighted.
 
         Output: None
     '''
@@ -71,49 +149,54 @@ def crossing_averages(stock_prices, sma_period=200, fma_period=50, weights=[] ,a
     shape_of_1 = 1
     if stock_prices.ndim == 2:
         shape_of_1 = stock_prices.shape[1]
-    #create portfolio
-    portfolio = proc.create_portfolio([amount] * shape_of_1, stock_prices, fees, ledger)
-    diff = fma_period - sma_period
-    #for every stock price in the portfolio
-    for j in range(shape_of_1):
-        #calc sma & fma
-        # if shape_of_1 = 1 that means that we need to call sma and fma_full in a way that stock_prices is a 1d array
-        sma = []
-        fma_full = []
+    sma_weights, fma_weights = backtest.crossing_weights(weights, sma_weights, fma_weights)
+    with profiling.stage('strategy.crossing_averages.signals'):
+        # the indicators module, or the same functions through a cache
+        indicators = stock_indicators if cache is None else cache
+        # calc sma & fma for every stock at once (a matrix, or a single column if we only have one stock)
+        sma_all = indicators.moving_average(stock_prices, sma_period, sma_weights)
+        fma_all = indicators.moving_average(stock_prices, fma_period, fma_weights)
+        # moving_average() has printed a message if the number of weights is wrong
+        if sma_all is None or fma_all is None:
+            return
         if shape_of_1 == 1:
-            sma = stock_indicators.moving_average(stock_prices[:], sma_period, weights)
-            fma_full = stock_indicators.moving_average(stock_prices[:], fma_period, weights)
-        else:
-            sma = stock_indicators.moving_average(stock_prices[:,j], sma_period, weights)
-            fma_full = stock_indicators.moving_average(stock_prices[:,j], fma_period, weights)
-        # shrink the fma to have the same length as the sma
-        fma = fma_full[:len(sma)]
-        # uncomment to plot the sma and the fma to understand the moving averages
-        #plt.plot(sma)
-        #plt.plot(fma)
-        #plt.show()
-        # set a previous indicator param boolean = true. We use a boolean value
-        # so that we won't buy the same stock again in the next day
-        crossing_indicator = True
-        for i in range(len(fma)): # loop until the fma data comes to an end
-            # check if fma[i] > sma[i] (fma crosses from below) and indicator = False
-            if (fma[i] > sma[i]) and crossing_indicator == False:
-                # buy stocks & set the indicator to true so the next time it will sell if it crosses from above
-                proc.buy(i, j, amount, stock_prices, fees, portfolio, ledger)
-                crossing_indicator = True
-            # check if fma[i] < sma[i] (fma crosses from above) and indicator = True
-            elif (fma[i] < sma[i]) and crossing_indicator == True:
-                #sell & set to false
-                proc.sell(i, j, stock_prices, fees, portfolio, ledger)
-                crossing_indicator = False
-    # sell everything at the end
-    for j in range(shape_of_1):
-        if portfolio[j] != 0:
-            # sell at the last recorded stock date.
-            # -1 because arrays starts from zero.
-            proc.sell(stock_prices.shape[0]-1, j, stock_prices, fees, portfolio, ledger)
+            # give a single stock the same (days, 1) shape as a matrix, so the loop is the same
+            sma_all = sma_all.reshape(len(sma_all), 1)
+            fma_all = fma_all.reshape(len(fma_all), 1)
+    with profiling.stage('strategy.crossing_averages.execution'):
+        #create portfolio
+        portfolio = proc.create_portfolio([amount] * shape_of_1, stock_prices, fees, ledger)
+        #for every stock price in the portfolio
+        for j in range(shape_of_1):
+            sma = sma_all[:, j]
+            # shrink the fma to have the same length as the sma
+            fma = fma_all[:len(sma), j]
+            # uncomment (and import matplotlib.pyplot as plt) to plot the sma and the fma to understand the moving averages
+            #plt.plot(sma)
+            #plt.plot(fma)
+            #plt.show()
+            # set a previous indicator param boolean = true. We use a boolean value
+            # so that we won't buy the same stock again in the next day
+            crossing_indicator = True
+            for i in range(len(fma)): # loop until the fma data comes to an end
+                # check if fma[i] > sma[i] (fma crosses from below) and indicator = False
+                if (fma[i] > sma[i]) and crossing_indicator == False:
+                    # buy stocks & set the indicator to true so the next time it will sell if it crosses from above
+                    proc.buy(i, j, amount, stock_prices, fees, portfolio, ledger)
+                    crossing_indicator = True
+                # check if fma[i] < sma[i] (fma crosses from above) and indicator = True
+                elif (fma[i] < sma[i]) and crossing_indicator == True:
+                    #sell & set to false
+                    proc.sell(i, j, stock_prices, fees, portfolio, ledger)
+                    crossing_indicator = False
+        # sell everything at the end
+        for j in range(shape_of_1):
+            if portfolio[j] != 0:
+                # sell at the last recorded stock date.
+                # -1 because arrays starts from zero.
+                proc.sell(stock_prices.shape[0]-1, j, stock_prices, fees, portfolio, ledger)
 
-def momentum(stock_prices, osc_type='stochastic', period = 7,low_threshold=0.25, high_threshold=0.75, cool_down_period=14, amount=5000, fees=20, ledger='ledger_momentum.txt'):
+def momentum(stock_prices, osc_type='stochastic', period = 7,low_threshold=0.25, high_threshold=0.75, cool_down_period=14, amount=5000, fees=20, ledger='ledger_momentum.txt', cache=None):
     '''
         Makes buying or selling decisions using an oscilator (stochastic or RSI)
         with period n depending on a low and a high threshold. Uses a cool down period
@@ -131,6 +214,9 @@ def momentum(stock_prices, osc_type='stochastic', period = 7,low_threshold=0.25,
                 (must cover fees)
             fees (float, default 20): transaction fees
             ledger (str): path to the ledger file
+            cache (IndicatorCache, default None): computes the indicators through this cache
+                (see indicators.IndicatorCache), so that another run on the same prices reuses them.
+                By default nothing is cached.
 
         Output: None
     '''
@@ -139,33 +225,34 @@ def momentum(stock_prices, osc_type='stochastic', period = 7,low_threshold=0.25,
     shape_of_1 = 1
     if stock_prices.ndim == 2:
         shape_of_1 = stock_prices.shape[1]
-    portfolio = proc.create_portfolio([amount] * shape_of_1, stock_prices, fees, ledger)
-    for j in range(shape_of_1): #for every company
-        # calculate the oscilator
-        # if shape_of_1 = 1 that means that we need to call sma and fma_full in a way that stock_prices is a 1d array
-        oscilator = []
-        if shape_of_1 == 1:
-            oscilator = stock_indicators.oscillator(stock_prices[:], n=period, osc_type=osc_type)
-        else:
-            oscilator = stock_indicators.oscillator(stock_prices[:,j], n=period, osc_type=osc_type)
-        # the index to revisit and buy or sell, after the cool down period has passed
-        revisit_buy = 0
-        revisit_sell = 0
-        # -period because the oscilator length is the total days - period
-        loop_times = stock_prices.shape[0]-period
-        for i in range(loop_times):
-            if low_threshold >= oscilator[i] and i > revisit_buy:
-                # buy the stock for the current date + period (because we deducted in in the loop times
-                proc.buy(i + period, j, amount, stock_prices, fees, portfolio, ledger)
-                # set the index of when to buy again, after the cool down period
-                revisit_buy = i + cool_down_period
-            if high_threshold <= oscilator[i] and i > revisit_sell:
-                # sell & revisit
-                proc.sell(i+ period, j, stock_prices, fees, portfolio, ledger)
-                revisit_sell = i + cool_down_period
-    # sell everything at the end
-    for j in range(shape_of_1):
-        if portfolio[j] != 0:
-            # sell at the last recorded stock date.
-            # -1 because arrays starts from zero.
-            proc.sell(stock_prices.shape[0]-1, j, stock_prices, fees, portfolio, ledger)
\ No newline at end of file
+    with profiling.stage('strategy.momentum.signals'):
+        indicators = stock_indicators if cache is None else cache
+        # calculate the oscilator for every stock at once (a matrix, or a single column if we only have one stock)
+        oscilator_all = indicators.oscillator(stock_prices, n=period, osc_type=osc_type)
+        oscilator_all = oscilator_all.reshape(len(oscilator_all), -1)
+        # Find the days where each stock crosses a threshold for every stock at once,
+        # and keep the ones which are not in a cool down period
+        # (the oscilator length is the total days - period, so day i of the oscilator is date i + period)
+        buy_days = stock_indicators.cool_down(low_threshold >= oscilator_all, cool_down_period)
+        sell_days = stock_indicators.cool_down(high_threshold <= oscilator_all, cool_down_period)
+    with profiling.stage('strategy.momentum.execution'):
+        portfolio = proc.create_portfolio([amount] * shape_of_1, stock_prices, fees, ledger)
+        for j in range(shape_of_1): #for every company
+            # Only the days with a trade are visited, in date order with the buy before the sell on the same day
+            buys = np.flatnonzero(buy_days[:, j])
+            sells = np.flatnonzero(sell_days[:, j])
+            dates = np.concatenate((buys, sells))
+            is_sell = np.concatenate((np.zeros(len(buys), dtype=bool), np.ones(len(sells), dtype=bool)))
+            order = np.lexsort((is_sell, dates))
+            for i, sell in zip(dates[order].tolist(), is_sell[order].tolist()):
+                if sell:
+                    proc.sell(i + period, j, stock_prices, fees, portfolio, ledger)
+                else:
+                    # buy the stock for the current date + period (because the oscilator starts at day period)
+                    proc.buy(i + period, j, amount, stock_prices, fees, portfolio, ledger)
+        # sell everything at the end
+        for j in range(shape_of_1):
+            if portfolio[j] != 0:
+                # sell at the last recorded stock date.
+                # -1 because arrays starts from zero.
+                proc.sell(stock_prices.shape[0]-1, j, stock_prices, fees, portfolio, ledger)
\ No newline at end of file
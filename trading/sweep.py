@@ -0,0 +1,380 @@
+# Functions to evaluate a strategy over a grid of parameters, without writing any ledger.
+import itertools
+import multiprocessing
+import numpy as np
+import trading.backtest as backtest
+import trading.indicators as stock_indicators
+import trading.shared as shared_arrays
+
+# Data shared with the worker processes, set once per worker by _init_worker()
+_shared = {}
+
+def _init_worker(shared):
+    _shared.update({key: shared_arrays.as_array(value) for key, value in shared.items()})
+
+def _run_chunks(function, chunks, shared, processes):
+    '''
+    Runs function on every chunk of parameters, in a pool of processes (or here if processes is 1),
+    and returns the results of all the chunks one after the other.
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1:
+        _init_worker(shared)
+        return np.concatenate([function(chunk) for chunk in chunks])
+    # the shared data is sent once to each worker, not with every chunk,
+    # and the arrays are published in shared memory, so the workers attach to them without a copy
+    published = {key: shared_arrays.SharedArray(value) if isinstance(value, np.ndarray) else value
+                 for key, value in shared.items()}
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(published,)) as pool:
+            return np.concatenate(pool.map(function, chunks))
+    finally:
+        for value in published.values():
+            if isinstance(value, shared_arrays.SharedArray):
+                value.close()
+
+def _split(parameters, processes, max_chunk_size=None):
+    '''
+    Splits the list of parameters in chunks, a few per process to balance the load,
+    and at most max_chunk_size parameters per chunk to bound the memory.
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    n_chunks = 4 * processes
+    if max_chunk_size is not None:
+        n_chunks = max(n_chunks, -(-len(parameters) // max_chunk_size))
+    n_chunks = min(len(parameters), n_chunks)
+    return [chunk for chunk in np.array_split(np.arange(len(parameters)), n_chunks) if len(chunk)]
+
+def _crossing_chunk(pair_indices):
+    '''
+    P&L of crossing_averages() for a chunk of (sma_period, fma_period) pairs,
+    evaluated together as one (pairs, days, stocks) tensor.
+    '''
+    stock_prices = _shared['stock_prices']
+    pairs = [_shared['pairs'][k] for k in pair_indices]
+    # the same length for every chunk (the longest pair of the whole grid), so the sums are done
+    # in the same order whatever the number of processes
+    length = len(stock_prices) - min(max(sma_period, fma_period) for sma_period, fma_period in _shared['pairs']) + 1
+    return _crossing_pnl(stock_prices, _shared['cumsum'], _shared['shares'], pairs, length, _shared['amount'], _shared['fees'])
+
+def _crossing_pnl(stock_prices, cumsum, shares, pairs, length, amount, fees):
+    '''
+    P&L of crossing_averages() for every pair, over the days of stock_prices.
+    cumsum and shares may be rows of the tables of a longer series (only differences of cumsum are used),
+    so the runs over a window of days reuse the tables of the whole series.
+    '''
+    days, n_stocks = stock_prices.shape
+    # a window shorter than the averages has no crossing, only the initial portfolio and the final sell
+    length = max(length, 1)
+    # +1 where the fma is above the sma, -1 where it is below, 0 otherwise (or after the end of the averages)
+    signs = np.zeros((len(pairs), length, n_stocks), dtype=np.int8)
+    for k, (sma_period, fma_period) in enumerate(pairs):
+        pair_length = max(days - max(sma_period, fma_period) + 1, 0)
+        # every window length from the same cumulative sum table, like moving_average() does
+        sma = (cumsum[sma_period:sma_period + pair_length] - cumsum[:pair_length]) / sma_period
+        fma = (cumsum[fma_period:fma_period + pair_length] - cumsum[:pair_length]) / fma_period
+        signs[k, :pair_length] = (fma > sma).astype(np.int8) - (fma < sma)
+    # The crossing indicator is the last non-zero sign, starting with +1 (we hold the initial portfolio)
+    # int32 days are enough and halve the memory traffic on the big tensors
+    day_index = np.arange(length, dtype=np.int32)[None, :, None]
+    last_sign_day = np.maximum.accumulate(np.where(signs != 0, day_index, np.int32(-1)), axis=1)
+    state = np.where(last_sign_day >= 0, np.take_along_axis(signs, np.maximum(last_sign_day, 0), axis=1), 1)
+    previous_state = np.concatenate((np.ones((len(pairs), 1, n_stocks), dtype=state.dtype), state[:, :-1]), axis=1)
+    buys = (signs == 1) & (previous_state == -1)
+    sells = (signs == -1) & (previous_state == 1)
+    # The buys and sells alternate, so a sell sells the shares of the last buy (day 0 is the initial portfolio)
+    last_buy_day = np.maximum.accumulate(np.where(buys, day_index, np.int32(0)), axis=1)
+    stock_index = np.arange(n_stocks)
+    held = shares[last_buy_day, stock_index]
+    prices = stock_prices[:length][None]
+    buy_amounts = np.where(buys, -np.abs(prices * shares[:length] + fees), 0)
+    sell_amounts = np.where(sells, np.abs(prices * held - fees), 0)
+    # Sell everything we still hold on the last day
+    final_held = np.where(state[:, -1] == 1, held[:, -1], 0)
+    final_amounts = np.where(final_held != 0, np.abs(stock_prices[-1] * final_held - fees), 0)
+    initial_amounts = -np.abs(stock_prices[0] * shares[0] + fees)
+    # The sell of a failed company (NaN price) counts as 0, its shares are worth nothing
+    return (np.nansum(initial_amounts) + np.nansum(buy_amounts, axis=(1, 2))
+            + np.nansum(sell_amounts, axis=(1, 2)) + np.nansum(final_amounts, axis=1))
+
+def sweep_crossing_averages(stock_prices, sma_periods, fma_periods, amount=5000, fees=20, processes=None):
+    '''
+    P&L of crossing_averages() for every pair of sma_period and fma_period, without writing any ledger.
+    The cumulative sum of the prices is computed once and every moving average comes from it,
+    and the crossing signals of a chunk of pairs are evaluated together as a 3-D boolean tensor.
+    The chunks are spread over a pool of processes.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        sma_periods (list): the SMA periods (days) to try
+        fma_periods (list): the FMA periods (days) to try
+        amount (float, default 5000): how much we spend on each purchase (must cover fees)
+        fees (float, default 20): transaction fees
+        processes (int, default None): number of worker processes (default: number of cores)
+
+    Output:
+        pnl (ndarray): array of shape (len(sma_periods), len(fma_periods)) with the total P&L
+            (all stocks, fees included) for each pair
+
+    Example:
+        >>> pnl = sweep_crossing_averages(stock_prices, range(100, 250, 10), range(20, 80, 5))
+        >>> np.unravel_index(np.argmax(pnl), pnl.shape)
+    '''
+    stock_prices = np.asarray(stock_prices, dtype=float)
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    pairs = list(itertools.product(sma_periods, fma_periods))
+    shared = {
+        'stock_prices': stock_prices,
+        # cumulative sum table with a leading row of zeros, the sum of a window is a difference of two rows
+        'cumsum': np.concatenate((np.zeros((1, stock_prices.shape[1])), np.cumsum(stock_prices, axis=0))),
+        # the shares a buy on each day would get, the same for every pair
+        'shares': (amount - fees) // stock_prices,
+        'amount': amount,
+        'fees': fees,
+        'pairs': pairs,
+    }
+    with np.errstate(invalid='ignore'):
+        # a chunk of pairs is a (pairs, days, stocks) tensor, a few pairs at a time keep it small
+        pnl = _run_chunks(_crossing_chunk, _split(pairs, processes, max_chunk_size=8), shared, processes)
+    return pnl.reshape(len(sma_periods), len(fma_periods))
+
+def _momentum_chunk(combination_indices):
+    '''
+    P&L of momentum() for a chunk of parameter combinations.
+    The oscillator is computed once per period and reused for all the combinations with that period.
+    '''
+    stock_prices = _shared['stock_prices']
+    oscillators = {}
+    pnl = np.zeros(len(combination_indices))
+    for k, combination in enumerate(combination_indices):
+        period = _shared['combinations'][combination][0]
+        if period not in oscillators:
+            oscillators[period] = stock_indicators.oscillator(stock_prices, n=period, osc_type=_shared['osc_type'])
+        pnl[k] = _momentum_pnl(stock_prices, oscillators[period], _shared['combinations'][combination],
+                               _shared['amount'], _shared['fees'])
+    return pnl
+
+def _momentum_pnl(stock_prices, oscilator, combination, amount, fees):
+    '''
+    P&L of momentum() for one combination of parameters, given its oscillator over the days of stock_prices.
+    '''
+    period, low_threshold, high_threshold, cool_down_period = combination
+    run = backtest.Backtest(stock_prices, amount, fees)
+    run.buy(0, np.ones(run.n_stocks, dtype=bool), section=0)
+    backtest.trade_momentum(run, oscilator, period, low_threshold, high_threshold, cool_down_period)
+    run.sell_everything()
+    return run.pnl()
+
+def sweep_momentum(stock_prices, periods, low_thresholds, high_thresholds, cool_down_periods, osc_type='stochastic', amount=5000, fees=20, processes=None):
+    '''
+    P&L of momentum() for every combination of period, thresholds and cool down period,
+    without writing any ledger. The oscillator is computed once per period (for all the stocks at once),
+    and the combinations are spread over a pool of processes.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        periods (list): the oscillator periods (days) to try
+        low_thresholds (list): the low thresholds to try
+        high_thresholds (list): the high thresholds to try
+        cool_down_periods (list): the cool down periods (days) to try
+        osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
+        amount (float, default 5000): how much we spend on each purchase (must cover fees)
+        fees (float, default 20): transaction fees
+        processes (int, default None): number of worker processes (default: number of cores)
+
+    Output:
+        pnl (ndarray): array of shape (len(periods), len(low_thresholds), len(high_thresholds),
+            len(cool_down_periods)) with the total P&L (all stocks, fees included) for each combination
+    '''
+    stock_prices = np.asarray(stock_prices, dtype=float)
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    # ordered by period, so a chunk mostly shares the same oscillator
+    combinations = list(itertools.product(periods, low_thresholds, high_thresholds, cool_down_periods))
+    shared = {
+        'stock_prices': stock_prices,
+        'osc_type': osc_type,
+        'amount': amount,
+        'fees': fees,
+        'combinations': combinations,
+    }
+    with np.errstate(invalid='ignore'):
+        pnl = _run_chunks(_momentum_chunk, _split(combinations, processes), shared, processes)
+    return pnl.reshape(len(periods), len(low_thresholds), len(high_thresholds), len(cool_down_periods))
+
+# The parameters of each strategy in the order the fold functions take them, with their default values
+WALK_FORWARD_PARAMETERS = {
+    'crossing_averages': (('sma_period', 200), ('fma_period', 50)),
+    'momentum': (('period', 7), ('low_threshold', 0.25), ('high_threshold', 0.75), ('cool_down_period', 14)),
+}
+
+def _crossing_folds(fold_indices):
+    '''
+    For a chunk of folds: the index of the best pair on the training window,
+    its P&L there and its P&L on the test window.
+    '''
+    pairs = _shared['combinations']
+    shortest = min(max(pair) for pair in pairs)
+    results = np.zeros((len(fold_indices), 3))
+    for k, fold in enumerate(fold_indices):
+        train_start, test_start, test_end = _shared['folds'][fold]
+        train_pnl = _crossing_window(train_start, test_start, pairs, shortest)
+        best = int(np.argmax(train_pnl))
+        test_pnl = _crossing_window(test_start, test_end, [pairs[best]], shortest)
+        results[k] = [best, train_pnl[best], test_pnl[0]]
+    return results
+
+def _crossing_window(start, end, pairs, shortest):
+    # P&L of every pair over the days start to end, from the rows of the tables of the whole series,
+    # a few pairs at a time to keep the (pairs, days, stocks) tensors small
+    return np.concatenate([_crossing_pnl(_shared['stock_prices'][start:end], _shared['cumsum'][start:end + 1],
+                                         _shared['shares'][start:end], pairs[first:first + 8], end - start - shortest + 1,
+                                         _shared['amount'], _shared['fees'])
+                           for first in range(0, len(pairs), 8)])
+
+def _momentum_folds(fold_indices):
+    '''
+    For a chunk of folds: the index of the best combination on the training window,
+    its P&L there and its P&L on the test window.
+    '''
+    combinations = _shared['combinations']
+    results = np.zeros((len(fold_indices), 3))
+    for k, fold in enumerate(fold_indices):
+        train_start, test_start, test_end = _shared['folds'][fold]
+        train_pnl = [_momentum_window(train_start, test_start, combination) for combination in combinations]
+        best = int(np.argmax(train_pnl))
+        results[k] = [best, train_pnl[best], _momentum_window(test_start, test_end, combinations[best])]
+    return results
+
+def _momentum_window(start, end, combination):
+    '''
+    P&L of momentum() over the days start to end, with the same trades as _momentum_pnl()
+    but settled for all the days at once: the shares sold on a day are the shares bought
+    since the previous sell of the stock (or since the initial portfolio).
+    '''
+    period, low_threshold, high_threshold, cool_down_period = combination
+    stock_prices = _shared['stock_prices'][start:end]
+    oscilator = _fold_oscillator(period, start, end)
+    days, n_stocks = stock_prices.shape
+    # the buys and sells on every day (the oscilator starts at day period), and the initial portfolio on day 0
+    bought = np.zeros((days, n_stocks), dtype=bool)
+    sold = np.zeros((days, n_stocks), dtype=bool)
+    bought[0] = True
+    bought[period:period + len(oscilator)] = stock_indicators.cool_down(low_threshold >= oscilator, cool_down_period)
+    sold[period:period + len(oscilator)] = stock_indicators.cool_down(high_threshold <= oscilator, cool_down_period)
+    # If the price is NaN the company has failed, so there is nothing to buy
+    bought &= ~np.isnan(stock_prices)
+    shares = np.where(bought, _shared['shares'][start:end], 0).astype(np.int64)
+    total = -np.sum(np.where(bought, np.abs(stock_prices * shares + _shared['fees']), 0))
+    # shares bought up to each day (a buy comes before a sell on the same day),
+    # minus the shares bought up to the previous sell
+    bought_so_far = np.cumsum(shares, axis=0)
+    day_index = np.arange(days)[:, None]
+    last_sell = np.maximum.accumulate(np.where(sold, day_index, -1), axis=0)
+    previous_sell = np.vstack((np.full((1, n_stocks), -1), last_sell[:-1]))
+    stock_index = np.arange(n_stocks)
+    held = bought_so_far - np.where(previous_sell >= 0, bought_so_far[np.maximum(previous_sell, 0), stock_index], 0)
+    # The sell of a failed company (NaN price) counts as 0, its shares are worth nothing
+    total += np.nansum(np.where(sold, np.abs(stock_prices * held - _shared['fees']), 0))
+    # Sell everything we still hold on the last day
+    final_held = bought_so_far[-1] - np.where(last_sell[-1] >= 0, bought_so_far[np.maximum(last_sell[-1], 0), stock_index], 0)
+    total += np.nansum(np.where(final_held != 0, np.abs(stock_prices[-1] * final_held - _shared['fees']), 0))
+    return float(total)
+
+def _fold_oscillator(period, start, end):
+    # The oscillator of the days start to end, as oscillator() would give it for these days only:
+    # its row i covers the window of days i to i+period-1, so it is a slice of the oscillator of the whole series
+    oscilator = _shared['oscillators'][_shared['periods'].index(period)]
+    return oscilator[start:max(end - period, start)]
+
+def walk_forward(stock_prices, strategy_name, window, step, grid, test_length=None, osc_type='stochastic', amount=5000, fees=20, processes=None):
+    '''
+    Walk-forward optimization of crossing_averages() or momentum(), without writing any ledger.
+    The series is cut in folds: every step days, the parameters of the grid with the best P&L
+    over the last window days (the training window) are chosen, and traded over the next test_length days
+    (the test window). Each window is run like the strategy on the prices of those days only:
+    buying every stock on its first day and selling everything on its last day.
+    The indicators are computed once over the whole series and every fold uses its rows,
+    so the history shared by overlapping windows is never computed again,
+    and the folds are spread over a pool of processes.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        strategy_name (str): either 'crossing_averages' or 'momentum'
+        window (int): length of the training windows (days)
+        step (int): number of days between the start of two folds
+        grid (dict): the values to try for each parameter of the strategy
+            ('sma_period', 'fma_period' for crossing_averages(); 'period', 'low_threshold',
+            'high_threshold', 'cool_down_period' for momentum()).
+            A parameter not in grid keeps the default value of the strategy.
+        test_length (int, default None): length of the test windows (default: step,
+            so that the test windows follow each other)
+        osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator (momentum only).
+        amount (float, default 5000): how much we spend on each purchase (must cover fees)
+        fees (float, default 20): transaction fees
+        processes (int, default None): number of worker processes (default: number of cores)
+
+    Output:
+        folds (list): one dict per fold, with the training and the test windows ('train' and 'test',
+            as (first day, day after the last)), the chosen 'parameters' (dict), and their P&L
+            on the training window ('train_pnl') and on the test window ('test_pnl', out of sample)
+
+    Example:
+        Re-optimize momentum every 3 months, on the last 2 years:
+            >>> folds = walk_forward(stock_prices, 'momentum', 730, 91, {'period': [7, 14, 21], 'low_threshold': [0.1, 0.25]})
+            >>> sum(fold['test_pnl'] for fold in folds)
+    '''
+    if strategy_name not in WALK_FORWARD_PARAMETERS:
+        print("Please choose either 'crossing_averages' or 'momentum'.")
+        return
+    names = [name for name, default in WALK_FORWARD_PARAMETERS[strategy_name]]
+    unknown = [name for name in grid if name not in names]
+    if unknown:
+        print(f"Unknown parameters for {strategy_name}: {unknown}, please choose among {names}.")
+        return
+    stock_prices = np.asarray(stock_prices, dtype=float)
+    stock_prices = stock_prices.reshape(len(stock_prices), -1)
+    if test_length is None:
+        test_length = step
+    # (first day of the training window, first day of the test window, day after the test window)
+    folds = [(start, start + window, start + window + test_length)
+             for start in range(0, len(stock_prices) - window - test_length + 1, step)]
+    if not folds:
+        print("The training and test windows are longer than the price data.")
+        return
+    combinations = list(itertools.product(*[grid.get(name, [default])
+                                            for name, default in WALK_FORWARD_PARAMETERS[strategy_name]]))
+    shared = {
+        'stock_prices': stock_prices,
+        'amount': amount,
+        'fees': fees,
+        'combinations': combinations,
+        'folds': folds,
+    }
+    if strategy_name == 'crossing_averages':
+        function = _crossing_folds
+        # cumulative sum table and shares of a buy on each day, for the whole series
+        shared['cumsum'] = np.concatenate((np.zeros((1, stock_prices.shape[1])), np.cumsum(stock_prices, axis=0)))
+        shared['shares'] = (amount - fees) // stock_prices
+    else:
+        function = _momentum_folds
+        shared['shares'] = (amount - fees) // stock_prices
+        # one oscillator per period over the whole series, in a single array (padded with NaN,
+        # which never crosses a threshold) so that it is published once in shared memory
+        periods = sorted(set(combination[0] for combination in combinations))
+        oscillators = np.full((len(periods),) + stock_prices.shape, np.nan)
+        for p, period in enumerate(periods):
+            oscilator = stock_indicators.oscillator(stock_prices, n=period, osc_type=osc_type)
+            oscillators[p, :len(oscilator)] = oscilator
+        shared['periods'] = periods
+        shared['oscillators'] = oscillators
+    with np.errstate(invalid='ignore'):
+        # the folds only read the shared tables, so they are independent
+        results = _run_chunks(function, _split(folds, processes), shared, processes)
+    return [{'train': (train_start, test_start),
+             'test': (test_start, test_end),
+             'parameters': dict(zip(names, combinations[int(best)])),
+             'train_pnl': float(train_pnl),
+             'test_pnl': float(test_pnl)}
+            for (train_start, test_start, test_end), (best, train_pnl, test_pnl) in zip(folds, results)]